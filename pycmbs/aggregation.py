@@ -0,0 +1,503 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file is part of pyCMBS.
+(c) 2012- Alexander Loew
+For COPYING and LICENSE details, please refer to the LICENSE file
+"""
+
+"""
+This module provides engines to aggregate data in time
+(e.g. yearly, seasonal or monthly statistics), over regions
+and over ensemble members
+"""
+
+import numpy as np
+
+# season index for each month (DJF, MAM, JJA, SON)
+SEASONS = ['DJF', 'MAM', 'JJA', 'SON']
+_month2season = np.asarray([0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0])
+
+
+def get_time_keys(dates, by='year'):
+    """
+    get the group key for each timestep
+
+    Parameters
+    ----------
+    dates : list
+        list of datetime objects
+    by : str
+        type of grouping ['year','month','season','yearmonth']
+        'year' : calendar year
+        'month' : month of the year (1...12), irrespective of the year
+        'season' : season of the year (0=DJF, 1=MAM, 2=JJA, 3=SON),
+                   irrespective of the year
+        'yearmonth' : year*100 + month
+
+    Returns
+    -------
+    keys : ndarray of int
+    """
+    if by == 'year':
+        return np.asarray([d.year for d in dates]).astype('int')
+    elif by == 'month':
+        return np.asarray([d.month for d in dates]).astype('int')
+    elif by == 'season':
+        m = np.asarray([d.month for d in dates]).astype('int')
+        return _month2season[m - 1]
+    elif by == 'yearmonth':
+        return np.asarray([d.year * 100 + d.month for d in dates]).astype('int')
+    else:
+        raise ValueError('Invalid grouping: %s' % by)
+
+
+class TemporalAggregator(object):
+
+    """
+    Aggregation of data [time,...] into groups of timesteps
+
+    All timesteps are sorted once by their group key and the
+    sums, sums of squares and number of valid values of all groups
+    are then obtained with a single np.add.reduceat() pass over the data.
+    Data can be provided at once or in temporal chunks (e.g. for
+    lazy Data objects).
+
+    Masked values and NaN are not taken into account.
+
+    Example
+    -------
+    >>> A = TemporalAggregator(keys, shape=(ny, nx))
+    >>> A.add(x)
+    >>> m = A.mean()
+    """
+
+    def __init__(self, keys, shape=(), mask=None, sumsq=False):
+        """
+        Parameters
+        ----------
+        keys : ndarray
+            group key for each timestep [time]
+        shape : tuple
+            shape of a single timestep (e.g. (ny,nx))
+        mask : ndarray (bool)
+            temporal mask [time]; only timesteps with mask=True
+            are taken into account
+        sumsq : bool
+            calculate also sum of squares (needed for std())
+        """
+        keys = np.asarray(keys)
+        if keys.ndim != 1:
+            raise ValueError('Keys need to be 1-D of length of time!')
+        if mask is None:
+            mask = np.ones(len(keys)).astype('bool')
+        else:
+            mask = np.asarray(mask).astype('bool')
+            if mask.shape != keys.shape:
+                raise ValueError('Mask needs to be 1-D of length of time!')
+
+        self.keys, self._idx = np.unique(keys, return_inverse=True)
+        self._idx = self._idx.reshape(-1)
+        self._mask = mask
+        self.nt = len(keys)
+        self.shape = tuple(shape)
+
+        n = len(self.keys)
+        self._sum = np.zeros((n,) + self.shape)
+        self._cnt = np.zeros((n,) + self.shape).astype('int')
+        if sumsq:
+            self._sumsq = np.zeros((n,) + self.shape)
+        else:
+            self._sumsq = None
+
+    def add(self, x, i1=0):
+        """
+        add data of timesteps [i1:i1+len(x)]
+
+        Parameters
+        ----------
+        x : ndarray or masked array
+            data [time,...]
+        i1 : int
+            index of the first timestep of x
+        """
+        i2 = i1 + len(x)
+        if i2 > self.nt:
+            raise ValueError('Data exceeds time dimension!')
+        if x.shape[1:] != self.shape:
+            raise ValueError('Inconsistent geometry!')
+
+        # sort timesteps by group; the sort is stable, thus a time
+        # ordered chunk of data does not need to be reordered
+        sel = np.nonzero(self._mask[i1:i2])[0]
+        if len(sel) == 0:
+            return
+        g = self._idx[i1:i2][sel]
+        order = np.argsort(g, kind='mergesort')
+        sel = sel[order]
+        g = g[order]
+
+        if (len(sel) == len(x)) and np.all(np.diff(sel) == 1):
+            vals = x
+        else:
+            vals = x[sel]
+        valid = ~np.ma.getmaskarray(vals)
+        vals = np.asarray(np.ma.filled(vals, 0.), dtype='float')
+        hlp = np.isnan(vals)
+        if hlp.any():
+            valid &= ~hlp
+            vals = np.where(hlp, 0., vals)
+        del hlp
+
+        starts = np.nonzero(np.concatenate(([True], g[1:] != g[:-1])))[0]
+        groups = g[starts]
+
+        self._sum[groups] += np.add.reduceat(vals, starts, axis=0)
+        self._cnt[groups] += np.add.reduceat(valid.astype('int'), starts, axis=0)
+        if self._sumsq is not None:
+            self._sumsq[groups] += np.add.reduceat(vals * vals, starts, axis=0)
+
+    def count(self):
+        """ number of valid values in each group """
+        return self._cnt.copy()
+
+    def sum(self):
+        """
+        sum of valid values in each group; groups without valid
+        values are masked
+        """
+        return np.ma.array(self._sum.copy(), mask=self._cnt == 0)
+
+    def mean(self, nmin=1):
+        """
+        mean of each group
+
+        Parameters
+        ----------
+        nmin : int
+            minimum number of valid values; else the result is masked
+        """
+        c = np.maximum(self._cnt, 1)
+        return np.ma.array(self._sum / c, mask=(self._cnt < max(nmin, 1)))
+
+    def std(self, ddof=0, nmin=1):
+        """
+        standard deviation of each group
+
+        Parameters
+        ----------
+        ddof : int
+            delta degrees of freedom
+        nmin : int
+            minimum number of valid values; else the result is masked
+        """
+        if self._sumsq is None:
+            raise ValueError('Sum of squares not calculated (sumsq=False)')
+        c = np.maximum(self._cnt, 1)
+        m = self._sum / c
+        v = self._sumsq / c - m * m
+        v = np.maximum(v, 0.) * c / np.maximum(c - ddof, 1)
+        return np.ma.array(np.sqrt(v), mask=(self._cnt < max(nmin, 1)) | (self._cnt <= ddof))
+
+
+class RegionAggregator(object):
+
+    """
+    Aggregation of spatial fields [...,ny,nx] over regions which are
+    given by a field of region IDs
+
+    All grid cells are sorted once by their region ID. The statistics
+    of all regions are then obtained with a single np.add.reduceat()
+    (or np.minimum/np.maximum.reduceat()) pass over the sorted cells,
+    instead of masking the data separately for each region.
+
+    Masked values and NaN are not taken into account.
+
+    Example
+    -------
+    >>> A = RegionAggregator(region.data)
+    >>> s = A.statistics(x.data)
+    >>> s['mean']  # [time,nregions]
+    """
+
+    def __init__(self, labels, ids=None):
+        """
+        Parameters
+        ----------
+        labels : ndarray
+            region ID of each grid cell [ny,nx]; masked cells do not
+            belong to any region
+        ids : ndarray
+            IDs of the regions to analyze; cells with other IDs
+            are ignored. If None, all IDs in labels are used
+        """
+        valid = ~np.ma.getmaskarray(labels).reshape(-1)
+        lab = np.asarray(np.ma.getdata(labels)).reshape(-1)
+        if ids is None:
+            ids = lab[valid]
+        self.ids = np.unique(np.asarray(ids))
+        self.shape = np.shape(labels)
+
+        if len(self.ids) > 0:
+            pos = np.minimum(np.searchsorted(self.ids, lab), len(self.ids) - 1)
+            cells = np.nonzero(valid & (self.ids[pos] == lab))[0]
+        else:
+            pos = np.zeros(len(lab)).astype('int')
+            cells = np.zeros(0).astype('int')
+        order = np.argsort(pos[cells], kind='mergesort')
+        self._cells = cells[order]
+        self._group = pos[self._cells]
+
+        g = self._group
+        self._starts = np.nonzero(np.concatenate(([True], g[1:] != g[:-1])))[0]
+        self._groups = g[self._starts] if len(g) > 0 else g
+        self.ncells = np.bincount(g, minlength=len(self.ids))
+
+    def _get_cells(self, x):
+        """
+        values and validity of all region cells of x
+
+        Returns
+        -------
+        vals : ndarray
+            values [time,ncells]; invalid values are set to zero
+        valid : ndarray (bool)
+            validity [time,ncells]
+        """
+        n = len(self.shape)
+        if np.shape(x)[-n:] != self.shape:
+            raise ValueError('Inconsistent geometry!')
+        x = x.reshape((-1, int(np.prod(self.shape))))
+        vals = x[:, self._cells]
+        valid = ~np.ma.getmaskarray(vals)
+        vals = np.asarray(np.ma.filled(vals, 0.), dtype='float')
+        hlp = np.isnan(vals)
+        if hlp.any():
+            valid &= ~hlp
+            vals = np.where(hlp, 0., vals)
+        return vals, valid
+
+    def _reduce(self, vals, ufunc=np.add, fill=0.):
+        """
+        reduce values [time,ncells] for each region
+
+        Returns
+        -------
+        r : ndarray
+            result [time,nregions]; regions without cells are
+            set to fill
+        """
+        r = np.ones((len(vals), len(self.ids))) * fill
+        if len(self._cells) > 0:
+            r[:, self._groups] = ufunc.reduceat(vals, self._starts, axis=1)
+        return r
+
+    def statistics(self, x, ddof=0):
+        """
+        statistics of each region and timestep
+
+        Parameters
+        ----------
+        x : ndarray or masked array
+            data [time,ny,nx] or [ny,nx]
+        ddof : int
+            delta degrees of freedom for the standard deviation
+
+        Returns
+        -------
+        res : dict
+            dictionary with the keys ['id','n','sum','mean','std','min','max'];
+            all statistics are of shape [time,nregions] and are masked
+            where no valid data is available
+        """
+        vals, valid = self._get_cells(x)
+        n = self._reduce(valid.astype('float')).astype('int')
+        c = np.maximum(n, 1)
+        s = self._reduce(vals)
+        m = s / c
+
+        # variance from the deviations of the mean to avoid cancellation
+        d = np.where(valid, vals - m[:, self._group], 0.)
+        v = self._reduce(d * d) / np.maximum(n - ddof, 1)
+        del d
+        mi = self._reduce(np.where(valid, vals, np.inf), ufunc=np.minimum, fill=np.inf)
+        ma = self._reduce(np.where(valid, vals, -np.inf), ufunc=np.maximum, fill=-np.inf)
+
+        msk = n == 0
+        return {'id': self.ids, 'n': n,
+                'sum': np.ma.array(s, mask=msk),
+                'mean': np.ma.array(m, mask=msk),
+                'std': np.ma.array(np.sqrt(v), mask=msk | (n <= ddof)),
+                'min': np.ma.array(np.where(msk, 0., mi), mask=msk),
+                'max': np.ma.array(np.where(msk, 0., ma), mask=msk)}
+
+    def fldmean(self, x, weights=None, total=None):
+        """
+        (weighted) field mean of each region and timestep
+
+        Parameters
+        ----------
+        x : ndarray or masked array
+            data [time,ny,nx] or [ny,nx]
+        weights : ndarray
+            weight of each grid cell [ny,nx] (e.g. cell area);
+            if None, all cells have the same weight
+        total : float or ndarray
+            normalization of the weighted sums [nregions]; if None,
+            the sum of weights of the valid cells is used
+
+        Returns
+        -------
+        r : masked array
+            field means [time,nregions]
+        """
+        vals, valid = self._get_cells(x)
+        if weights is None:
+            w = np.ones(len(self._cells))
+        else:
+            if np.shape(weights) != self.shape:
+                raise ValueError('Inconsistent geometry of weights!')
+            w = np.asarray(weights, dtype='float').reshape(-1)[self._cells]
+        wsum = self._reduce(np.where(valid, w, 0.))
+        s = self._reduce(vals * w)
+        if total is None:
+            norm = wsum
+        else:
+            norm = np.ones_like(wsum) * total
+        msk = wsum == 0.
+        return np.ma.array(s / np.where(norm == 0., 1., norm), mask=msk)
+
+    def moments(self, x, y):
+        """
+        moments of the pairs of x and y which are both valid;
+        all timesteps and cells of a region are taken into account
+
+        Parameters
+        ----------
+        x : ndarray or masked array
+            data [time,ny,nx] or [ny,nx]
+        y : ndarray or masked array
+            data [time,ny,nx] or [ny,nx]
+
+        Returns
+        -------
+        res : dict
+            dictionary with the number of valid pairs 'n', the means
+            'xmean', 'ymean' and the sums of the (co)variances of the
+            centered data 'sxx', 'syy', 'sxy' of each region
+        """
+        if np.shape(x) != np.shape(y):
+            raise ValueError('Inconsistent geometry!')
+        xv, valid = self._get_cells(x)
+        yv, hlp = self._get_cells(y)
+        valid &= hlp
+        del hlp
+        n = self._reduce(valid.astype('float')).sum(axis=0)
+        c = np.maximum(n, 1)
+        xm = self._reduce(np.where(valid, xv, 0.)).sum(axis=0) / c
+        ym = self._reduce(np.where(valid, yv, 0.)).sum(axis=0) / c
+        dx = np.where(valid, xv - xm[self._group], 0.)
+        dy = np.where(valid, yv - ym[self._group], 0.)
+        msk = n == 0
+        return {'n': n.astype('int'),
+                'xmean': np.ma.array(xm, mask=msk),
+                'ymean': np.ma.array(ym, mask=msk),
+                'sxx': self._reduce(dx * dx).sum(axis=0),
+                'syy': self._reduce(dy * dy).sum(axis=0),
+                'sxy': self._reduce(dx * dy).sum(axis=0)}
+
+
+class EnsembleAggregator(object):
+
+    """
+    Statistics over ensemble members, which are added one by one
+
+    Mean and variance are updated with Welford's algorithm, thus
+    only the running statistics need to be kept in memory and no
+    second pass over the members is needed for the standard
+    deviation. Members can be added in any order.
+
+    Masked values and NaN are not taken into account.
+
+    Example
+    -------
+    >>> A = EnsembleAggregator(shape=(nt, ny, nx))
+    >>> for x in members:
+    ...     A.add(x)
+    >>> m = A.mean()
+    >>> s = A.std()
+    """
+
+    def __init__(self, shape):
+        """
+        Parameters
+        ----------
+        shape : tuple
+            shape of the data of a single member (e.g. (nt,ny,nx))
+        """
+        self.shape = tuple(shape)
+        self.nmembers = 0
+        self._cnt = np.zeros(self.shape).astype('int')
+        self._mean = np.zeros(self.shape)
+        self._m2 = np.zeros(self.shape)
+        self._min = np.ones(self.shape) * np.inf
+        self._max = np.ones(self.shape) * -np.inf
+
+    def add(self, x):
+        """
+        add the data of an ensemble member
+
+        Parameters
+        ----------
+        x : ndarray or masked array
+            data of the member with the shape of the aggregator
+        """
+        if np.shape(x) != self.shape:
+            raise ValueError('Inconsistent geometry!')
+        valid = ~np.ma.getmaskarray(x)
+        vals = np.asarray(np.ma.filled(x, 0.), dtype='float')
+        hlp = np.isnan(vals)
+        if hlp.any():
+            valid &= ~hlp
+            vals = np.where(hlp, 0., vals)
+        del hlp
+
+        self._cnt += valid
+        delta = np.where(valid, vals - self._mean, 0.)
+        self._mean += delta / np.maximum(self._cnt, 1)
+        self._m2 += delta * np.where(valid, vals - self._mean, 0.)
+        np.minimum(self._min, np.where(valid, vals, np.inf), out=self._min)
+        np.maximum(self._max, np.where(valid, vals, -np.inf), out=self._max)
+        self.nmembers += 1
+
+    def count(self):
+        """ number of members with valid values """
+        return self._cnt.copy()
+
+    def mean(self):
+        """ ensemble mean; masked where no member is valid """
+        return np.ma.array(self._mean.copy(), mask=self._cnt == 0)
+
+    def std(self, ddof=0):
+        """
+        ensemble standard deviation
+
+        Parameters
+        ----------
+        ddof : int
+            delta degrees of freedom; the default (0) corresponds to
+            'cdo ensstd', ddof=1 to 'cdo ensstd1'
+        """
+        v = self._m2 / np.maximum(self._cnt - ddof, 1)
+        return np.ma.array(np.sqrt(np.maximum(v, 0.)),
+                           mask=(self._cnt == 0) | (self._cnt <= ddof))
+
+    def min(self):
+        """ ensemble minimum; masked where no member is valid """
+        msk = self._cnt == 0
+        return np.ma.array(np.where(msk, 0., self._min), mask=msk)
+
+    def max(self):
+        """ ensemble maximum; masked where no member is valid """
+        msk = self._cnt == 0
+        return np.ma.array(np.where(msk, 0., self._max), mask=msk)
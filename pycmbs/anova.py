@@ -35,17 +35,20 @@ class Anova1():
          x : ndarray
             data array which contains multiple ensemble members
             of time series [nrens,ntime]. Each single row contains
-            an entire timeseries. Equal number of samples is assumed
+            an entire timeseries. Equal number of samples is assumed.
+            The ANOVA can be performed for many locations at once,
+            if the data of all locations is given as [nrens,ntime,npix].
+            All results are then arrays [npix]
         """
 
-        if x.ndim != 2:
-            raise ValueError('Only 2D supported for one-way ANOVA')
+        if x.ndim not in [2, 3]:
+            raise ValueError('Only 2D or 3D supported for one-way ANOVA')
 
         self.x = x.copy()
         self.xmean = x.mean(axis=0)  # ensemble mean
-        self.mean = x.mean()  # overall mean
+        self.mean = self.xmean.mean(axis=0)  # overall mean
 
-        self.n, self.nt = x.shape
+        self.n, self.nt = x.shape[0:2]
 
     def one_way_anova(self, verbose=False):
         self._calc_sst()  # calculate different variance components
@@ -79,18 +82,14 @@ class Anova1():
         self.sst = self.ssa + self.sse
 
     def _calc_ssa(self):
-        self.ssa = self.n * sum((self.xmean - self.mean) ** 2)
+        self.ssa = self.n * np.sum((self.xmean - self.mean) ** 2, axis=0)
 
     def get_significance(self, f):
         p = 1. - stats.f.cdf(f, (self.nt - 1), self.nt * (self.n - 1))
         return p
 
     def _calc_sse(self):
-        tmp = []
-        for i in range(self.n):
-            tmp.append(sum((self.x[i, :] - self.xmean) ** 2))
-        tmp = np.asarray(tmp)
-        self.sse = sum(tmp)
+        self.sse = np.sum((self.x - self.xmean) ** 2, axis=(0, 1))
 
     def get_fractional_variance_explained(self, adjust=True):
         if adjust:
@@ -106,17 +105,26 @@ class Anova2():
     def __init__(self, x):
         '''
         x [blocks,treatmens,nrens]
+
+        The ANOVA can be performed for many locations at once, if the
+        data of all locations is given as [blocks,treatments,nrens,npix].
+        All results are then arrays [npix]
         '''
+        if x.ndim not in [3, 4]:
+            raise ValueError('Only 3D or 4D supported for two-way ANOVA')
+
         self.x = x.copy()
-        self.mean = x.mean()  # overall mean
 
+        # mean over all replications [J,I]
+        self.ensmean = x.mean(axis=2)
         # mean value for each block (Ybar_0j0)
-        self.bmean = x.mean(axis=1).mean(axis=1)
+        self.bmean = self.ensmean.mean(axis=1)
         # mean value for all treatments (ybar_i00)
-        self.tmean = x.mean(axis=0).mean(axis=1)
+        self.tmean = self.ensmean.mean(axis=0)
+        self.mean = self.bmean.mean(axis=0)  # overall mean
 
         # nr of experiments, timesteps, ensemble members
-        self.J, self.I, self.n = self.x.shape
+        self.J, self.I, self.n = self.x.shape[0:3]
 
     def two_way_anova_with_replication(self, verbose=False):
         self._calc_sst()
@@ -176,34 +184,21 @@ class Anova2():
 
     def _calc_ssa(self):
         # eq. 9.21 in von Storch
-        self.ssa = self.n * self.J * sum((self.tmean - self.mean) ** 2)
+        self.ssa = self.n * self.J * np.sum((self.tmean - self.mean) ** 2, axis=0)
 
     def _calc_ssb(self):
         # eq. 9.22 in von Storch
-        self.ssb = self.n * self.I * sum((self.bmean - self.mean) ** 2)
+        self.ssb = self.n * self.I * np.sum((self.bmean - self.mean) ** 2, axis=0)
 
     def _calc_ssi(self):
-        ensmean = self.x.mean(axis=2)  # mean over all replications [J,I]
-        s = 0.
-        for i in np.arange(self.I):  # eq.9.23
-            for j in np.arange(self.J):
-                s += (ensmean[j, i] - self.tmean[i]
-                      - self.bmean[j] + self.mean) ** 2
-        self.ssi = self.n * s
+        # eq.9.23
+        s = (self.ensmean - self.tmean[np.newaxis]
+             - self.bmean[:, np.newaxis] + self.mean) ** 2
+        self.ssi = self.n * np.sum(s, axis=(0, 1))
 
     def _calc_sse(self):
-        ensmean = self.x.mean(axis=2)
-        #~ print ensmean.shape
-        s = []
-        for l in np.arange(self.n):
-            tmp = (self.x[:, :, l] - ensmean) ** 2
-            #~ print tmp.shape, tmp.sum()
-            s.append(tmp.sum())
-        s = np.asarray(s)
-        if len(s) != self.n:
-            raise ValueError('invalid lengths!')
-
-        self.sse = sum(s)
+        s = (self.x - self.ensmean[:, :, np.newaxis]) ** 2
+        self.sse = np.sum(s, axis=(0, 1, 2))
 
     def _calc_f(self):
         #- calculate degree of freedoms
@@ -27,6 +27,7 @@ from pycmbs.plots import GlobalMeanPlot, map_season, map_difference, ReichlerPlo
 from pycmbs.mapping import map_plot
 from pycmbs.data import Data
 from pycmbs.benchmarking.utils import get_T63_landseamask, get_temporary_directory
+from pycmbs.benchmarking.cache import get_preprocessing_cache
 
 
 def preprocess_seasonal_data(raw_file, interval=None, themask=None,
@@ -80,71 +81,31 @@ def preprocess_seasonal_data(raw_file, interval=None, themask=None,
         raise ValueError('Lon shift parameter needs to be specified!')
 
     # PREPROCESSING of observational data  ---
-    cdo = Cdo()
+    # all results are stored in the preprocessing cache. The cache
+    # entries depend on the identity of the raw file, the
+    # processing chain and the target grid
+    cache = get_preprocessing_cache()
+    input_files = [raw_file]
+    if os.path.exists(target_grid):
+        input_files.append(target_grid)
 
     # 1) generate monthly mean file projected to T63
-    obs_mon_file = get_temporary_directory() + os.path.basename(raw_file)
 
     # construct string for seldate; it is assumed that it was already checked before that start_date,stop_date are valid datetime objects!
 
     if (start_date is not None) and (stop_date is not None):
         print 'Temporal subsetting for ' + raw_file + ' will be performed! ', start_date, stop_date
         seldate_str = ' -seldate,' + str(start_date)[0: 10] + ',' + str(stop_date)[0: 10]
-        obs_mon_file = obs_mon_file[:-3] + '_' + str(start_date)[0: 10] + '_' + str(stop_date)[0: 10] + '_monmean.nc'
     else:
         seldate_str = ''
-        obs_mon_file = obs_mon_file[:-3] + '_monmean.nc'
-
-    cdo.monmean(options='-f nc', output=obs_mon_file,
-                input='-' + interpolation_method + ',' + target_grid + seldate_str + ' ' + raw_file, force=force)
-
-    # 2) generate monthly mean or seasonal mean climatology as well as standard deviation
-    if interval == 'monthly':
-        obs_ymonmean_file = obs_mon_file[:-3] + '_ymonmean.nc'
-        obs_ymonstd_file = obs_mon_file[:-3] + '_ymonstd.nc'
-        obs_ymonsum_file = obs_mon_file[:-3] + '_ymonsum.nc'
-        obs_ymonN_file = obs_mon_file[:-3] + '_ymonN.nc'
-        cdo.ymonmean(options='-f nc -b 32', output=obs_ymonmean_file, input=obs_mon_file, force=force)
-        cdo.ymonsum(options='-f nc -b 32', output=obs_ymonsum_file, input=obs_mon_file, force=force)
-        cdo.ymonstd(options='-f nc -b 32', output=obs_ymonstd_file, input=obs_mon_file, force=force)
-        cdo.div(options='-f nc -b 32', output=obs_ymonN_file, input=obs_ymonsum_file + ' ' + obs_ymonmean_file,
-                force=force)  # number of samples
-        time_cycle = 12
-    elif interval == 'season':
-        obs_ymonmean_file = obs_mon_file[:-3] + '_yseasmean.nc'
-        obs_ymonstd_file = obs_mon_file[:-3] + '_yseasstd.nc'
-        obs_ymonsum_file = obs_mon_file[:-3] + '_yseassum.nc'
-        obs_ymonN_file = obs_mon_file[:-3] + '_yseasN.nc'
-        cdo.yseasmean(options='-f nc -b 32', output=obs_ymonmean_file, input=obs_mon_file, force=force)
-        cdo.yseassum(options='-f nc -b 32', output=obs_ymonsum_file, input=obs_mon_file, force=force)
-        cdo.yseasstd(options='-f nc -b 32', output=obs_ymonstd_file, input=obs_mon_file, force=force)
-        cdo.div(options='-f nc -b 32', output=obs_ymonN_file, input=obs_ymonsum_file + ' ' + obs_ymonmean_file,
-                force=force)  # number of samples
-        time_cycle = 4
-    else:
+
+    obs_mon_file = cache.cdo('monmean', '-' + interpolation_method + ',' + target_grid + seldate_str + ' ' + raw_file,
+                             files=input_files, options='-f nc', force=force)
+
+    if interval not in ['monthly', 'season']:
         print interval
         raise ValueError('Unknown temporal interval. Can not perform preprocessing! ')
 
-    #--- READ DATA ---
-    obs = Data(obs_ymonmean_file, obs_var, read=True, label=label,
-               lat_name='lat', lon_name='lon', shift_lon=shift_lon,
-               time_cycle=time_cycle)
-    obs_std = Data(obs_ymonstd_file, obs_var, read=True,
-                   label=label + ' std', lat_name='lat', lon_name='lon',
-                   shift_lon=shift_lon, time_cycle=time_cycle)
-    obs.std = obs_std.data.copy()
-    del obs_std
-    obs_N = Data(obs_ymonN_file, obs_var, read=True,
-                 label=label + ' N', unit='-', lat_name='lat',
-                 lon_name='lon',
-                 shift_lon=shift_lon, time_cycle=time_cycle)
-    obs.n = obs_N.data.copy()
-    del obs_N
-
-    # sort climatology to be sure that it starts always with January
-    obs.adjust_time(year=1700, day=15)  # set arbitrary time for climatology
-    obs.timsort()
-
     #/// read monthly data (needed for global means and hovmoeller plots) ///
     obs_monthly = Data(obs_mon_file, obs_var, read=True, label=label,
                        lat_name='lat', lon_name='lon',
@@ -157,9 +118,13 @@ def preprocess_seasonal_data(raw_file, interval=None, themask=None,
     if obs_monthly.time_cycle != 12:
         raise ValueError('Timecycle could still not be set!!! %s' % obs_mon_file)
 
+    # 2) generate monthly mean or seasonal mean climatology as well as
+    # standard deviation, sum and number of samples in a single pass
+    # over the monthly data. The climatology starts always with January
+    obs = obs_monthly.get_climatology_statistics(interval=interval)
+
     #/// center dates of months
     obs_monthly.adjust_time(day=15)
-    obs.adjust_time(day=15)
 
     if themask is not None:
         obs._apply_mask(themask)
@@ -605,6 +570,11 @@ def generic_analysis(plot_options, model_list, obs_type, obs_name,
     # MAIN LIST OVER MODELS
     ####################################################################################################################
 
+    # model data for Gleckler plot; the performance indices of all
+    # models are calculated at once after the processing of the models
+    gleckler_models = []
+    gleckler_data = []
+
     for model in model_list:
         sys.stdout.write('\n *** %s Analysis of model: ' % (obs_type.upper()) + model.name + "\n")
 
@@ -870,9 +840,14 @@ def generic_analysis(plot_options, model_list, obs_type, obs_name,
             Rplot.add(e2, model_data.label, color='red')
 
         if f_gleckler is True:
-            sys.stdout.write('\n *** Glecker plot. \n')
-            e2a = GP.calc_index(obs_orig, model_data, model, obs_type)
-            GP.add_data(obs_type, model._unique_name, e2a, pos=gleckler_pos)
+            gleckler_models.append(model._unique_name)
+            gleckler_data.append(model_data)
+
+    if f_gleckler is True and len(gleckler_models) > 0:
+        sys.stdout.write('\n *** Glecker plot. \n')
+        GP.calc_indices(obs_orig, gleckler_data, gleckler_models, obs_type,
+                        pos=gleckler_pos)
+    del gleckler_data
 
     # final plotting
     if f_pattern_correlation:
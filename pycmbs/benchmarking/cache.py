@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of pyCMBS.
+(c) 2012- Alexander Loew
+For COPYING and LICENSE details, please refer to the LICENSE file
+"""
+
+"""
+This module implements a content addressed cache for
+preprocessed data files (e.g. results of CDO operator chains)
+"""
+
+import os
+import time
+import json
+import hashlib
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # no file locking available (e.g. Windows)
+    fcntl = None
+
+from cdo import Cdo
+
+from pycmbs.benchmarking.utils import get_temporary_directory
+
+
+class PreprocessingCache(object):
+
+    """
+    Cache for files which are generated by preprocessing chains
+
+    Each cache entry is identified by a hash of
+    a) the identity of all input files (path, size, modification time)
+    b) the operator chain applied
+    c) additional options (e.g. target grid, CDO options)
+
+    A change of the raw data, the interpolation method or the target
+    grid therefore results in a new cache entry instead of silently
+    reusing stale results. Identical processing chains share the same
+    entry, independent of the name of the dataset.
+
+    All entries are registered in a manifest file (JSON) in the
+    cache directory. If a maximum cache size is given, the least
+    recently used entries are removed when the size is exceeded.
+    Entries which have been used within the last min_age seconds
+    are never removed, as they might still be read by another
+    process.
+
+    The cache can be shared by several processes. The manifest is
+    locked (fcntl.flock on a lock file) while it is updated.
+
+    Example
+    -------
+    >>> C = PreprocessingCache()
+    >>> f = C.cdo('monmean', '-remapcon,t63grid ' + raw_file, files=[raw_file], options='-f nc')
+    """
+
+    def __init__(self, directory=None, max_size=None, min_age=300.):
+        """
+        Parameters
+        ----------
+        directory : str
+            cache directory; default is the subdirectory 'cache'
+            of the temporary directory (see get_temporary_directory())
+        max_size : float
+            maximum size of the cache [MB]. If None, the environment
+            variable PYCMBS_CACHE_MAXSIZE is used; if this is not
+            set, the cache size is unlimited
+        min_age : float
+            minimum time [s] since the last use of an entry before it
+            can be removed to reduce the cache size
+        """
+        if directory is None:
+            directory = get_temporary_directory() + 'cache' + os.sep
+        if directory[-1] != os.sep:
+            directory += os.sep
+        self.directory = directory
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        if max_size is None:
+            if 'PYCMBS_CACHE_MAXSIZE' in os.environ.keys():
+                max_size = float(os.environ['PYCMBS_CACHE_MAXSIZE'])
+        self.max_size = max_size
+        self.min_age = min_age
+
+        self.manifest_file = self.directory + 'manifest.json'
+        self.lock_file = self.directory + 'manifest.lock'
+        self.hits = 0
+        self.misses = 0
+
+    def _file_identity(self, filename):
+        """
+        identity of a file given by absolute path, size and
+        modification time
+        """
+        filename = os.path.abspath(filename)
+        if not os.path.exists(filename):
+            raise ValueError('File not existing: %s' % filename)
+        st = os.stat(filename)
+        return [filename, st.st_size, st.st_mtime]
+
+    def get_key(self, operator, files=None, **kwargs):
+        """
+        get the key of a cache entry
+
+        Parameters
+        ----------
+        operator : str
+            description of the processing chain (e.g. a CDO command)
+        files : list
+            list of input files; their identity is part of the key
+        kwargs : dict
+            all other parameters which have an impact on the result
+            (e.g. target grid, options)
+
+        Returns
+        -------
+        key : str
+        """
+        if files is None:
+            files = []
+        d = {'operator': operator,
+             'files': [self._file_identity(f) for f in files],
+             'options': sorted([[k, str(v)] for k, v in kwargs.items()])}
+        return hashlib.sha1(json.dumps(d, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get_filename(self, key, suffix='.nc'):
+        """ filename of a cache entry """
+        return self.directory + key + suffix
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            return json.load(open(self.manifest_file, 'r'))
+        except ValueError:
+            # corrupt manifest; the cached files are registered again
+            # when they are used
+            return {}
+
+    def _write_manifest(self, manifest):
+        # write to a temporary file first to avoid corrupt manifests
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.json')
+        f = os.fdopen(fd, 'w')
+        json.dump(manifest, f, indent=1, sort_keys=True)
+        f.close()
+        os.rename(tmp, self.manifest_file)
+
+    def _lock(self):
+        """
+        lock the manifest for exclusive access
+
+        Returns
+        -------
+        f : file
+            lock file; needs to be passed to _unlock()
+        """
+        f = open(self.lock_file, 'a')
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return f
+
+    def _unlock(self, f):
+        """ release a lock obtained by _lock() """
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+    def _update_manifest(self, key, filename, description=None):
+        """
+        register or touch a cache entry
+
+        Returns
+        -------
+        False if the file of the entry is not existing (e.g. it has
+        been removed by another process), else True
+        """
+        lock = self._lock()
+        try:
+            if not os.path.exists(filename):
+                return False
+            manifest = self._read_manifest()
+            entry = manifest.get(key, {'created': time.time()})
+            entry.update({'file': os.path.basename(filename),
+                          'size': os.path.getsize(filename),
+                          'last_access': time.time()})
+            if description is not None:
+                entry['description'] = description
+            manifest[key] = entry
+            self._evict(manifest, keep=key)
+            self._write_manifest(manifest)
+        finally:
+            self._unlock(lock)
+        return True
+
+    def _evict(self, manifest, keep=None):
+        """
+        remove least recently used entries until the cache size is
+        below the maximum size. Files in the cache directory which are
+        not registered in the manifest (e.g. due to an interrupted
+        update) are registered first, to take them into account for
+        the cache size. Needs to be called with the manifest locked.
+        """
+        for k in list(manifest.keys()):
+            if not os.path.exists(self.directory + manifest[k]['file']):
+                manifest.pop(k)
+        registered = set([e['file'] for e in manifest.values()])
+        for f in os.listdir(self.directory):
+            if f.endswith('.nc') and (f not in registered):
+                st = os.stat(self.directory + f)
+                manifest[os.path.splitext(f)[0]] = {
+                    'file': f, 'size': st.st_size, 'created': st.st_mtime,
+                    'last_access': st.st_mtime}
+        if self.max_size is None:
+            return
+        max_bytes = self.max_size * 1024. * 1024.
+        total = sum([e['size'] for e in manifest.values()])
+        now = time.time()
+        for k in sorted(manifest.keys(), key=lambda x: manifest[x]['last_access']):
+            if total <= max_bytes:
+                break
+            if k == keep:
+                continue
+            if now - manifest[k]['last_access'] < self.min_age:
+                # entries are sorted by the time of last access
+                break
+            fname = self.directory + manifest[k]['file']
+            if os.path.exists(fname):
+                os.remove(fname)
+            total -= manifest[k]['size']
+            manifest.pop(k)
+
+    def lookup(self, key, suffix='.nc'):
+        """
+        look for a cache entry
+
+        Returns
+        -------
+        filename of the entry or None if the entry is not existing
+        """
+        filename = self.get_filename(key, suffix=suffix)
+        # touching the entry protects it from removal by other
+        # processes for min_age seconds
+        if self._update_manifest(key, filename):
+            self.hits += 1
+            return filename
+        else:
+            self.misses += 1
+            return None
+
+    def store(self, key, filename, suffix='.nc', description=None):
+        """
+        move a file into the cache
+
+        Parameters
+        ----------
+        key : str
+            key of the entry
+        filename : str
+            file to be moved into the cache
+
+        Returns
+        -------
+        name of the file in the cache
+        """
+        target = self.get_filename(key, suffix=suffix)
+        os.rename(filename, target)
+        self._update_manifest(key, target, description=description)
+        return target
+
+    def cdo(self, operator, input, files=None, options='', force=False, **kwargs):
+        """
+        run a CDO operator and cache the result
+
+        Parameters
+        ----------
+        operator : str
+            name of the CDO operator (e.g. 'monmean')
+        input : str
+            input argument for the CDO (can include operator chains)
+        files : list
+            input files used in the chain; their identity is part of
+            the key. Files which are part of the input string
+            should be provided here.
+        options : str
+            CDO options
+        force : bool
+            recalculate even if the result is already in the cache
+        kwargs : dict
+            additional parameters which are part of the key
+
+        Returns
+        -------
+        name of the result file
+        """
+        key = self.get_key(operator + ' ' + input, files=files,
+                           options=options, **kwargs)
+        if not force:
+            filename = self.lookup(key)
+            if filename is not None:
+                return filename
+        else:
+            self.misses += 1
+
+        # write to a temporary file in the cache directory and move it to
+        # its final name afterwards, to never leave incomplete entries
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.nc.tmp')
+        os.close(fd)
+        try:
+            getattr(Cdo(), operator)(options=options, output=tmp, input=input, force=True)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return self.store(key, tmp, description=operator + ' ' + input)
+
+    def get_statistics(self):
+        """
+        get cache statistics
+
+        Returns
+        -------
+        dictionary with number of hits, misses, entries and size [MB]
+        """
+        manifest = self._read_manifest()
+        size = sum([e['size'] for e in manifest.values()]) / 1024. / 1024.
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(manifest), 'size': size}
+
+    def add_statistics(self, hits, misses):
+        """
+        add the number of hits and misses of other processes
+        (e.g. worker processes) to the statistics of this instance
+        """
+        self.hits += hits
+        self.misses += misses
+
+
+_cache = None
+
+
+def get_preprocessing_cache():
+    """
+    get the cache instance which is shared within the process
+
+    Returns
+    -------
+    C : PreprocessingCache
+    """
+    global _cache
+    if _cache is None:
+        _cache = PreprocessingCache()
+    elif _cache.directory != get_temporary_directory() + 'cache' + os.sep:
+        # temporary directory has changed
+        _cache = PreprocessingCache()
+    return _cache
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of pyCMBS.
+(c) 2012- Alexander Loew
+For COPYING and LICENSE details, please refer to the LICENSE file
+"""
+
+"""
+This module implements a persistent index of the files of a data
+archive with the directory structure of the CMIP5 archive
+"""
+
+import os
+import re
+import time
+import json
+import hashlib
+import tempfile
+
+from pycmbs.benchmarking.utils import get_temporary_directory
+
+# directory levels below the root directory of a CMIP5 archive
+CMIP5_LEVELS = ['institute', 'model', 'experiment', 'frequency', 'realm',
+                'mip', 'ensemble', 'variable']
+
+_time_range = re.compile(r'_(\d+)-(\d+)\.nc$')
+
+
+def _get_time_range(filename):
+    """
+    get the time range of a CMIP5 file from its name
+    (e.g. tas_Amon_MPI-ESM-LR_amip_r1i1p1_197901-200812.nc)
+
+    Returns
+    -------
+    start, stop : str
+        start and stop of the period covered by the file; None if
+        the filename does not contain a time range
+    """
+    m = _time_range.search(filename)
+    if m is None:
+        return [None, None]
+    return [m.group(1), m.group(2)]
+
+
+class CMIP5FileIndex(object):
+
+    """
+    Persistent index of the files of a CMIP5 like archive
+    (institute/model/experiment/frequency/realm/mip/ensemble/variable/files)
+
+    For each directory of the archive, the index stores its
+    modification time, its subdirectories and its netCDF files
+    together with the time range of each file. The index is stored
+    as JSON file and is updated incrementally: only directories whose
+    modification time has changed since the last update are listed
+    again (os.listdir), while for all other directories a single
+    stat() is sufficient. Adding or removing files in the archive
+    therefore only requires to list the affected directories.
+
+    Queries (e.g. all files of a model and variable or all ensemble
+    members) are answered from the index without accessing the
+    file system.
+
+    Example
+    -------
+    >>> I = CMIP5FileIndex('/data/CMIP5/')
+    >>> files = I.get_files(model='MPI-ESM-LR', experiment='amip', variable='tas')
+    """
+
+    def __init__(self, root_dir, index_file=None, update=True):
+        """
+        Parameters
+        ----------
+        root_dir : str
+            root directory of the archive; below the root directory
+            are the subdirectories of the individual institutes
+        index_file : str
+            name of the file to store the index; default is a file
+            in the temporary directory (see get_temporary_directory())
+            which is specific for the root directory
+        update : bool
+            update the index when the object is created
+        """
+        self.root_dir = root_dir
+        if self.root_dir[-1] != os.sep:
+            self.root_dir += os.sep
+        if not os.path.exists(self.root_dir):
+            raise ValueError('Path not existing: %s' % self.root_dir)
+        if index_file is None:
+            h = hashlib.sha1(os.path.abspath(self.root_dir).encode('utf-8')).hexdigest()
+            index_file = get_temporary_directory() + 'cmip5_index_' + h + '.json'
+        self.index_file = index_file
+
+        self._dirs = self._read()
+        self.scanned = 0  # number of directories listed in last update
+        if update:
+            self.update()
+
+    def _read(self):
+        """ read the index from file """
+        if not os.path.exists(self.index_file):
+            return {}
+        try:
+            d = json.load(open(self.index_file, 'r'))
+        except ValueError:
+            # corrupt index; the archive is scanned again
+            return {}
+        if d.get('root') != os.path.abspath(self.root_dir):
+            return {}
+        return d['dirs']
+
+    def _write(self):
+        """ write the index to file """
+        directory = os.path.dirname(os.path.abspath(self.index_file))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # write to a temporary file first to avoid corrupt indices
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.json')
+        f = os.fdopen(fd, 'w')
+        json.dump({'root': os.path.abspath(self.root_dir), 'dirs': self._dirs}, f)
+        f.close()
+        os.rename(tmp, self.index_file)
+
+    def update(self):
+        """
+        update the index for all changes of the archive since the
+        last update and store it on file
+
+        Returns
+        -------
+        n : int
+            number of directories which have been listed
+        """
+        dirs = {}
+        self.scanned = 0
+        stack = ['']
+        while len(stack) > 0:
+            rel = stack.pop()
+            path = self.root_dir + rel
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                # directory removed during the update
+                continue
+            e = self._dirs.get(rel)
+            # directories modified shortly before they were listed are
+            # listed again, as changes within the resolution of the
+            # modification time would not be detected otherwise
+            if (e is None) or (e['mtime'] != mtime) or (e.get('listed', 0.) - mtime < 2.):
+                e = self._list_directory(path, mtime)
+                self.scanned += 1
+            dirs[rel] = e
+            stack.extend([rel + d + os.sep for d in e['dirs']])
+        self._dirs = dirs
+        self._write()
+        return self.scanned
+
+    def _list_directory(self, path, mtime):
+        """ index entry of a single directory """
+        listed = time.time()
+        subdirs = []
+        files = []
+        for name in sorted(os.listdir(path)):
+            if os.path.isdir(path + name):
+                subdirs.append(name)
+            elif name.endswith('.nc'):
+                files.append([name] + _get_time_range(name))
+        return {'mtime': mtime, 'listed': listed, 'dirs': subdirs, 'files': files}
+
+    def get_subdirectories(self, *args):
+        """
+        get the subdirectories of a directory in the archive
+
+        Parameters
+        ----------
+        args : str
+            path of the directory below the root directory given by
+            its components (e.g. institute, model)
+
+        Returns
+        -------
+        dirs : list
+            names of subdirectories; empty if the directory is not
+            existing
+        """
+        rel = ''.join([a + os.sep for a in args])
+        e = self._dirs.get(rel)
+        if e is None:
+            return []
+        return list(e['dirs'])
+
+    def query(self, **kwargs):
+        """
+        get all files of the archive which match the given
+        directory components
+
+        Parameters
+        ----------
+        kwargs : dict
+            values for the directory levels (see CMIP5_LEVELS),
+            e.g. model='MPI-ESM-LR', variable='tas'. Levels which
+            are not specified match any directory
+
+        Returns
+        -------
+        res : list
+            list of dictionaries with the directory levels, the name
+            of the file ('file') and the time range ('start', 'stop')
+            of each file
+        """
+        for k in kwargs.keys():
+            if k not in CMIP5_LEVELS:
+                raise ValueError('Invalid directory level: %s' % k)
+
+        # walk down the directory levels; for the levels which are
+        # specified, the subdirectory is looked up directly, thus
+        # only the matching part of the index is visited
+        dirs = []
+        stack = [('', 0)]
+        while len(stack) > 0:
+            rel, level = stack.pop()
+            e = self._dirs.get(rel)
+            if e is None:
+                continue
+            if level == len(CMIP5_LEVELS):
+                if len(e['files']) > 0:
+                    dirs.append(rel)
+                continue
+            v = kwargs.get(CMIP5_LEVELS[level])
+            if v is None:
+                stack.extend([(rel + d + os.sep, level + 1) for d in e['dirs']])
+            elif os.sep not in v:
+                stack.append((rel + v + os.sep, level + 1))
+
+        res = []
+        for rel in sorted(dirs):
+            e = self._dirs[rel]
+            parts = rel.split(os.sep)[:-1]
+            for name, start, stop in e['files']:
+                r = dict(zip(CMIP5_LEVELS, parts))
+                r.update({'file': self.root_dir + rel + name,
+                          'start': start, 'stop': stop})
+                res.append(r)
+        return res
+
+    def get_files(self, **kwargs):
+        """
+        get the names of all files which match the given directory
+        components. For the parameters see query()
+
+        Returns
+        -------
+        files : list
+            sorted list of filenames
+        """
+        return [r['file'] for r in self.query(**kwargs)]
+
+    def get_ensembles(self, **kwargs):
+        """
+        get the files of the ensemble members (r<N>i1p1). For the
+        parameters see query()
+
+        Returns
+        -------
+        res : dict
+            dictionary with the number of the ensemble member as key
+            and the sorted list of files as value
+        """
+        r = {}
+        for e in self.query(**kwargs):
+            m = re.match(r'^r(\d+)i1p1$', e['ensemble'])
+            if m is None:
+                continue
+            n = int(m.group(1))
+            if n not in r.keys():
+                r.update({n: []})
+            r[n].append(e['file'])
+        return r
+
+
+_indices = {}
+
+
+def get_file_index(root_dir):
+    """
+    get the index of an archive which is shared within the process.
+    The index is updated the first time it is used in the process.
+
+    Parameters
+    ----------
+    root_dir : str
+        root directory of the archive
+
+    Returns
+    -------
+    I : CMIP5FileIndex
+    """
+    key = os.path.abspath(root_dir)
+    if key not in _indices.keys():
+        _indices[key] = CMIP5FileIndex(root_dir)
+    return _indices[key]
@@ -17,6 +17,7 @@ import numpy as np
 
 from pycmbs.benchmarking import preprocessor
 from pycmbs.benchmarking.utils import get_T63_landseamask, get_temporary_directory
+from pycmbs.benchmarking.cache import get_preprocessing_cache
 from pycmbs.benchmarking.models.model_basic import *
 
 from pycmbs.utils import print_log, WARNING
@@ -138,78 +139,41 @@ class CMIP5Data(Model):
             raise ValueError('Stop time needs to be specified')
 
         #/// PREPROCESSING ///
-        cdo = Cdo()
+        # results are stored in the preprocessing cache; the cache
+        # entries depend on the identity of the raw file, the
+        # processing chain and the target grid
+        cache = get_preprocessing_cache()
         s_start_time = str(self.start_time)[0:10]
         s_stop_time = str(self.stop_time)[0:10]
 
-        #1) select timeperiod and generate monthly mean file
-        if target_grid == 't63grid':
-            gridtok = 'T63'
-        else:
-            gridtok = 'SPECIAL_GRID'
-
-
-        file_monthly = filename1[:-3] + '_' + s_start_time + '_' + s_stop_time + '_' + gridtok + '_monmean.nc'  # target filename
-        file_monthly = get_temporary_directory() + os.path.basename(file_monthly)
-
-        sys.stdout.write('\n *** Model file monthly: %s\n' % file_monthly)
-
         if not os.path.exists(filename1):
             print 'WARNING: File not existing: ' + filename1
             return None
 
-        cdo.monmean(options='-f nc', output=file_monthly, input='-' + interpolation + ',' + target_grid + ' -seldate,' + s_start_time + ',' + s_stop_time + ' ' + filename1, force=force_calc)
+        input_files = [filename1]
+        if os.path.exists(target_grid):
+            input_files.append(target_grid)
+
+        #1) select timeperiod and generate monthly mean file
+        file_monthly = cache.cdo('monmean', '-' + interpolation + ',' + target_grid + ' -seldate,' + s_start_time + ',' + s_stop_time + ' ' + filename1,
+                                 files=input_files, options='-f nc', force=force_calc)
+
+        sys.stdout.write('\n *** Model file monthly: %s\n' % file_monthly)
 
         sys.stdout.write('\n *** Reading model data... \n')
         sys.stdout.write('     Interval: ' + interval + '\n')
 
-        #2) calculate monthly or seasonal climatology
-        if interval == 'monthly':
-            mdata_clim_file = file_monthly[:-3] + '_ymonmean.nc'
-            mdata_sum_file = file_monthly[:-3] + '_ymonsum.nc'
-            mdata_N_file = file_monthly[:-3] + '_ymonN.nc'
-            mdata_clim_std_file = file_monthly[:-3] + '_ymonstd.nc'
-            cdo.ymonmean(options='-f nc -b 32', output=mdata_clim_file, input=file_monthly, force=force_calc)
-            cdo.ymonsum(options='-f nc -b 32', output=mdata_sum_file, input=file_monthly, force=force_calc)
-            cdo.ymonstd(options='-f nc -b 32', output=mdata_clim_std_file, input=file_monthly, force=force_calc)
-            cdo.div(options='-f nc', output=mdata_N_file, input=mdata_sum_file + ' ' + mdata_clim_file, force=force_calc)  # number of samples
-        elif interval == 'season':
-            mdata_clim_file = file_monthly[:-3] + '_yseasmean.nc'
-            mdata_sum_file = file_monthly[:-3] + '_yseassum.nc'
-            mdata_N_file = file_monthly[:-3] + '_yseasN.nc'
-            mdata_clim_std_file = file_monthly[:-3] + '_yseasstd.nc'
-            cdo.yseasmean(options='-f nc -b 32', output=mdata_clim_file, input=file_monthly, force=force_calc)
-            cdo.yseassum(options='-f nc -b 32', output=mdata_sum_file, input=file_monthly, force=force_calc)
-            cdo.yseasstd(options='-f nc -b 32', output=mdata_clim_std_file, input=file_monthly, force=force_calc)
-            cdo.div(options='-f nc -b 32', output=mdata_N_file, input=mdata_sum_file + ' ' + mdata_clim_file, force=force_calc)  # number of samples
-        else:
+        if interval not in ['monthly', 'season']:
             raise ValueError('Unknown temporal interval. Can not perform preprocessing!')
 
-        if not os.path.exists(mdata_clim_file):
-            return None
-
-        #3) read data
-        if interval == 'monthly':
-            thetime_cylce = 12
-        elif interval == 'season':
-            thetime_cylce = 4
-        else:
-            print interval
-            raise ValueError('Unsupported interval!')
-        mdata = Data(mdata_clim_file, varname, read=True, label=self._unique_name, unit=units, lat_name=lat_name, lon_name=lon_name, shift_lon=False, scale_factor=scf, level=thelevel, time_cycle=thetime_cylce)
-        mdata_std = Data(mdata_clim_std_file, varname, read=True, label=self._unique_name + ' std', unit='-', lat_name=lat_name, lon_name=lon_name, shift_lon=False, level=thelevel, time_cycle=thetime_cylce)
-        mdata.std = mdata_std.data.copy()
-        del mdata_std
-        mdata_N = Data(mdata_N_file, varname, read=True, label=self._unique_name + ' std', unit='-', lat_name=lat_name, lon_name=lon_name, shift_lon=False, scale_factor=scf, level=thelevel)
-        mdata.n = mdata_N.data.copy()
-        del mdata_N
-
-        # ensure that climatology always starts with January, therefore set date and then sort
-        mdata.adjust_time(year=1700, day=15)  # set arbitrary time for climatology
-        mdata.timsort()
-
-        #4) read monthly data
+        #2) read monthly data
         mdata_all = Data(file_monthly, varname, read=True, label=self._unique_name, unit=units, lat_name=lat_name, lon_name=lon_name, shift_lon=False, time_cycle=12, scale_factor=scf, level=thelevel)
+
+        #3) calculate monthly or seasonal climatology together with standard
+        # deviation, sum and number of samples in a single pass; the
+        # climatology starts always with January
+        mdata = mdata_all.get_climatology_statistics(interval=interval)
+
         mdata_all.adjust_time(day=15)
 
         #mask_antarctica masks everything below 60 degrees S.
@@ -234,7 +198,6 @@ class CMIP5Data(Model):
 
         mdata._raw_filename = filename1
         mdata._monthly_filename = file_monthly
-        mdata._clim_filename = mdata_clim_file
         mdata._varname = varname
 
         # return data as a tuple list
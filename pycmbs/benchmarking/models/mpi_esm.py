@@ -12,13 +12,73 @@ import copy
 import glob
 import os
 import sys
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import numpy as np
 
 from pycmbs.benchmarking import preprocessor
-from pycmbs.benchmarking.utils import get_T63_landseamask, get_temporary_directory
+from pycmbs.benchmarking.utils import get_T63_landseamask, get_temporary_directory, set_default_permissions
 from pycmbs.benchmarking.models.model_basic import *
 
 
+def _preproc_stream(args):
+    """
+    preprocess a single JSBACH/ECHAM output stream
+
+    All (monthly mean) files of the stream are merged, the code table
+    is applied and monthly means are calculated in a single CDO
+    pipe, thus no intermediate file of the merged data is written.
+    The result is written to a temporary file which is renamed to
+    the output file when complete. An interrupted run therefore
+    does not leave incomplete output files which would be
+    reused later.
+
+    Parameters
+    ----------
+    args : tuple
+        (stream, files, outfile, codetable)
+        stream : name of the stream
+        files : filename pattern of the input files
+        outfile : output file; nothing is done if it is existing
+        codetable : code table; if None, the files are only merged
+
+    Returns
+    -------
+    outfile : str
+    """
+    stream, files, outfile, codetable = args
+    if os.path.exists(outfile):
+        return outfile
+
+    files = sorted(glob.glob(files))
+    if len(files) == 0:  # check if input files existing at all
+        print '   %s stream: no input files' % stream.upper()
+        return outfile
+
+    print '   %s stream ...' % stream.upper()
+    cdo = Cdo()
+    fd, tmp = tempfile.mkstemp(suffix='.nc.tmp', prefix=os.path.basename(outfile)[:-3] + '_',
+                               dir=os.path.dirname(os.path.abspath(outfile)))
+    os.close(fd)
+    try:
+        if codetable is None:
+            cdo.mergetime(options='-f nc', output=tmp, input=' '.join(files), force=True)
+        else:
+            input = '-mergetime ' + ' '.join(files)
+            if os.path.exists(codetable):
+                input = '-setpartab,' + codetable + ' ' + input
+            # monmean needed here, as otherwise interface does not work
+            cdo.monmean(options='-f nc', output=tmp, input=input, force=True)
+        set_default_permissions(tmp)
+        os.rename(tmp, outfile)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    print '   %s stream done: %s' % (stream.upper(), outfile)
+    return outfile
+
+
 class JSBACH_BOT(Model):
 
     def __init__(self, filename, dic_variables, experiment, name='', shift_lon=False, **kwargs):
@@ -187,7 +247,7 @@ class JSBACH_RAW2(Model):
     """
 
     #def __init__(self, filename, dic_variables, experiment, name='', shift_lon=False, model_dict=None, input_format='grb', raw_outdata='outdata/jsbach/', **kwargs):
-    def __init__(self, filename, dic_variables, experiment, name='', shift_lon=False, input_format='grb', raw_outdata='outdata/jsbach/', **kwargs):
+    def __init__(self, filename, dic_variables, experiment, name='', shift_lon=False, input_format='grb', raw_outdata='outdata/jsbach/', jobs=None, **kwargs):
         """
 
         The assignment of certain variables to different input streams is done in the routine
@@ -199,6 +259,9 @@ class JSBACH_RAW2(Model):
         input_format : str
             specifies file format of input data
             ['nc','grb']
+        jobs : int
+            maximum number of streams which are preprocessed
+            concurrently; default is the number of CPUs
         """
 
         super(JSBACH_RAW2, self).__init__(filename, dic_variables, name=name, **kwargs)
@@ -212,6 +275,7 @@ class JSBACH_RAW2(Model):
         assert self.input_format in ['nc', 'grb']
 
         self.raw_outdata = raw_outdata
+        self.jobs = jobs
 
         self._unique_name = self._get_unique_name()
 
@@ -252,127 +316,48 @@ class JSBACH_RAW2(Model):
         1) merge all times from individual (monthly mean) output files
         2) assign codetables to work with proper variable names
         3) aggregate data from tiles to gridbox values
+
+        The streams are independent and are processed concurrently
+        with at most self.jobs CDO processes (see _preproc_stream()).
         """
 
         print 'Preprocessing JSBACH raw data streams (may take a while) ...'
 
-        cdo = Cdo()
-
-        # jsbach stream
-        print '   JSBACH stream ...'
-        outfile = get_temporary_directory() + self.experiment + '_jsbach_mm_full.nc'
-        if os.path.exists(outfile):
-            pass
-        else:
-            codetable = self.data_dir + 'log/' + self.experiment + '_jsbach.codes'
-            tmp = tempfile.mktemp(suffix='.nc', prefix=self.experiment + '_jsbach_', dir=get_temporary_directory())  # temporary file
-            #~ print self.data_dir
-            #~ print self.raw_outdata
-            #~ print 'Files: ', self._get_filenames_jsbach_stream()
-            #~ stop
-            if len(glob.glob(self._get_filenames_jsbach_stream())) > 0:  # check if input files existing at all
-                print 'Mering the following files:', self._get_filenames_jsbach_stream()
-                cdo.mergetime(options='-f nc', output=tmp, input=self._get_filenames_jsbach_stream())
-                if os.path.exists(codetable):
-                    cdo.monmean(options='-f nc', output=outfile, input='-setpartab,' + codetable + ' ' + tmp)  # monmean needed here, as otherwise interface does not work
-                else:
-                    cdo.monmean(options='-f nc', output=outfile, input=tmp)  # monmean needed here, as otherwise interface does not work
-                print 'Outfile: ', outfile
-                #~ os.remove(tmp)
-
-                print 'Temporary name: ', tmp
-
-        self.files.update({'jsbach': outfile})
-
-        # veg stream
-        print '   VEG stream ...'
-        outfile = get_temporary_directory() + self.experiment + '_jsbach_veg_mm_full.nc'
-        if os.path.exists(outfile):
-            pass
-        else:
-            codetable = self.data_dir + 'log/' + self.experiment + '_jsbach_veg.codes'
-            tmp = tempfile.mktemp(suffix='.nc', prefix=self.experiment + '_jsbach_veg_', dir=get_temporary_directory())  # temporary file
-            if len(glob.glob(self._get_filenames_veg_stream())) > 0:  # check if input files existing at all
-                cdo.mergetime(options='-f nc', output=tmp, input=self._get_filenames_veg_stream())
-                if os.path.exists(codetable):
-                    cdo.monmean(options='-f nc', output=outfile, input='-setpartab,' + codetable + ' ' + tmp)  # monmean needed here, as otherwise interface does not work
-                else:
-                    cdo.monmean(options='-f nc', output=outfile, input=tmp)  # monmean needed here, as otherwise interface does not work
-                os.remove(tmp)
-        self.files.update({'veg': outfile})
-
-        # veg land
-        print '   LAND stream ...'
-        outfile = get_temporary_directory() + self.experiment + '_jsbach_land_mm_full.nc'
-        if os.path.exists(outfile):
-            pass
-        else:
-            codetable = self.data_dir + 'log/' + self.experiment + '_jsbach_land.codes'
-            tmp = tempfile.mktemp(suffix='.nc', prefix=self.experiment + '_jsbach_land_', dir=get_temporary_directory())  # temporary file
-            if len(glob.glob(self._get_filenames_land_stream())) > 0:  # check if input files existing at all
-                cdo.mergetime(options='-f nc', output=tmp, input=self._get_filenames_land_stream())
-                if os.path.exists(codetable):
-                    cdo.monmean(options='-f nc', output=outfile, input='-setpartab,' + codetable + ' ' + tmp)  # monmean needed here, as otherwise interface does not work
-                else:
-                    cdo.monmean(options='-f nc', output=outfile, input=tmp)  # monmean needed here, as otherwise interface does not work
-                os.remove(tmp)
-        self.files.update({'land': outfile})
-
-        # surf stream
-        print '   SURF stream ...'
-        outfile = get_temporary_directory() + self.experiment + '_jsbach_surf_mm_full.nc'
-        if os.path.exists(outfile):
-            pass
-        else:
-            codetable = self.data_dir + 'log/' + self.experiment + '_jsbach_surf.codes'
-            tmp = tempfile.mktemp(suffix='.nc', prefix=self.experiment + '_jsbach_surf_', dir=get_temporary_directory())  # temporary file
-            if len(glob.glob(self._get_filenames_surf_stream())) > 0:  # check if input files existing at all
-                print glob.glob(self._get_filenames_surf_stream())
-                cdo.mergetime(options='-f nc', output=tmp, input=self._get_filenames_surf_stream())
-                if os.path.exists(codetable):
-                    cdo.monmean(options='-f nc', output=outfile, input='-setpartab,' + codetable + ' ' + tmp)  # monmean needed here, as otherwise interface does not work
-                else:
-                    cdo.monmean(options='-f nc', output=outfile, input=tmp)  # monmean needed here, as otherwise interface does not work
-                os.remove(tmp)
-
-        self.files.update({'surf': outfile})
-
-        # ECHAM BOT stream
-        print '   BOT stream ...'
-        outfile = get_temporary_directory() + self.experiment + '_echam6_echam_mm_full.nc'
-        if os.path.exists(outfile):
-            pass
-        else:
-            codetable = self.data_dir + 'log/' + self.experiment + '_echam6_echam.codes'
-            tmp = tempfile.mktemp(suffix='.nc', prefix=self.experiment + '_echam6_echam_', dir=get_temporary_directory())  # temporary file
-            if len(glob.glob(self._get_filenames_echam_BOT())) > 0:  # check if input files existing at all
-                cdo.mergetime(options='-f nc', output=tmp, input=self._get_filenames_echam_BOT())
-                if os.path.exists(codetable):
-                    cdo.monmean(options='-f nc', output=outfile, input='-setpartab,' + codetable + ' ' + tmp)  # monmean needed here, as otherwise interface does not work
-                else:
-                    cdo.monmean(options='-f nc', output=outfile, input=tmp)  # monmean needed here, as otherwise interface does not work
-                os.remove(tmp)
-        self.files.update({'echam': outfile})
-
-        # ALBEDO file
-        # albedo files as preprocessed by a script of Thomas
-        print '   ALBEDO VIS stream ...'
-        outfile = get_temporary_directory() + self.experiment + '_jsbach_VIS_albedo_mm_full.nc'
-        if os.path.exists(outfile):
-            pass
-        else:
-            if len(glob.glob(self._get_filenames_albedo_VIS())) > 0:  # check if input files existing at all
-                cdo.mergetime(options='-f nc', output=outfile, input=self._get_filenames_albedo_VIS())
-        self.files.update({'albedo_vis': outfile})
-
-        print '   ALBEDO NIR stream ...'
-        outfile = get_temporary_directory() + self.experiment + '_jsbach_NIR_albedo_mm_full.nc'
-        if os.path.exists(outfile):
-            pass
+        tmpdir = get_temporary_directory()
+        codes = self.data_dir + 'log/' + self.experiment
+
+        # stream, files, output file, code table (None: merge only)
+        streams = [('jsbach', self._get_filenames_jsbach_stream(), '_jsbach_mm_full.nc', '_jsbach.codes'),
+                   ('veg', self._get_filenames_veg_stream(), '_jsbach_veg_mm_full.nc', '_jsbach_veg.codes'),
+                   ('land', self._get_filenames_land_stream(), '_jsbach_land_mm_full.nc', '_jsbach_land.codes'),
+                   ('surf', self._get_filenames_surf_stream(), '_jsbach_surf_mm_full.nc', '_jsbach_surf.codes'),
+                   ('echam', self._get_filenames_echam_BOT(), '_echam6_echam_mm_full.nc', '_echam6_echam.codes'),
+                   # albedo files as preprocessed by a script of Thomas
+                   ('albedo_vis', self._get_filenames_albedo_VIS(), '_jsbach_VIS_albedo_mm_full.nc', None),
+                   ('albedo_nir', self._get_filenames_albedo_NIR(), '_jsbach_NIR_albedo_mm_full.nc', None)]
+
+        tasks = []
+        for stream, files, suffix, codetable in streams:
+            outfile = tmpdir + self.experiment + suffix
+            if codetable is not None:
+                codetable = codes + codetable
+            self.files.update({stream: outfile})
+            tasks.append((stream, files, outfile, codetable))
+
+        jobs = self.jobs
+        if jobs is None:
+            jobs = multiprocessing.cpu_count()
+        jobs = max(min(jobs, len(tasks)), 1)
+        if jobs == 1:
+            map(_preproc_stream, tasks)
         else:
-            if len(glob.glob(self._get_filenames_albedo_NIR())) > 0:  # check if input files existing at all
-                cdo.mergetime(options='-f nc', output=outfile, input=self._get_filenames_albedo_NIR())
-        self.files.update({'albedo_nir': outfile})
+            # the work is done by CDO processes, thus threads are sufficient
+            pool = ThreadPool(processes=jobs)
+            try:
+                pool.map(_preproc_stream, tasks)
+            finally:
+                pool.close()
+                pool.join()
 
     def _get_unique_name(self):
         """
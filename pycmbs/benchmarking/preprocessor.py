@@ -6,9 +6,13 @@ For COPYING and LICENSE details, please refer to the LICENSE file
 """
 
 import os
-import glob
 import tempfile
 
+from pycmbs.netcdf import NetCDFHandler
+from pycmbs.aggregation import EnsembleAggregator
+from pycmbs.benchmarking.file_index import get_file_index
+from pycmbs.benchmarking.utils import set_default_permissions
+
 
 class EnsemblePreprocessor(object):
     """
@@ -17,8 +21,9 @@ class EnsemblePreprocessor(object):
     which are stored in different files and provide functionality for
     ensemble statistic calculations
 
-    The processor basically provides a logic. Number crunching is
-    exclusively done using the CDO's
+    The processor basically provides a logic. Temporal merging of
+    files is done using the CDO's, ensemble statistics are calculated
+    in a single pass over the ensemble members (see ensemble_mean())
     """
 
     def __init__(self, data_dir, outfile, **kwargs):
@@ -152,8 +157,6 @@ class CMIP5Preprocessor(EnsemblePreprocessor):
             ofile += '_' + str(start_time)[0:10] + '_' + str(stop_time)[0:10]
         ofile += '.nc'
 
-        self.mergetime_files.append(ofile)
-
         # cdo
         if selstr == '':
             cmd = 'cdo -f nc mergetime ' + fstr + ' ' + ofile
@@ -169,6 +172,7 @@ class CMIP5Preprocessor(EnsemblePreprocessor):
                 tmp_s = 'Error in creating temporary file: ABORT! ' + self.model + ' ' + self.experiment + ' ' + tmpfile
                 print tmp_s
                 self._log(tmp_s)
+                raise ValueError(tmp_s)
 
             cmd = 'cdo -f nc ' + selstr + ' ' + tmpfile + ' ' + ofile
 
@@ -183,92 +187,292 @@ class CMIP5Preprocessor(EnsemblePreprocessor):
 
         print('Doing temporal preprocessing for ensemble member ... %s' % n)
         os.system(cmd)
-        if os.path.exists(ofile):  # just ensure that everything wen well
-            self.mergetime_files.append(ofile)
+        if selstr != '':
+            os.remove(tmpfile)
+        if not os.path.exists(ofile):  # just ensure that everything went well
+            tmp_s = 'Error in temporal preprocessing of ensemble member: ' + self.model + ' ' + self.experiment + ' ' + str(n)
+            self._log(tmp_s)
+            raise ValueError(tmp_s)
+        self.mergetime_files.append(ofile)
 
 
     def get_ensemble_files(self, maxens=50):
         """
         create a dictionary with filenames for the different ensemble
-        members
+        members. The files are obtained from the index of the data
+        directory (see CMIP5FileIndex)
 
         Parameters
         ----------
         maxens : int
             maximum ensemble member size
         """
+        prefix = self.variable + '_' + self.mip + '_' + self.model + '_' + self.experiment + '_r'
+        ens = get_file_index(self.data_dir).get_ensembles(
+            institute=self.institute, model=self.model,
+            experiment=self.experiment, frequency='mon', realm=self.realm,
+            mip=self.mip, variable=self.variable)
 
         # create filelist for each ensemble
         res = {}
-        cnt = 0
-        for i in xrange(1, maxens + 1):
-            w1 = self._get_file_wildcard(i)
-            files = glob.glob(w1)
-            cnt += len(files)
+        for i in ens.keys():
+            if i > maxens:
+                continue
+            files = [f for f in ens[i] if os.path.basename(f).startswith(prefix)]
             if len(files) > 0:
                 res.update({i: files})
 
         self.ensemble_files = res
 
-    def _get_file_wildcard(self, ens):
-        p = self.data_dir + self.institute + os.sep + self.model + os.sep + self.experiment + os.sep + 'mon' + os.sep + self.realm + os.sep + self.mip + os.sep + 'r' + str(ens) + 'i1p1' + os.sep + self.variable + os.sep + self.variable + '_' + self.mip + '_' + self.model + '_' + self.experiment + '_r' + '*.nc'
-        return p
-
     def mergetime_ensembles(self, delete=False, start_time=None, stop_time=None):
         self.get_ensemble_files()
         for i in self.ensemble_files.keys():
             self.mergetime(i, delete=delete, start_time=start_time, stop_time=stop_time)
 
-    def ensemble_mean(self, delete=False, start_time=None, stop_time=None):
+    def ensemble_mean(self, delete=False, start_time=None, stop_time=None, chunk_size=120):
         """
+        calculate the ensemble statistics (mean, standard deviation,
+        minimum, maximum and number of valid members) of all ensemble
+        members. The members are read in temporal chunks and all
+        statistics are obtained in a single pass over the data.
+
+        The names of the resulting files are available afterwards by
+        self.outfile_ensmean, self.outfile_ensstd, self.outfile_ensmin,
+        self.outfile_ensmax and self.outfile_enscount
+
         Parameters
         ----------
+        delete : bool
+            recalculate the statistics if the output files are already
+            existing; otherwise no processing is done in that case
         start_time : datetime
             start time of period
         stop_time : datetime
             end time of period
+        chunk_size : int
+            number of timesteps read at once from each member
         """
         print('Doing ensemble mean calculation ...')
         # if temporal merged files are not yet there, do preprocessing
         if len(self.mergetime_files) < 2:
             self.mergetime_ensembles(delete=delete, start_time=start_time, stop_time=stop_time)
 
-        if len(self.mergetime_files) < 2:
-            print self.mergetime_files
-            print 'No ensemble mean calculation possible as not enough files!'
-            self._log('No ensemble mean calculation possible as not enough files! ' + self.institute + ' ' + self.model + ' ' + self.experiment)
-
-        fstr = self._filelist(self.mergetime_files)
+        files = []
+        for f in self.mergetime_files:
+            if f not in files:
+                files.append(f)
+        if len(files) == 0:
+            tmp_s = 'No ensemble mean calculation possible as no files are available! ' + self.institute + ' ' + self.model + ' ' + self.experiment
+            self._log(tmp_s)
+            raise ValueError(tmp_s)
+        if len(files) < 2:
+            self._log('Only a single ensemble member available! ' + self.institute + ' ' + self.model + ' ' + self.experiment)
 
-        # ensemble mean calculation
         ofile = self.output_dir + self.outfile
         ofile = os.path.splitext(ofile)[0]
         if start_time is not None:
             ofile += '_' + str(start_time)[0:10] + '_' + str(stop_time)[0:10]
-        #~ ofile += '.nc'
         self.outfile = ofile
         self.outfile_ensmean = self.outfile + '_ensmean.nc'
-        cmd = 'cdo -f nc ensmean ' + fstr + ' ' + self.outfile_ensmean
-        if os.path.exists(ofile):
-            if delete:
-                os.remove(ofile)
-                os.system(cmd)
+        self.outfile_ensstd = self.outfile + '_ensstd.nc'
+        self.outfile_ensmin = self.outfile + '_ensmin.nc'
+        self.outfile_ensmax = self.outfile + '_ensmax.nc'
+        self.outfile_enscount = self.outfile + '_enscount.nc'
+        outfiles = {'mean': self.outfile_ensmean, 'std': self.outfile_ensstd,
+                    'min': self.outfile_ensmin, 'max': self.outfile_ensmax,
+                    'count': self.outfile_enscount}
+
+        if all([os.path.exists(f) for f in outfiles.values()]) and not delete:
+            print('File already existing ... no processing is done')
+            return
+
+        try:
+            _ensemble_statistics(files, self.variable, outfiles, chunk_size=chunk_size)
+        except Exception as e:
+            self._log('Error in ensemble statistics: ' + self.model + ' ' + self.experiment + ' ' + str(e))
+            raise
+
+
+def _ensemble_statistics(files, varname, outfiles, chunk_size=120):
+    """
+    calculate ensemble statistics of a variable in a single pass over
+    the ensemble members. The members are read in temporal chunks.
+    Coordinates and attributes are taken from the first member.
+
+    The output files are first written to temporary files which are
+    renamed when all statistics have been calculated successfully.
+    Thus no incomplete output files remain in case of errors.
+
+    Parameters
+    ----------
+    files : list
+        files of the ensemble members; all members need to have the
+        same geometry [time,...]
+    varname : str
+        name of the variable
+    outfiles : dict
+        output filenames for the statistics ['mean','std','min','max','count']
+    chunk_size : int
+        number of timesteps read at once from each member
+    """
+    if len(files) == 0:
+        raise ValueError('No ensemble members provided!')
+    for k in outfiles.keys():
+        if k not in ['mean', 'std', 'min', 'max', 'count']:
+            raise ValueError('Invalid ensemble statistic: %s' % k)
+
+    members = []
+    outputs = {}
+    tmpfiles = {}
+    success = False
+    try:
+        for f in files:
+            F = NetCDFHandler()
+            F.open_file(f, 'r')
+            members.append(F)
+            if varname not in F.get_variable_keys():
+                raise ValueError('Variable %s not existing in file %s' % (varname, f))
+            if F.get_variable_handler(varname).shape != members[0].get_variable_handler(varname).shape:
+                raise ValueError('Inconsistent geometry of ensemble member %s' % f)
+
+        shape = members[0].get_variable_handler(varname).shape
+        if len(shape) == 0:
+            raise ValueError('Ensemble statistics need a variable with time dimension!')
+        for k in outfiles.keys():
+            h, tmpfiles[k] = tempfile.mkstemp(suffix='.nc.tmp', dir=os.path.dirname(os.path.abspath(outfiles[k])))
+            os.close(h)
+            outputs[k] = _create_ensemble_file(members[0], varname, tmpfiles[k], k)
+
+        for i1 in xrange(0, shape[0], chunk_size):
+            i2 = min(i1 + chunk_size, shape[0])
+            A = EnsembleAggregator((i2 - i1,) + tuple(shape[1:]))
+            for F in members:
+                A.add(F.get_variable_handler(varname)[i1:i2])
+            res = {'mean': A.mean, 'std': A.std, 'min': A.min,
+                   'max': A.max, 'count': A.count}
+            for k in outputs.keys():
+                outputs[k].get_variable_handler(varname)[i1:i2] = res[k]()
+        success = True
+    finally:
+        for F in members:
+            F.close()
+        for F in outputs.values():
+            F.close()
+        if not success:
+            for f in tmpfiles.values():
+                if os.path.exists(f):
+                    os.remove(f)
+
+    for k in tmpfiles.keys():
+        set_default_permissions(tmpfiles[k])
+        os.rename(tmpfiles[k], outfiles[k])
+
+
+def _create_ensemble_file(ref, varname, filename, statistic):
+    """
+    create an output file for an ensemble statistic with the
+    dimensions, coordinates and attributes of a reference file
+
+    Parameters
+    ----------
+    ref : NetCDFHandler
+        reference file (first ensemble member)
+    varname : str
+        name of the variable
+    filename : str
+        name of the output file
+    statistic : str
+        name of the statistic
+
+    Returns
+    -------
+    F : NetCDFHandler
+        handler of the output file opened for writing
+    """
+    F = NetCDFHandler()
+    F.open_file(filename, 'w')
+    for k in ref.F.ncattrs():
+        F.F.setncattr(k, ref.F.getncattr(k))
+    for d in ref.F.dimensions.values():
+        F.create_dimension(d.name, size=None if d.isunlimited() else len(d))
+
+    skip = ['_FillValue', 'missing_value', 'scale_factor', 'add_offset']
+    for k in ref.get_variable_keys():
+        v = ref.get_variable_handler(k)
+        if k == varname:
+            if statistic == 'count':
+                F.create_variable(k, 'i4', v.dimensions)
             else:
-                print('File already existing ... no processing is done')
+                dtype = v.dtype if v.dtype.kind == 'f' else 'f8'
+                fill_value = ref._get_fill_value(k)
+                F.create_variable(k, dtype, v.dimensions,
+                                  fill_value=1.E20 if fill_value is None else fill_value)
         else:
-            os.system(cmd)
-
-        # ensemble standard deviation
-        self.outfile_ensstd = self.outfile_ensmean.replace('_ensmean', '_ensstd')
-        cmd = 'cdo -f nc ensstd ' + fstr + ' ' + self.outfile_ensstd
-        if os.path.exists(self.outfile_ensstd):
-            if delete:
-                os.remove(self.outfile_ensstd)
-                os.system(cmd)
-            else:
-                print('File already existing ... no processing is done')
+            F.create_variable(k, v.dtype, v.dimensions,
+                              fill_value=getattr(v, '_FillValue', None))
+        o = F.get_variable_handler(k)
+        for a in v.ncattrs():
+            if a not in skip:
+                o.setncattr(a, v.getncattr(a))
+        if k == varname:
+            o.setncattr('ensemble_statistic', statistic)
+            if statistic == 'count':
+                o.setncattr('units', '1')
+                o.setncattr('long_name', 'number of valid ensemble members')
         else:
-            os.system(cmd)
+            o[:] = v[:]
+    return F
+
+
+def _ensemble_mean_task(args):
+    """
+    calculate the ensemble statistics for a single preprocessor
+    (helper for ensemble_statistics())
+    """
+    P, kwargs = args
+    try:
+        P.ensemble_mean(**kwargs)
+    except Exception as e:
+        return P, '%s %s %s: %s' % (P.model, P.experiment, P.variable, str(e))
+    return P, None
+
+
+def ensemble_statistics(preprocessors, n_jobs=1, **kwargs):
+    """
+    calculate the ensemble statistics for several preprocessors
+    (e.g. for different models and experiments) in parallel
+
+    Parameters
+    ----------
+    preprocessors : list
+        list of CMIP5Preprocessor objects
+    n_jobs : int
+        number of processes to use
+    kwargs : dict
+        arguments passed to ensemble_mean()
+
+    Returns
+    -------
+    preprocessors : list
+        the preprocessors after processing; the names of the
+        output files are available as attributes (outfile_ensmean, ...)
+    """
+    tasks = [(P, kwargs) for P in preprocessors]
+    if (n_jobs > 1) and (len(tasks) > 1):
+        from multiprocessing import Pool
+        pool = Pool(processes=min(n_jobs, len(tasks)))
+        try:
+            results = pool.map(_ensemble_mean_task, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_ensemble_mean_task(task) for task in tasks]
+
+    errors = [e for P, e in results if e is not None]
+    if len(errors) > 0:
+        raise ValueError('Ensemble statistics failed for: ' + '; '.join(errors))
+    return [P for P, e in results]
 
 
 class CMIP5ModelParser(object):
@@ -296,7 +500,7 @@ class CMIP5ModelParser(object):
 
     def get_institutes(self):
         """ get a list with all institutes """
-        return [os.path.basename(f) for f in glob.glob(self.root_dir + '*')]
+        return get_file_index(self.root_dir).get_subdirectories()
 
     def get_all_models(self):
         """ get a list with all models and institutes """
@@ -307,20 +511,35 @@ class CMIP5ModelParser(object):
 
     def _get_models4institute(self, institute):
         """ return a list of models from a particular institute """
-        return [os.path.basename(f) for f in glob.glob(self.root_dir + institute + os.sep + '*')]
+        return get_file_index(self.root_dir).get_subdirectories(institute)
 
-    def check_files_availablility(self, vars, institute, model, experiment):
+    def check_files_availablility(self, vars, institute, model, experiment, mip=None, realm=None):
         """
         check if files for the specified variables are existing
-        in preprocessed form
 
         Parameters
         ----------
         vars : list
-            list of variables to check e.g. ['rsds', 'rsus']; the
+            list of variables to check e.g. ['rsds', 'rsus']
+        institute : str
+            name of institute
+        model : str
+            name of model
+        experiment : str
+            experiment tag (e.g. 'amip')
+        mip : str
+            MIP (e.g. 'Amon'); if None, any MIP is accepted
+        realm : str
+            realm (e.g. 'atmos'); if None, any realm is accepted
 
         Returns
         -------
         returns True if all files are existing, otherwise it returns False
         """
-        raise ValueError('This functionality is not implemented yet!')
+        index = get_file_index(self.root_dir)
+        for v in vars:
+            if len(index.get_files(institute=institute, model=model,
+                                   experiment=experiment, mip=mip,
+                                   realm=realm, variable=v)) == 0:
+                return False
+        return True
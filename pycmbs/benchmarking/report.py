@@ -18,7 +18,8 @@ class Report(object):
 
     def __init__(self, filename, title, author, format='png',
                  outdir='./', dpi=300, logofile='Phytonlogo5.pdf',
-                 usehyperlinks=True, autocompile=True):
+                 usehyperlinks=True, autocompile=True, fragment=False,
+                 figure_prefix=''):
         """
         constructor for Latex report class
 
@@ -43,6 +44,13 @@ class Report(object):
         autocompile : bool
             ensure automatic PDF creation when
             report is closed
+        fragment : bool
+            generate only a part of a report without document
+            header and footer. Fragments can be included into
+            another report using include_fragment()
+        figure_prefix : str
+            prefix for figure filenames and labels; needed if several
+            reports write their figures to the same directory
         """
 
         ext = ''
@@ -56,6 +64,8 @@ class Report(object):
         # needs to be before open()
         self.logofile = logofile
         self.usehyperlinks = usehyperlinks
+        self.fragment = fragment
+        self.figure_prefix = figure_prefix
         self.open()
         self.figure_counter = 0
         self.dpi = dpi
@@ -69,10 +79,14 @@ class Report(object):
             os.remove(self.filename)
         self.landscape = landscape
         self.file = open(self.filename, 'w')
-        self._write_header()
+        if not self.fragment:
+            self._write_header()
 
     def close(self):
         """ close report """
+        if self.fragment:
+            self.file.close()
+            return
         self._write_footer()
         self.file.close()
         if self.autocompile:
@@ -169,7 +183,7 @@ class Report(object):
             return
 
         self.figure_counter += 1
-        figname = 'fig_' + str(self.figure_counter).zfill(5) + '.' + self.format
+        figname = 'fig_' + self.figure_prefix + str(self.figure_counter).zfill(5) + '.' + self.format
         self._include_figure(figname, caption=caption, width=width, height=height)
 
         print('Saving figure %s' % self.outdir + figname)
@@ -186,7 +200,7 @@ class Report(object):
                    + figname + '} ')
         if len(caption) > 0:
             self.write('   \caption{' + caption.replace('_', '-').replace('#', '-') + '}')
-            self.write('   \label{fig:' + str(self.figure_counter) + '}')
+            self.write('   \label{fig:' + self.figure_prefix + str(self.figure_counter) + '}')
         self.write('\\end{figure}')
         self._write_separator()
 
@@ -287,6 +301,21 @@ class Report(object):
         self.write('    \caption{' + caption.replace('_', '-').replace('#', '-') + '}')
         self.write('\end{table}')
 
+    def include_fragment(self, filename):
+        """
+        copy the content of a report fragment into the report
+
+        Parameters
+        ----------
+        filename : str
+            name of the file of the fragment (see Report(fragment=True))
+        """
+        if not os.path.exists(filename):
+            raise ValueError('Report fragment not existing: %s' % filename)
+        f = open(filename, 'r')
+        self.file.write(f.read())
+        f.close()
+
     def input(self, filename):
         """ write an input statement """
         self.write('\\input{' + filename + '}')
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of pyCMBS.
+(c) 2012- Alexander Loew
+For COPYING and LICENSE details, please refer to the LICENSE file
+"""
+
+import unittest
+import os
+import time
+import shutil
+import tempfile
+
+from pycmbs.benchmarking.cache import PreprocessingCache
+
+
+class TestPreprocessingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache_dir = self.dir + os.sep + 'cache' + os.sep
+        self.raw = self.dir + os.sep + 'raw.nc'
+        self._write(self.raw, 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, filename, n):
+        f = open(filename, 'w')
+        f.write('x' * n)
+        f.close()
+
+    def test_key(self):
+        C = PreprocessingCache(directory=self.cache_dir)
+        k1 = C.get_key('monmean -remapcon,t63grid', files=[self.raw], options='-f nc')
+        k2 = C.get_key('monmean -remapcon,t63grid', files=[self.raw], options='-f nc')
+        self.assertEqual(k1, k2)
+        # different operator chain, options or grid
+        self.assertNotEqual(k1, C.get_key('monmean -remapbil,t63grid', files=[self.raw], options='-f nc'))
+        self.assertNotEqual(k1, C.get_key('monmean -remapcon,t63grid', files=[self.raw], options='-f nc -b 32'))
+        # changed input file
+        time.sleep(0.01)
+        self._write(self.raw, 200)
+        self.assertNotEqual(k1, C.get_key('monmean -remapcon,t63grid', files=[self.raw], options='-f nc'))
+        with self.assertRaises(ValueError):
+            C.get_key('monmean', files=[self.dir + os.sep + 'nofile.nc'])
+
+    def test_lookup_store(self):
+        C = PreprocessingCache(directory=self.cache_dir)
+        k = C.get_key('monmean', files=[self.raw])
+        self.assertEqual(C.lookup(k), None)
+        tmp = self.dir + os.sep + 'result.nc'
+        self._write(tmp, 50)
+        f = C.store(k, tmp, description='test')
+        self.assertFalse(os.path.exists(tmp))
+        self.assertTrue(os.path.exists(f))
+        self.assertEqual(C.lookup(k), f)
+        s = C.get_statistics()
+        self.assertEqual(s['hits'], 1)
+        self.assertEqual(s['misses'], 1)
+        self.assertEqual(s['entries'], 1)
+
+        # a second instance uses the same manifest
+        C1 = PreprocessingCache(directory=self.cache_dir)
+        self.assertEqual(C1.lookup(k), f)
+
+    def test_eviction(self):
+        # maximum size of 2.5 kB
+        C = PreprocessingCache(directory=self.cache_dir, max_size=2.5 / 1024., min_age=0.)
+        files = []
+        for i in range(3):
+            k = C.get_key('op%i' % i)
+            tmp = self.dir + os.sep + 'result.nc'
+            self._write(tmp, 1024)
+            files.append(C.store(k, tmp))
+            time.sleep(0.01)
+        # the least recently used entry was removed
+        self.assertFalse(os.path.exists(files[0]))
+        self.assertTrue(os.path.exists(files[1]))
+        self.assertTrue(os.path.exists(files[2]))
+        self.assertEqual(C.get_statistics()['entries'], 2)
+
+        # files not registered in the manifest are taken into account
+        orphan = C.get_filename('orphan')
+        self._write(orphan, 1024)
+        os.utime(orphan, (time.time() - 10., time.time() - 10.))
+        self.assertEqual(C.lookup(C.get_key('op1')), files[1])
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(C.get_statistics()['entries'], 2)
+
+        # an entry removed by another process is a miss
+        os.remove(files[2])
+        self.assertEqual(C.lookup(C.get_key('op2')), None)
+
+    def test_min_age(self):
+        # recently used entries are kept, even if the size is exceeded
+        C = PreprocessingCache(directory=self.cache_dir, max_size=1.5 / 1024.)
+        files = []
+        for i in range(2):
+            tmp = self.dir + os.sep + 'result.nc'
+            self._write(tmp, 1024)
+            files.append(C.store(C.get_key('op%i' % i), tmp))
+        self.assertTrue(os.path.exists(files[0]))
+        self.assertTrue(os.path.exists(files[1]))
+
+        # only entries which have not been used within min_age are removed
+        C.min_age = 1.
+        tmp = self.dir + os.sep + 'result.nc'
+        self._write(tmp, 1024)
+        k = C.get_key('op2')
+        time.sleep(1.1)
+        C.lookup(C.get_key('op1'))
+        f = C.store(k, tmp)
+        self.assertFalse(os.path.exists(files[0]))
+        self.assertTrue(os.path.exists(files[1]))
+        self.assertTrue(os.path.exists(f))
+
+    def test_add_statistics(self):
+        C = PreprocessingCache(directory=self.cache_dir)
+        C.lookup(C.get_key('op'))
+        C.add_statistics(3, 2)
+        s = C.get_statistics()
+        self.assertEqual(s['hits'], 3)
+        self.assertEqual(s['misses'], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
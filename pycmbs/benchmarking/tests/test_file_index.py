@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of pyCMBS.
+(c) 2012- Alexander Loew
+For COPYING and LICENSE details, please refer to the LICENSE file
+"""
+
+import unittest
+import os
+import time
+import shutil
+import tempfile
+
+from pycmbs.benchmarking.file_index import CMIP5FileIndex
+from pycmbs.benchmarking import preprocessor
+
+
+class TestFileIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.root = self.dir + os.sep + 'archive' + os.sep
+        self.index_file = self.dir + os.sep + 'index.json'
+        for model in ['MPI-ESM-LR', 'MPI-ESM-MR']:
+            for ens in [1, 2, 3]:
+                for period in ['197901-198812', '198901-200812']:
+                    self._add_file(model, ens, 'tas', period)
+        self._add_file('MPI-ESM-LR', 1, 'pr', '197901-200812')
+        self._set_past(self.dir)
+
+        self._tempdir = os.environ.get('CDOTEMPDIR')
+        os.environ['CDOTEMPDIR'] = self.dir
+
+    def tearDown(self):
+        if self._tempdir is None:
+            os.environ.pop('CDOTEMPDIR')
+        else:
+            os.environ['CDOTEMPDIR'] = self._tempdir
+        shutil.rmtree(self.dir)
+
+    def _get_path(self, model, ens, variable):
+        return self.root + os.sep.join(['MPI-M', model, 'amip', 'mon', 'atmos', 'Amon', 'r%ii1p1' % ens, variable]) + os.sep
+
+    def _add_file(self, model, ens, variable, period):
+        path = self._get_path(model, ens, variable)
+        if not os.path.exists(path):
+            os.makedirs(path)
+        filename = path + variable + '_Amon_' + model + '_amip_r%ii1p1_' % ens + period + '.nc'
+        open(filename, 'w').close()
+        return filename
+
+    def _set_past(self, directory):
+        # modification times well before the index is created
+        t = time.time() - 100.
+        for root, dirs, files in os.walk(directory):
+            os.utime(root, (t, t))
+
+    def test_query(self):
+        I = CMIP5FileIndex(self.root, index_file=self.index_file)
+        self.assertEqual(I.get_subdirectories(), ['MPI-M'])
+        self.assertEqual(I.get_subdirectories('MPI-M'), ['MPI-ESM-LR', 'MPI-ESM-MR'])
+        self.assertEqual(len(I.get_files()), 13)
+        self.assertEqual(len(I.get_files(model='MPI-ESM-LR', variable='tas')), 6)
+        self.assertEqual(I.get_files(variable='pr'), [self._get_path('MPI-ESM-LR', 1, 'pr') + 'pr_Amon_MPI-ESM-LR_amip_r1i1p1_197901-200812.nc'])
+        r = I.query(model='MPI-ESM-MR', ensemble='r2i1p1', variable='tas')
+        self.assertEqual([(e['start'], e['stop']) for e in r], [('197901', '198812'), ('198901', '200812')])
+        self.assertEqual(r[0]['institute'], 'MPI-M')
+
+        ens = I.get_ensembles(model='MPI-ESM-LR', variable='tas')
+        self.assertEqual(sorted(ens.keys()), [1, 2, 3])
+        self.assertEqual(len(ens[2]), 2)
+        with self.assertRaises(ValueError):
+            I.get_files(version='v1')
+
+        # same results as filtering all files of the archive
+        sel = {'institute': 'MPI-M', 'model': 'MPI-ESM-MR', 'experiment': 'amip',
+               'frequency': 'mon', 'realm': 'atmos', 'mip': 'Amon'}
+        for kwargs in [sel, dict(sel, variable='tas'), dict(sel, ensemble='r3i1p1'),
+                       {'mip': 'Amon', 'variable': 'pr'}, {'realm': 'ocean'},
+                       {'model': 'MPI-M' + os.sep + 'MPI-ESM-LR'}]:
+            ref = [r for r in I.query()
+                   if all([r[k] == v for k, v in kwargs.items()])]
+            self.assertEqual(I.query(**kwargs), ref)
+        self.assertEqual(len(I.get_files(**sel)), 6)
+        self.assertEqual(I.get_files(model='MPI-M' + os.sep + 'MPI-ESM-LR'), [])
+
+    def test_update(self):
+        I = CMIP5FileIndex(self.root, index_file=self.index_file)
+        self.assertEqual(I.scanned, 25)  # all directories listed
+        self.assertEqual(I.update(), 0)
+
+        # only the modified directory is listed again
+        f = self._add_file('MPI-ESM-LR', 2, 'tas', '200901-201012')
+        self._set_past(self._get_path('MPI-ESM-LR', 2, 'tas'))
+        J = CMIP5FileIndex(self.root, index_file=self.index_file)
+        self.assertEqual(J.scanned, 1)
+        self.assertTrue(f in J.get_files(model='MPI-ESM-LR', ensemble='r2i1p1'))
+
+        # persistent index without update
+        os.remove(f)
+        K = CMIP5FileIndex(self.root, index_file=self.index_file, update=False)
+        self.assertEqual(len(K.get_files()), 14)
+        K.update()
+        self.assertEqual(len(K.get_files()), 13)
+
+    def test_preprocessor(self):
+        P = preprocessor.CMIP5Preprocessor(self.root, self.dir + os.sep + 'out' + os.sep + 'tas.nc', 'tas', 'MPI-ESM-MR', 'amip', institute='MPI-M', mip='Amon', realm='atmos')
+        P.get_ensemble_files(maxens=2)
+        self.assertEqual(sorted(P.ensemble_files.keys()), [1, 2])
+        self.assertEqual(len(P.ensemble_files[1]), 2)
+
+        C = preprocessor.CMIP5ModelParser(self.root)
+        self.assertEqual(C.get_all_models(), {'MPI-M': ['MPI-ESM-LR', 'MPI-ESM-MR']})
+        self.assertTrue(C.check_files_availablility(['tas', 'pr'], 'MPI-M', 'MPI-ESM-LR', 'amip'))
+        self.assertFalse(C.check_files_availablility(['tas', 'pr'], 'MPI-M', 'MPI-ESM-MR', 'amip'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,9 +7,11 @@ For COPYING and LICENSE details, please refer to the LICENSE file
 
 import unittest
 from pycmbs.benchmarking import models
+from pycmbs.benchmarking.models import mpi_esm
 
 from pycmbs.data import Data
 import os
+import stat
 import scipy as sc
 import matplotlib.pylab as pl
 import numpy as np
@@ -109,6 +111,37 @@ class TestPycmbsBenchmarkingModels(unittest.TestCase):
         self.assertTrue(os.path.exists(f))
         self.assertEqual(f, testfile)
 
+    def test_jsbach_preproc_stream(self):
+        odir = tempfile.mkdtemp() + os.sep
+        outfile = odir + 'exp_jsbach_VIS_albedo_mm_full.nc'
+
+        # no input files: nothing is done
+        r = mpi_esm._preproc_stream(('albedo_vis', odir + 'exp_*_VIS_albedo.nc', outfile, None))
+        self.assertEqual(r, outfile)
+        self.assertFalse(os.path.exists(outfile))
+
+        # merge files of stream
+        D = Data(None, None)
+        D._init_sample_object(nt=5, ny=2, nx=3)
+        D.save(odir + 'exp_0002_VIS_albedo.nc', varname='albedo', delete=True)
+        D.time = D.time - 5.
+        D.save(odir + 'exp_0001_VIS_albedo.nc', varname='albedo', delete=True)
+        mpi_esm._preproc_stream(('albedo_vis', odir + 'exp_*_VIS_albedo.nc', outfile, None))
+        self.assertTrue(os.path.exists(outfile))
+        self.assertEqual([f for f in os.listdir(odir) if f.endswith('.tmp')], [])
+        # permissions like for other newly created files
+        self.assertEqual(stat.S_IMODE(os.stat(outfile).st_mode),
+                         stat.S_IMODE(os.stat(odir + 'exp_0001_VIS_albedo.nc').st_mode))
+        M = Data(outfile, 'albedo', read=True)
+        self.assertEqual(len(M.time), 10)
+        self.assertTrue(np.all(np.diff(M.time) > 0.))
+
+        # existing output is not touched
+        t = os.path.getmtime(outfile)
+        mpi_esm._preproc_stream(('albedo_vis', odir + 'exp_*_VIS_albedo.nc', outfile, None))
+        self.assertEqual(os.path.getmtime(outfile), t)
+        os.system('rm -rf ' + odir)
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -7,6 +7,11 @@ For COPYING and LICENSE details, please refer to the LICENSE file
 
 import unittest
 import os
+import stat
+import shutil
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
 from pycmbs.benchmarking import preprocessor
 
 class TestPreprocessor(unittest.TestCase):
@@ -18,6 +23,77 @@ class TestPreprocessor(unittest.TestCase):
     def test_StubTest(self):
         self.assertEqual(1, 1)
 
+    def _write_member(self, filename, x):
+        F = Dataset(filename, 'w')
+        F.createDimension('time', None)
+        F.createDimension('lat', x.shape[1])
+        F.createDimension('lon', x.shape[2])
+        t = F.createVariable('time', 'f8', ('time',))
+        t.units = 'days since 2000-01-01 00:00:00'
+        t[:] = np.arange(len(x))
+        lat = F.createVariable('lat', 'f8', ('lat',))
+        lat[:] = np.linspace(-45., 45., x.shape[1])
+        v = F.createVariable('tas', 'f4', ('time', 'lat', 'lon'), fill_value=-999.)
+        v.units = 'K'
+        v[:] = x
+        F.close()
+
+    def test_ensemble_statistics(self):
+        tdir = tempfile.mkdtemp()
+        x = np.ma.array(np.random.random((4, 11, 3, 5)) * 10. + 280.).astype('float32')
+        x[1, 2, 1, 1] = np.ma.masked
+        x[:, 3, 0, 0] = np.ma.masked
+        files = []
+        for i in xrange(len(x)):
+            files.append(tdir + os.sep + 'member_%i.nc' % i)
+            self._write_member(files[-1], x[i])
+
+        outfiles = {}
+        for k in ['mean', 'std', 'min', 'max', 'count']:
+            outfiles[k] = tdir + os.sep + 'ens' + k + '.nc'
+        preprocessor._ensemble_statistics(files, 'tas', outfiles, chunk_size=4)
+
+        x = x.astype('float')
+        ref = {'mean': x.mean(axis=0), 'std': x.std(axis=0), 'min': x.min(axis=0),
+               'max': x.max(axis=0), 'count': x.count(axis=0)}
+        for k in outfiles.keys():
+            F = Dataset(outfiles[k], 'r')
+            r = F.variables['tas'][:]
+            self.assertTrue(np.all(F.variables['time'][:] == np.arange(11)))
+            F.close()
+            self.assertEqual(r.shape, (11, 3, 5))
+            self.assertTrue(np.all(np.ma.getmaskarray(r) == np.ma.getmaskarray(ref[k])))
+            self.assertTrue(np.all(np.abs(r - ref[k]) < 1.E-3))
+        self.assertEqual(len(os.listdir(tdir)), 9)  # no temporary files left
+        # permissions like for other newly created files
+        self.assertEqual(stat.S_IMODE(os.stat(outfiles['mean']).st_mode),
+                         stat.S_IMODE(os.stat(files[0]).st_mode))
+
+        # members of different length; no output is generated
+        self._write_member(files[0], x[0, 0:5])
+        os.remove(outfiles['mean'])
+        with self.assertRaises(ValueError):
+            preprocessor._ensemble_statistics(files, 'tas', outfiles)
+        with self.assertRaises(ValueError):
+            preprocessor._ensemble_statistics(files[1:], 'pr', outfiles)
+        self.assertFalse(os.path.exists(outfiles['mean']))
+        self.assertEqual(len(os.listdir(tdir)), 8)
+        shutil.rmtree(tdir)
+
+    def test_ensemble_statistics_errors(self):
+        # no ensemble members available
+        tdir = tempfile.mkdtemp()
+        tempdir = os.environ.get('CDOTEMPDIR')
+        os.environ['CDOTEMPDIR'] = tdir  # location of the file index
+        P = preprocessor.CMIP5Preprocessor(tdir, tdir + os.sep + 'test_file', 'tas', 'model', 'experiment', institute='MPI', mip='Amon', realm='atmos')
+        with self.assertRaises(ValueError):
+            preprocessor.ensemble_statistics([P, P], n_jobs=1)
+        if tempdir is None:
+            os.environ.pop('CDOTEMPDIR')
+        else:
+            os.environ['CDOTEMPDIR'] = tempdir
+        shutil.rmtree(tdir)
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -7,7 +7,11 @@ For COPYING and LICENSE details, please refer to the LICENSE file
 
 import unittest
 import os
+import stat
+import tempfile
+import numpy as np
 import pycmbs.benchmarking.utils as utils
+from pycmbs.data import Data
 
 
 class TestUtils(unittest.TestCase):
@@ -81,6 +85,51 @@ class TestUtils(unittest.TestCase):
         r = utils.get_temporary_directory()
         self.assertEqual(r, './')
 
+    def test_set_default_permissions(self):
+        fd, f = tempfile.mkstemp(dir=os.environ['CDOTEMPDIR'])
+        os.close(fd)
+        umask = os.umask(0)
+        os.umask(umask)
+        utils.set_default_permissions(f)
+        self.assertEqual(stat.S_IMODE(os.stat(f).st_mode), 0666 & ~umask)
+
+    def test_landseamask_provider(self):
+        calls = []
+
+        def _generate():
+            calls.append(1)
+            D = Data(None, None)
+            D._init_sample_object(nt=None, ny=4, nx=5)
+            D.data = D.data > 0.5
+            return D
+
+        P = utils.LandSeaMaskProvider(max_entries=2)
+        m1 = P.get(('t63', 'land', True, False), _generate)
+        m2 = P.get(('t63', 'land', True, False), _generate)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(P.hits, 1)
+        self.assertTrue(np.all(m1.data == m2.data))
+        self.assertTrue(np.all(m1.lat == m2.lat))
+        with self.assertRaises(ValueError):
+            m1.data[0, 0] = True
+        with self.assertRaises(ValueError):
+            m1.lat[0, 0] = 0.
+        m1.label = 'changed'
+        self.assertNotEqual(m2.label, 'changed')
+
+        # bounded number of masks
+        P.get(('t63', 'ocean', True, False), _generate)
+        P.get(('t63', 'land', True, False), _generate)
+        P.get(('t63', 'land', False, False), _generate)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(P), 2)
+        P.get(('t63', 'ocean', True, False), _generate)
+        self.assertEqual(len(calls), 4)
+        P.get(('t63', 'ocean', True, False), _generate, force=True)
+        self.assertEqual(len(calls), 5)
+
+        self.assertTrue(utils.get_landseamask_provider() is utils.get_landseamask_provider())
+
     @unittest.skip('TODO: acquire files using wget script!')
     def test_get_generic_landseamask_DEFAULT(self):
         #XXX TODO analyze also correctness of results
@@ -6,11 +6,17 @@ For COPYING and LICENSE details, please refer to the LICENSE file
 """
 
 import os
+from collections import OrderedDict
 from pycmbs.data import Data
 from cdo import Cdo
 import numpy as np
 import warnings
 
+# umask of the process; it can only be obtained by setting it, which is
+# therefore done once here and not while threads might create files
+_umask = os.umask(0)
+os.umask(_umask)
+
 
 def get_data_pool_directory():
     """
@@ -64,6 +70,20 @@ def get_temporary_directory():
     return tempdir
 
 
+def set_default_permissions(filename):
+    """
+    set the permissions of a file to the default of newly created
+    files (0666 reduced by the umask). This is needed for files
+    created by tempfile.mkstemp(), which are only accessible by the
+    user, before they are renamed to their final name.
+
+    Parameters
+    ----------
+    filename : str
+    """
+    os.chmod(filename, 0666 & ~_umask)
+
+
 def get_generic_landseamask(shift_lon, mask_antarctica=True,
                             area='land', interpolation_method='remapnn',
                             target_grid='t63grid', force=False):
@@ -106,11 +126,32 @@ def get_generic_landseamask(shift_lon, mask_antarctica=True,
         mask antarctica; if True, then the mask is
         FALSE over Antarctice (<60S)
 
+    The mask is generated only once per process for each combination
+    of arguments and is then taken from the land/sea mask provider
+    (see get_landseamask_provider()). The arrays of the returned
+    object are read-only.
+
     Returns
     -------
     returns a Data object
     """
 
+    key = ('generic', target_grid, interpolation_method, area,
+           mask_antarctica, shift_lon)
+
+    def _generate():
+        return _generate_generic_landseamask(shift_lon, mask_antarctica=mask_antarctica,
+                                             area=area, interpolation_method=interpolation_method,
+                                             target_grid=target_grid, force=force)
+    return get_landseamask_provider().get(key, _generate, force=force)
+
+
+def _generate_generic_landseamask(shift_lon, mask_antarctica=True,
+                                  area='land', interpolation_method='remapnn',
+                                  target_grid='t63grid', force=False):
+    """
+    generate generic land/sea mask; see get_generic_landseamask()
+    """
     print ('WARNING: Automatic generation of land/sea mask. \
             Ensure that this is what you want!')
 
@@ -168,9 +209,26 @@ def get_T63_landseamask(shift_lon, mask_antarctica=True, area='land'):
 
     mask_antarctica : bool
         if True, then the mask is FALSE over Antarctica (<60S)
+
+    The mask is read only once per process for each combination
+    of arguments and is then taken from the land/sea mask provider
+    (see get_landseamask_provider()). The arrays of the returned
+    object are read-only.
     """
     ls_file = get_data_pool_directory() \
         + 'data_sources/LSMASK/jsbach_T63_GR15_4tiles_1992.nc'
+    key = ('t63', ls_file, area, mask_antarctica, shift_lon)
+
+    def _read():
+        return _read_T63_landseamask(ls_file, shift_lon,
+                                     mask_antarctica=mask_antarctica, area=area)
+    return get_landseamask_provider().get(key, _read)
+
+
+def _read_T63_landseamask(ls_file, shift_lon, mask_antarctica=True, area='land'):
+    """
+    read JSBACH T63 land sea mask; see get_T63_landseamask()
+    """
     ls_mask = Data(ls_file, 'slm', read=True, label='T63 land-sea mask',
                    lat_name='lat', lon_name='lon', shift_lon=shift_lon)
     if area == 'land':
@@ -190,3 +248,106 @@ def get_T63_landseamask(shift_lon, mask_antarctica=True, area='land'):
     ls_mask._apply_mask(~msk)
 
     return ls_mask
+
+
+class LandSeaMaskProvider(object):
+
+    """
+    Process wide cache of land/sea masks
+
+    Land/sea masks are generated (read from file or calculated with
+    CDO) only once for each key, e.g. (grid, area, mask_antarctica,
+    shift_lon). Each request returns a new Data object, but its arrays
+    (data, lat, lon, cell_area) are read-only views on the arrays of
+    the cached mask. Thus the mask is shared by all requests and can
+    not be changed by accident. If the maximum number of masks is
+    exceeded, the least recently used mask is removed.
+
+    Example
+    -------
+    >>> P = get_landseamask_provider()
+    >>> ls_mask = P.get(key, function_generating_the_mask)
+    """
+
+    def __init__(self, max_entries=16):
+        """
+        Parameters
+        ----------
+        max_entries : int
+            maximum number of masks kept in memory
+        """
+        if max_entries < 1:
+            raise ValueError('Invalid number of cache entries!')
+        self.max_entries = max_entries
+        self._masks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generator, force=False):
+        """
+        get a land/sea mask
+
+        Parameters
+        ----------
+        key : tuple
+            key of the mask (all arguments used to generate it)
+        generator : callable
+            function without arguments which returns the mask as
+            a Data object; only called if the mask is not cached
+        force : bool
+            generate the mask again, even if it is cached
+
+        Returns
+        -------
+        ls_mask : Data
+            mask with read-only arrays
+        """
+        if (not force) and (key in self._masks):
+            self.hits += 1
+            ls_mask = self._masks.pop(key)
+        else:
+            self.misses += 1
+            self._masks.pop(key, None)
+            ls_mask = generator()
+            while len(self._masks) >= self.max_entries:
+                self._masks.popitem(last=False)
+        self._masks[key] = ls_mask  # most recently used mask is last
+        return self._share(ls_mask)
+
+    def _share(self, ls_mask):
+        """
+        new Data object with read-only views on the arrays of a mask
+        """
+        names = ['data', 'lat', 'lon', 'cell_area']
+        r = ls_mask._copy_metadata(exclude=names)
+        for k in names:
+            if hasattr(ls_mask, k):
+                x = getattr(ls_mask, k)
+                if isinstance(x, np.ndarray):
+                    x = ls_mask._copy_or_view(x, False)
+                setattr(r, k, x)
+        return r
+
+    def clear(self):
+        """ remove all masks """
+        self._masks.clear()
+
+    def __len__(self):
+        return len(self._masks)
+
+
+_landseamask_provider = None
+
+
+def get_landseamask_provider():
+    """
+    get the land/sea mask provider which is shared within the process
+
+    Returns
+    -------
+    P : LandSeaMaskProvider
+    """
+    global _landseamask_provider
+    if _landseamask_provider is None:
+        _landseamask_provider = LandSeaMaskProvider()
+    return _landseamask_provider
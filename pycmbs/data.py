@@ -10,7 +10,9 @@ import os
 import sys
 
 #~ from geoval.statistic import get_significance, ttest_ind
-from pycmbs.netcdf import NetCDFHandler
+from pycmbs.netcdf import NetCDFHandler, NetCDFVariableProxy, NetCDFMultiFileProxy
+from pycmbs.aggregation import TemporalAggregator, get_time_keys
+from pycmbs.region_index import get_region_index_cache
 
 
 import numpy as np
@@ -44,8 +46,8 @@ import pytz
 import datetime
 
 import tempfile
-import struct
 import gzip
+import glob
 
 from geoval.core.data import GeoData
 
@@ -62,9 +64,13 @@ class Data(GeoData):
 
         Parameters
         ----------
-        filename : str
+        filename : str or list
             name of the file that contains the data
-            (specify None if not data from file)
+            (specify None if not data from file). A list of files
+            or a wildcard pattern (e.g. 'tas_*.nc') can be given
+            for data which is split into several netCDF files.
+            The files are then read lazily as if they were merged
+            along the time axis (see lazy)
 
         varname : str
             name of the variable that contains the data
@@ -157,10 +163,34 @@ class Data(GeoData):
         geometry_file : str
             name of individual file with coordinates. This can be usefull in the case
             that no coordinate information is stored within the actual data files
+
+        lazy : bool
+            if True, the data is not read into memory when the object
+            is created. Instead self.data is a proxy to the variable
+            on file (NetCDFVariableProxy) and data is read in temporal
+            chunks when needed. Supported for [time,ny,nx] netCDF
+            variables. Reductions like timmean(), fldmean() and
+            get_yearmean() as well as temporal subsetting work without
+            reading the full data cube. Use load() to read the data
+            into memory for all other operations.
+
+        chunk_size : int
+            number of timesteps read at once in lazy mode
         """
         self.lat = None
         self.lon = None
 
+        self.level = kwargs.pop('level', None)
+        self.lazy = kwargs.pop('lazy', False)
+        self.chunk_size = kwargs.pop('chunk_size', 120)
+
+        # multiple files are always read lazily
+        self.filenames = _expand_filenames(filename)
+        if self.filenames is not None:
+            filename = self.filenames[0]
+            if len(self.filenames) > 1:
+                self.lazy = True
+
         super(Data, self).__init__(filename, varname, **kwargs)
 
         self.detrended = False
@@ -171,7 +201,6 @@ class Data(GeoData):
         self._lon360 = True
 
 
-        self.level = kwargs.pop('level', None)
         self.gridtype = None
 
         # specifies if latitudes have been checked for increasing order
@@ -205,6 +234,265 @@ class Data(GeoData):
 
 
 
+    def read(self, shift_lon, start_time=None, stop_time=None,
+             time_var='time', checklat=True, fmt='nc'):
+        """
+        Read data from a file. If the object was created with
+        lazy=True, only the metadata, coordinates and time are read
+        and the data is provided as a proxy to the file.
+        For the parameters see GeoData.read()
+        """
+        if self._is_multifile() and fmt != 'nc':
+            raise ValueError('Multiple files can only be read from netCDF')
+        if self.lazy and fmt == 'nc':
+            self._read_lazy(shift_lon, start_time=start_time,
+                            stop_time=stop_time, time_var=time_var,
+                            checklat=checklat)
+        else:
+            super(Data, self).read(shift_lon, start_time=start_time,
+                                   stop_time=stop_time, time_var=time_var,
+                                   checklat=checklat, fmt=fmt)
+
+    def _read_lazy(self, shift_lon, start_time=None, stop_time=None,
+                   time_var='time', checklat=True):
+        """
+        lazy counterpart of read(). self.data becomes a
+        NetCDFVariableProxy and no data is read. The climatology of
+        the raw data (_climatology_raw) is not calculated in lazy mode.
+
+        If the variable is not a [time,ny,nx] field, the data is read
+        in the conventional way.
+
+        If several files are given (self.filenames), the data becomes a
+        NetCDFMultiFileProxy and the time is merged from all files.
+        Metadata and coordinates are taken from the first file.
+        """
+        if not os.path.exists(self.filename):
+            raise ValueError('Error: file not existing: %s' % self.filename)
+        self.time_var = time_var
+
+        netcdf_backend = 'netCDF4'
+        File = NetCDFHandler(netcdf_backend=netcdf_backend)
+        File.open_file(self.filename, 'r')
+        if self.varname not in File.get_variable_keys():
+            File.close()
+            raise ValueError('The data variable %s in the file %s is not existing. This must not happen!' % (self.varname, self.filename))
+        ndim = File.get_variable_handler(self.varname).ndim
+        File.close()
+        if (ndim < 3) or ((ndim == 4) and (self.level is None)):
+            if self._is_multifile():
+                raise ValueError('Multiple files are only supported for [time,ny,nx] variables: %s' % self.varname)
+            self.lazy = False
+            self._log_warning('Lazy reading not possible for %s: data is read directly' % self.varname)
+            super(Data, self).read(shift_lon, start_time=start_time,
+                                   stop_time=stop_time, time_var=time_var,
+                                   checklat=checklat)
+            return
+
+        # metadata (units, time units, calendar, ...) as in read_netcdf()
+        # the data is only read for a single timestep
+        File = NetCDFHandler(netcdf_backend=netcdf_backend)
+        File.open_file(self.filename, 'r')
+        if self._is_multifile():
+            self.data = NetCDFMultiFileProxy(self.filenames, self.varname,
+                                             time_var=self.time_var,
+                                             level=self.level,
+                                             netcdf_backend=netcdf_backend,
+                                             fill_value=File._get_fill_value(self.varname))
+        else:
+            self.data = File.get_variable_proxy(self.varname, level=self.level)
+        self.fill_value = self.data.fill_value
+        if self.fill_value is None:
+            self.fill_value = -99999.
+        self._scale_factor_netcdf = 1.
+        self._add_offset_netcdf = 0.
+        self.long_name = File._get_long_name(self.varname)
+        if 'cell_area' in File.get_variable_keys() and self.cell_area is None:
+            self.cell_area = File.get_variable('cell_area')
+        if self.unit is None:
+            self.unit = File._get_unit(self.varname)
+        if self.time_var in File.get_variable_keys():
+            tvar = File.get_variable_handler(self.time_var)
+            self.time_str = tvar.units if hasattr(tvar, 'units') else None
+            if hasattr(tvar, 'calendar'):
+                self.calendar = tvar.calendar
+                if self.calendar == 'climatology_bounds':
+                    self.calendar = 'standard'
+            else:
+                self.calendar = 'standard'
+            self.time = File.get_variable(self.time_var)
+            if hasattr(self.time, 'mask'):
+                self.time = self.time.data
+            self.time = self.time.flatten()
+            if self._is_multifile():
+                self.time = self.data.time.copy()
+        else:
+            self.time = None
+            self.time_str = None
+        File.close()
+
+        if self.scale_factor is None:
+            raise ValueError('The scale_factor for file %s is NONE, this must not happen!' % self.filename)
+        self.data.scale_factor = self.scale_factor
+        if self.inmask is not None:
+            if isinstance(self.inmask, GeoData):
+                self.data.valid_mask = ~self.inmask.data.mask
+            else:
+                self.data.valid_mask = self.inmask.astype('bool')
+
+        self._read_coordinates(shift_lon, netcdf_backend=netcdf_backend)
+
+        if self.time is not None:
+            self.set_time()
+
+        try:
+            self._mesh_lat_lon()
+        except:
+            print '        WARNING: No lat/lon mesh was generated!'
+
+        if checklat:
+            if self.lat is not None:
+                if np.all(np.diff(self.lat[:, 0]) > 0.):
+                    self.data.flipud = True
+                    self.lat = self.lat[::-1, :]
+                    if self.cell_area is not None:
+                        self.cell_area = self.cell_area[::-1, :]
+                    self._latitudecheckok = True
+                elif np.all(np.diff(self.lat[:, 0]) < 0.):
+                    self._latitudecheckok = True
+                else:
+                    print 'WARNING: latitudes not in systematic order! Might cause trouble with zonal statistics!'
+                    self._latitudecheckok = False
+
+        self._set_cell_area()
+
+        if self.time is not None:
+            m1, m2 = self._get_time_indices(start_time, stop_time)
+            self._temporal_subsetting(m1, m2)
+            if hasattr(self, 'time_cycle'):
+                if self.time_cycle is None:
+                    self._set_timecycle()
+            else:
+                self._set_timecycle()
+
+    def _is_multifile(self):
+        """
+        check if the data is read from several files
+        """
+        filenames = getattr(self, 'filenames', None)
+        return (filenames is not None) and (len(filenames) > 1)
+
+    def _is_lazy(self):
+        """
+        check if data is still on file (lazy mode)
+        """
+        return isinstance(getattr(self, 'data', None), NetCDFVariableProxy)
+
+    def _iter_time_chunks(self):
+        """
+        iterate over the data in temporal chunks of size
+        self.chunk_size. Works for lazy and in-memory data
+
+        Returns
+        -------
+        generator of (i1, i2, data[i1:i2])
+        """
+        if self._is_lazy():
+            for r in self.data.iter_chunks(self.chunk_size):
+                yield r
+        else:
+            n = len(self.data)
+            for i1 in xrange(0, n, self.chunk_size):
+                i2 = min(i1 + self.chunk_size, n)
+                yield i1, i2, self.data[i1:i2]
+
+    def load(self):
+        """
+        read the data of a lazy Data object into memory
+        Nothing happens if the data is already in memory
+        """
+        if self._is_lazy():
+            self.data = self.data.read(0, len(self.data))
+        self.lazy = False
+
+    def timmean(self, return_object=True):
+        """
+        calculate temporal mean of data field. In lazy mode the
+        data is processed in temporal chunks.
+
+        Parameters
+        ----------
+        return_object : bool
+            specifies if a C{Data} object shall be returned [True]; else a numpy array is returned
+        """
+        if not self._is_lazy():
+            return super(Data, self).timmean(return_object=return_object)
+
+        s = np.zeros(self.data.shape[1:])
+        n = np.zeros(self.data.shape[1:])
+        for i1, i2, x in self._iter_time_chunks():
+            s += x.filled(0.).sum(axis=0)
+            n += x.count(axis=0)
+        res = np.ma.array(s / np.maximum(n, 1.), mask=n == 0)
+
+        if return_object:
+            tmp = self.copy()
+            tmp.data = res
+            if hasattr(tmp, 'time'):
+                del tmp.time
+            return tmp
+        else:
+            return res
+
+    def fldmean(self, return_data=True, apply_weights=True):
+        """
+        calculate mean of the spatial field for each time using
+        weighted averaging. In lazy mode the data is processed in
+        temporal chunks.
+
+        Parameters
+        ----------
+        return_data : bool
+            if True, then a C{Data} object is returned
+        apply_weights : bool
+            apply weights when calculating area weights
+
+        Returns
+        -------
+        r : ndarray or Data
+            vector of spatial mean array[time]
+        """
+        if not self._is_lazy():
+            return super(Data, self).fldmean(return_data=return_data,
+                                             apply_weights=apply_weights)
+
+        if self.weighting_type not in ['valid', 'all']:
+            raise ValueError('Invalid option for normtype: %s' % self.weighting_type)
+
+        nt = len(self.data)
+        tmp = np.ma.array(np.zeros(nt), mask=np.zeros(nt).astype('bool'))
+        ca = np.asarray(self.cell_area, dtype='float').reshape(-1)
+        for i1, i2, x in self._iter_time_chunks():
+            x = x.reshape(i2 - i1, -1)
+            if apply_weights:
+                if self.weighting_type == 'valid':
+                    w = np.ma.array(np.ones(x.shape) * ca, mask=x.mask)
+                    tmp[i1:i2] = (w * x).sum(axis=1) / w.sum(axis=1)
+                else:
+                    tmp[i1:i2] = (x * ca).sum(axis=1) / ca.sum()
+            else:
+                tmp[i1:i2] = x.mean(axis=1)
+
+        if return_data:
+            x = np.zeros((nt, 1, 1))
+            x[:, 0, 0] = tmp.filled(0.)
+            r = self.copy()
+            r.data = np.ma.array(x, mask=tmp.mask.reshape(x.shape))
+            r.cell_area = np.array([1.])
+            return r
+        else:
+            return tmp
+
     def _get_binary_filehandler(self, mode='r'):
         """
         get filehandler for binary file
@@ -228,7 +516,8 @@ class Data(GeoData):
 
     def _read_binary_file(self, dtype=None, lat=None, lon=None,
                           lonmin=None, lonmax=None, latmin=None,
-                          latmax=None, ny=None, nx=None, nt=None):
+                          latmax=None, ny=None, nx=None, nt=None,
+                          byteorder='native', blocksize=2 ** 24):
         """
         read data from binary file
         this routine also allows spatial subsetting during reading
@@ -237,14 +526,29 @@ class Data(GeoData):
         It requires however that two vectors of lon/lat are provided
         in case that a subsetting shall be made
 
+        The file is assumed to contain nt fields of [ny,nx] values
+        (C-order). Uncompressed files are memory mapped and only the
+        required window is copied to memory. Gzip compressed files
+        are decompressed in blocks.
+
         Parameters
         ----------
         dtype : str
             datatype specification
+            ['int8','uint8','int16','uint16','int32','uint32','int64',
+            'uint64','float','double']
         lat : ndarray
             vector of latitudes
         lon : ndarray
             vector of longitudes
+        nt : int
+            number of timesteps in file (default: 1); for nt > 1
+            the result has the geometry [nt,ny,nx]
+        byteorder : str
+            byteorder of the data on file ['native','little','big']
+        blocksize : int
+            approximate size [bytes] of blocks read at once from
+            gzip files
         """
         if dtype is None:
             raise ValueError('ERROR: dtype not provided')
@@ -256,29 +560,29 @@ class Data(GeoData):
         else:
             assert (lat.ndim == 1)
             assert (lon.ndim == 1)
+        if nt is None:
+            nt = 1
 
-        # specify bytes as well as format string for struct for each datatype
+        # numpy type specification for each datatype
         dtype_spec = {
-            'int16': 'H',
-            'double': 'd',
-            'int32': 'i',
-            'float': 'f'
+            'int8': 'i1',
+            'uint8': 'u1',
+            'int16': 'i2',
+            'uint16': 'u2',
+            'int32': 'i4',
+            'uint32': 'u4',
+            'int64': 'i8',
+            'uint64': 'u8',
+            'float': 'f4',
+            'double': 'f8'
         }
+        byteorder_spec = {'native': '=', 'little': '<', 'big': '>'}
 
         if dtype not in dtype_spec.keys():
             raise ValueError('ERROR: invalid data type')
-
-        #~ 'int8'   :'b',
-        #~ 'uint8'  :'B',
-        #~ 'int16'  :'h',
-        #~ 'uint16' :'H',
-        #~ 'int32'  :'i',
-        #~ 'uint32' :'I',
-        #~ 'int64'  :'q',
-        #~ 'uint64' :'Q',
-        #~ 'float'  :'f',
-        #~ 'double' :'d',
-        #~ 'char'   :'s'}
+        if byteorder not in byteorder_spec.keys():
+            raise ValueError('ERROR: invalid byteorder')
+        file_dtype = np.dtype(byteorder_spec[byteorder] + dtype_spec[dtype])
 
         # set boundaries
         if lon is not None:
@@ -293,20 +597,18 @@ class Data(GeoData):
         if lat is not None:
             if latmin is None:
                 latmin = lat.min()
+            if latmax is None:
                 latmax = lat.max()
         else:
             latmin = None
             latmax = None
 
-        # get file handler
-        f = self._get_binary_filehandler()
-
-        # read actual data
         if lon is None:
-            file_content = f.read()  # read entire file
+            # read entire file
             # TODO if specifie, then read lat/lon information from file
             self.lat = None
             self.lon = None
+            ybeg, yend, xbeg, xend = 0, ny, 0, nx
         else:
             # check if lat/lon is increasing
             assert np.all(np.diff(lat) > 0.)
@@ -330,26 +632,73 @@ class Data(GeoData):
             olon = lon[lonminpos:lonmaxpos + 1]
             olat = lat[latminpos:latmaxpos + 1]
 
-            ny = len(olat)
-            nx = len(olon)
-
             self.lon, self.lat = np.meshgrid(olon, olat)
 
-            print 'coordinates: ', lonmin, lonmax, latmin, latmax
-            print 'Positions: ', lonminpos, lonmaxpos, latminpos, latmaxpos
+            ny = len(lat)
+            nx = len(lon)
+            ybeg, yend = latminpos, latmaxpos + 1
+            xbeg, xend = lonminpos, lonmaxpos + 1
 
-            file_content = self._read_binary_subset2D(f, struct.calcsize(dtype_spec[dtype]), ny=len(
-                lat), nx=len(lon), xbeg=lonminpos, xend=lonmaxpos + 1, ybeg=latminpos, yend=latmaxpos + 1)
+        if self.filename[-3:] == '.gz':
+            data = self._read_binary_gzip(file_dtype, nt, ny, nx, ybeg, yend,
+                                          xbeg, xend, blocksize=blocksize)
+        else:
+            nbytes = nt * ny * nx * file_dtype.itemsize
+            if os.path.getsize(self.filename) < nbytes:
+                raise ValueError('ERROR: file %s too small for geometry [%i,%i,%i]' % (self.filename, nt, ny, nx))
+            m = np.memmap(self.filename, dtype=file_dtype, mode='r',
+                          shape=(nt, ny, nx))
+            # only the window is copied to memory
+            data = np.array(m[:, ybeg:yend, xbeg:xend],
+                            dtype=file_dtype.newbyteorder('='))
+            del m
+
+        if nt == 1:
+            self.data = data[0]
+        else:
+            self.data = data
 
-        # close file
-        f.close()
+    def _read_binary_gzip(self, file_dtype, nt, ny, nx, ybeg, yend, xbeg, xend,
+                          blocksize=2 ** 24):
+        """
+        read a window of a gzip compressed binary file in a streaming
+        manner. Only blocks of rows are kept in memory before
+        they are reduced to the window.
 
-        # put data into final matrix by decoding in accordance to the filetype
+        Parameters
+        ----------
+        file_dtype : numpy.dtype
+            datatype on file
+        nt, ny, nx : int
+            geometry of the data on file
+        ybeg, yend, xbeg, xend : int
+            indices of the window
 
-        self.data = np.reshape(
-            np.asarray(struct.unpack(dtype_spec[dtype] * ny * nx * nt, file_content)), (ny, nx))
+        Returns
+        -------
+        data : ndarray [nt,yend-ybeg,xend-xbeg]
+        """
+        res = np.empty((nt, yend - ybeg, xend - xbeg),
+                       dtype=file_dtype.newbyteorder('='))
+        rowbytes = nx * file_dtype.itemsize
+        nrows = max(1, blocksize // rowbytes)
 
-        del file_content
+        f = self._get_binary_filehandler()
+        try:
+            for t in xrange(nt):
+                # skip rows before window
+                f.seek((t * ny + ybeg) * rowbytes)
+                for y1 in xrange(ybeg, yend, nrows):
+                    y2 = min(y1 + nrows, yend)
+                    nbytes = (y2 - y1) * rowbytes
+                    block = f.read(nbytes)
+                    if len(block) != nbytes:
+                        raise ValueError('ERROR: unexpected end of file %s' % self.filename)
+                    block = np.frombuffer(block, dtype=file_dtype).reshape((y2 - y1, nx))
+                    res[t, y1 - ybeg:y2 - ybeg, :] = block[:, xbeg:xend]
+        finally:
+            f.close()
+        return res
 
     def _read_binary_subset2D(self, f, nbytes, xbeg=None, xend=None, ybeg=None, yend=None, ny=None, nx=None):
         """
@@ -388,22 +737,56 @@ class Data(GeoData):
         if xend is None:
             raise ValueError('ERROR: Need to specify XEND')
 
-        file_content = ''
-        for i in xrange(ny):
-            if i >= yend:
-                break
-            if i < ybeg:
-                continue
-            # position
-            #~ print i*nbytes*nx, i*nx
-            #~ stop
-            pos = i * nbytes * nx + xbeg * nbytes
-            f.seek(pos)
-            # read content
-            bytes_to_read = (xend - xbeg) * nbytes
-            r = f.read(bytes_to_read)
-            file_content += r
-        return file_content
+        bytes_to_read = (xend - xbeg) * nbytes
+        rows = []
+        for i in xrange(ybeg, min(yend, ny)):
+            f.seek(i * nbytes * nx + xbeg * nbytes)
+            rows.append(f.read(bytes_to_read))
+        return b''.join(rows)
+
+    def aggregate_time(self, by='year', mask=None, sumsq=False, keys=None):
+        """
+        aggregate the data in time for groups of timesteps
+        (e.g. years, months or seasons). The data is processed in a
+        single pass (in temporal chunks for lazy data). Masked values
+        are not taken into account.
+
+        Parameters
+        ----------
+        by : str
+            type of grouping ['year','month','season','yearmonth'];
+            see aggregation.get_time_keys() for details
+        mask : ndarray (bool)
+            temporal mask [time]; only timesteps with mask=True are
+            taken into account
+        sumsq : bool
+            calculate also the sum of squares; needed if
+            standard deviations shall be derived
+        keys : ndarray
+            explicit group key for each timestep [time]. If given,
+            the parameter 'by' is ignored
+
+        Returns
+        -------
+        A : TemporalAggregator
+            aggregator object which provides sum(), mean(), std() and
+            count() for each group A.keys
+        """
+        if self.data.ndim not in [1, 3]:
+            raise ValueError('Unsupported dimension!')
+        if mask is not None:
+            if mask.ndim != 1:
+                raise ValueError('Mask needs to be 1-D of length of time!')
+            if len(mask) != len(self.time):
+                raise ValueError('Mask needs to be 1-D of length of time!')
+        if keys is None:
+            keys = get_time_keys(self.date, by=by)
+
+        A = TemporalAggregator(keys, shape=self.data.shape[1:], mask=mask,
+                               sumsq=sumsq)
+        for i1, i2, x in self._iter_time_chunks():
+            A.add(x, i1=i1)
+        return A
 
     def get_yearmean(self, mask=None, return_data=False):
         """
@@ -413,6 +796,8 @@ class Data(GeoData):
         e.g. if all the months from JAN-March are masked as TRUE, the
         result will correspnd to the JFM mean for each year
 
+        Years without any valid data are masked.
+
         Parameters
         ----------
         mask : ndarray (bool)
@@ -421,46 +806,9 @@ class Data(GeoData):
         return_data : bool
             specifies if results should be returned as C{Data} object
         """
-
-        if mask is None:
-            # if no mask is provided, take everything
-            mask = np.ones(len(self.time)).astype('bool')
-        else:
-            if mask.ndim != 1:
-                raise ValueError('Mask needs to be 1-D of length of time!')
-            if len(mask) != len(self.time):
-                raise ValueError('Mask needs to be 1-D of length of time!')
-
-        #/// get data
-        ye = np.asarray(self._get_years())
-        years = np.unique(ye)
-        dat = self.data
-
-        # calculate mean
-        if self.data.ndim == 1:
-            res = np.zeros(len(years)) * np.nan
-            su = np.zeros(len(years)) * np.nan
-        elif self.data.ndim == 3:
-            nt, ny, nx = self.data.shape
-            res = np.zeros((len(years), ny, nx))
-            su = np.zeros((len(years), ny, nx))
-        else:
-            raise ValueError('Unsupported dimension!')
-
-        for i in xrange(len(years)):
-            y = years[i]
-            hlp = (ye == y) & mask
-            if self.data.ndim == 1:
-                res[i] = dat[hlp].mean()
-                # calculate sum also (needed for masking in the end)
-                su[i] = dat[hlp].sum()
-            else:
-                res[i, :, :] = dat[hlp, :].mean(axis=0)
-                # calculate sum also (needed for masking in the end)
-                su[i, :, :] = dat[hlp].sum(axis=0)
-
-        # this is still not the best solution, but works
-        res = np.ma.array(res, mask=(su == 0.))
+        A = self.aggregate_time(by='year', mask=mask)
+        years = A.keys
+        res = A.mean()
 
         if return_data:
             # generate data object
@@ -488,37 +836,13 @@ class Data(GeoData):
         return_data : bool
             specifies if a Data object shall be returned
         """
+        A = self.aggregate_time(by='year', mask=mask)
+        years = A.keys
+        res = A.sum()
 
-        if mask is None:
-            # if no mask is provided, take everything
-            mask = np.ones(len(self.time)).astype('bool')
-        else:
-            if mask.ndim != 1:
-                raise ValueError('Mask needs to be 1-D of length of time!')
-            if len(mask) != len(self.time):
-                raise ValueError('Mask needs to be 1-D of length of time!')
-
-        #/// get data
-        ye = pl.asarray(self._get_years())
-        years = pl.unique(ye)
-        dat = self.data
-
-        #/// calculate mean
-        res = []
-        for y in years:
-            hlp = (ye == y) & mask
-            if self.data.ndim == 1:
-                res.append(dat[hlp].sum())
-            else:
-                res.append(dat[hlp, :].sum(axis=0))
-
-        res = pl.asarray(res)
-        msk = dat.count(0) == 0
-
-        for i in xrange(len(res)):
-            res[i, msk] = np.nan
         # mask all data that contained no single valid value!
-        res = np.ma.array(res, mask=np.isnan(res))
+        msk = A.count().sum(axis=0) == 0
+        res = np.ma.array(res.data, mask=np.zeros(res.shape).astype('bool') | msk)
 
         if return_data:
             r = self.copy()
@@ -530,7 +854,233 @@ class Data(GeoData):
         else:
             return years, res
 
+    def get_climatology(self, return_object=False, nmin=1, ensure_start_first=True):
+        """
+        calculate climatological mean for a time increment
+        specified by self.time_cycle
+
+        *Note*: one can not assume that the climatology starts from
+        January if you use a time_cycle = 12
+        Instead, the climatology simply starts with the value which
+        corresponds to the first value of the data.
+
+        Parameters
+        ----------
+        return_object : bool
+            specifies if a Data object shall be returned
+        nmin : int
+            specifies the minimum number of datasets used for
+            climatology; else the result is masked
+        ensure_start_first : bool
+            ensure that the timeseries of the resulting climatology
+            always starts with the first date (see GeoData.get_climatology)
+        """
+        if not hasattr(self, 'time_cycle'):
+            raise ValueError(
+                'Climatology can not be calculated without a valid time_cycle')
+        if self.data.ndim not in [1, 3]:
+            return super(Data, self).get_climatology(
+                return_object=return_object, nmin=nmin,
+                ensure_start_first=ensure_start_first)
+
+        keys = np.arange(len(self.data)) % self.time_cycle
+        A = self.aggregate_time(keys=keys)
+        clim = A.mean(nmin=nmin)
+
+        # create a data object
+        r = self.copy()
+        r.label += ' - climatology'
+        r.data = clim
+        r.time = np.asarray(self.time[0:self.time_cycle]).copy()
+        r.adjust_time(year=1200)  # set some arbitrary time
+
+        if len(r.time) != len(r.data):
+            raise ValueError(
+                'Data and time are inconsistent in get_climatology() '
+                '(%i time steps, %i data slices)' % (len(r.time), len(r.data)))
+
+        if ensure_start_first:
+            r._shift_time_start_firstdate()
+
+        if return_object:
+            return r
+        else:
+            return r.data
+
+    def get_climatology_statistics(self, interval='monthly', ddof=0):
+        """
+        calculate the monthly or seasonal climatology together with
+        the standard deviation, the sum and the number of valid
+        samples in a single pass over the data. The results correspond
+        to the CDO operators ymonmean/ymonstd/ymonsum
+        (yseasmean/yseasstd/yseassum respectively).
+
+        Parameters
+        ----------
+        interval : str
+            ['monthly','season']; seasons are DJF, MAM, JJA, SON
+        ddof : int
+            delta degrees of freedom for the standard deviation
+            (ddof=0 is consistent with the CDO)
+
+        Returns
+        -------
+        r : Data
+            Data object with the climatological mean [time_cycle,ny,nx]
+            which starts always with January (DJF). It has the additional
+            attributes r.std, r.sum and r.n (number of valid samples)
+        """
+        if interval == 'monthly':
+            by = 'month'
+            keys = np.arange(1, 13)
+            months = keys
+        elif interval == 'season':
+            by = 'season'
+            keys = np.arange(4)
+            months = np.asarray([1, 4, 7, 10])  # center of season
+        else:
+            raise ValueError('Unknown temporal interval: %s' % interval)
+        if self.data.ndim not in [1, 3]:
+            raise ValueError('Unsupported dimension!')
+
+        A = self.aggregate_time(by=by, sumsq=True)
+        idx = np.searchsorted(keys, A.keys)
+
+        # groups without any timestep are masked
+        sh = (len(keys),) + tuple(self.data.shape[1:])
+        n = np.zeros(sh).astype('int')
+        n[idx] = A.count()
+        res = {}
+        for k, v in [('mean', A.mean()), ('std', A.std(ddof=ddof)), ('sum', A.sum())]:
+            x = np.ma.array(np.zeros(sh), mask=np.ones(sh).astype('bool'))
+            x[idx] = v
+            res.update({k: x})
+
+        r = self.copy()
+        r.data = res['mean']
+        r.std = res['std']
+        r.sum = res['sum']
+        r.n = n
+        r.time = self.date2num(np.asarray([datetime.datetime(1700, m, 15) for m in months]))
+        r.time_cycle = len(keys)
+        return r
+
+    def get_half_year_statistics(self, months=None, window=None):
+        """
+        calculate the minimum, maximum and sum over the local summer
+        and winter half year for each grid cell in a single pass over
+        the data (in temporal chunks for lazy data) and without copying
+        the data cube. The summer half year is April to September for
+        the northern hemisphere (lat >= 0) and October to March for the
+        southern hemisphere. Masked values are not taken into account.
+
+        Parameters
+        ----------
+        months : ndarray
+            month (1...12) of each timestep [time]. If not given, the
+            months are derived from the time of the data
+        window : int
+            if given, the statistics are calculated separately for
+            consecutive windows of this number of timesteps (e.g.
+            window=12 for a sequence of monthly climatologies)
+
+        Returns
+        -------
+        summer, winter : Data
+            Data objects with the mean over the half year [ny,nx]
+            ([nwindows,ny,nx] if a window is given). They have the
+            additional attributes hmin, hmax, hsum (minimum, maximum
+            and sum over the half year) and n (number of valid
+            samples). Other names are used than min/max/sum, as these
+            are already defined for the Data object
+        """
+        if self.data.ndim != 3:
+            raise ValueError('Unsupported dimension!')
+        if self.lat is None:
+            raise ValueError('Latitudes are needed for half year statistics!')
+
+        nt = len(self.data)
+        if months is None:
+            months = get_time_keys(self.date, by='month')
+        months = np.asarray(months).astype('int')
+        if months.shape != (nt,):
+            raise ValueError('Months need to be 1-D of length of time!')
+        if window is None:
+            nw = 1
+            window = nt
+        else:
+            if (window < 1) or (nt % window != 0):
+                raise ValueError('Number of timesteps needs to be a multiple of the window size!')
+            nw = nt // window
+
+        sh = (nw,) + tuple(self.data.shape[1:])
+        north = np.asarray(self.lat).reshape(self.data.shape[1:]) >= 0.
+        nh_summer = (months >= 4) & (months <= 9)
+        res = {}
+        for k in ['summer', 'winter']:
+            res[k] = {'min': np.ones(sh) * np.inf, 'max': np.ones(sh) * -np.inf,
+                      'sum': np.zeros(sh), 'n': np.zeros(sh).astype('int')}
+
+        for i1, i2, x in self._iter_time_chunks():
+            d = np.asarray(np.ma.getdata(x), dtype='float')
+            valid = ~np.ma.getmaskarray(x) & ~np.isnan(d)
+            # local summer for each timestep and grid cell
+            summer = north == nh_summer[i1:i2, np.newaxis, np.newaxis]
+            iw = np.arange(i1, i2) // window
+            for k, sel in [('summer', summer), ('winter', ~summer)]:
+                m = valid & sel
+                r = res[k]
+                for w in np.unique(iw):
+                    t = iw == w
+                    r['min'][w] = np.minimum(r['min'][w], np.where(m[t], d[t], np.inf).min(axis=0))
+                    r['max'][w] = np.maximum(r['max'][w], np.where(m[t], d[t], -np.inf).max(axis=0))
+                    r['sum'][w] += np.where(m[t], d[t], 0.).sum(axis=0)
+                    r['n'][w] += m[t].sum(axis=0)
+
+        out = []
+        for k in ['summer', 'winter']:
+            r = res[k]
+            msk = r['n'] == 0
+            o = self._copy_metadata()
+            o.data = np.ma.array(r['sum'] / np.maximum(r['n'], 1), mask=msk)
+            o.hmin = np.ma.array(np.where(msk, 0., r['min']), mask=msk)
+            o.hmax = np.ma.array(np.where(msk, 0., r['max']), mask=msk)
+            o.hsum = np.ma.array(r['sum'], mask=msk)
+            o.n = r['n']
+            if nw == 1:
+                for a in ['data', 'hmin', 'hmax', 'hsum', 'n']:
+                    setattr(o, a, getattr(o, a)[0])
+                if hasattr(o, 'time'):
+                    del o.time
+            else:
+                o.time = self.time[::window].copy()
+            o.label = self.label + ' (' + k + ' half year)'
+            out.append(o)
+        return out[0], out[1]
+
+    def _copy_metadata(self, exclude=None):
+        """
+        copy of the C{Data} object with all attributes, but without
+        copying the data itself (data is None)
 
+        Parameters
+        ----------
+        exclude : list
+            names of further attributes which are not copied
+            (set to None in the copy)
+        """
+        names = ['data']
+        if exclude is not None:
+            names += [k for k in exclude if k in self.__dict__]
+        tmp = dict([(k, getattr(self, k)) for k in names])
+        for k in names:
+            setattr(self, k, None)
+        try:
+            r = self.copy()
+        finally:
+            for k in names:
+                setattr(self, k, tmp[k])
+        return r
 
     def set_time(self):
         """
@@ -613,7 +1163,10 @@ class Data(GeoData):
             i2 = len(self.time)
         self.time = self.time[i1:i2]
 
-        if self.data.ndim == 3:
+        if self._is_lazy():
+            # only the visible time window of the file is changed
+            self.data.set_time_window(i1, i2)
+        elif self.data.ndim == 3:
             self.data = self.data[i1:i2, :, :]
         elif self.data.ndim == 2:
             # data has already been squeezed and result was 2D (thus without
@@ -629,38 +1182,81 @@ class Data(GeoData):
             raise ValueError('Error temporal subsetting: invalid dimension!')
 
 
-    def get_aoi(self, region):
-        """ region of class Region """
+    def get_aoi(self, region, copy=True):
+        """
+        get area of interest (AOI) given by a region with index
+        boundaries (e.g. RegionIndex)
 
-        # copy self
-        d = self.copy()
-        d.data = region.get_subset(d.data)
-        d.cell_area = region.get_subset(d.cell_area)
+        Only the subset of the data is copied, not the full dataset.
 
-        if hasattr(d, '_climatology_raw'):
-            d._climatology_raw = region.get_subset(d._climatology_raw)
+        Parameters
+        ----------
+        region : Region
+            region with index boundaries (x1,x2,y1,y2)
+        copy : bool
+            copy the data of the subset. If False, the data of the
+            returned object is a read-only view on the data of the
+            current object and needs to be copied before it is modified
+        """
+        def _subset(x):
+            if x.ndim == 3:
+                x = x[:, region.y1:region.y2, region.x1:region.x2]
+            elif x.ndim == 2:
+                x = x[region.y1:region.y2, region.x1:region.x2]
+            else:
+                raise ValueError('Invalid data array for subsetting! %s'
+                                 % str(np.shape(x)))
+            return self._copy_or_view(x, copy)
+
+        d = self._copy_metadata(exclude=['cell_area', 'lat', 'lon', '_climatology_raw'])
+        d.data = _subset(self.data)
+        d.cell_area = _subset(self.cell_area)
+
+        if hasattr(self, '_climatology_raw'):
+            d._climatology_raw = _subset(self._climatology_raw)
 
-        if plt.isvector(d.lat):
-            d.lat = d.lat[region.y1:region.y2]
+        if plt.isvector(self.lat):
+            d.lat = self._copy_or_view(self.lat[region.y1:region.y2], copy)
         else:
-            d.lat = region.get_subset(d.lat)
+            d.lat = _subset(self.lat)
 
-        if plt.isvector(d.lon):
-            d.lon = d.lon[region.x1:region.x2]
+        if plt.isvector(self.lon):
+            d.lon = self._copy_or_view(self.lon[region.x1:region.x2], copy)
         else:
-            d.lon = region.get_subset(d.lon)
+            d.lon = _subset(self.lon)
 
         d.label = d.label + ' (' + region.label + ')'
         return d
 
-    def get_aoi_lat_lon(self, R, apply_mask=True):
+    def _copy_or_view(self, x, copy):
+        """
+        copy of an array or read-only view on the array
+        """
+        if x is None:
+            return None
+        if copy:
+            return x.copy()
+        if isinstance(x, np.ma.core.MaskedArray):
+            # views of masked arrays share the mask, thus it is copied
+            return np.ma.array(self._copy_or_view(x.data, False),
+                               mask=np.ma.getmaskarray(x).copy(), copy=False)
+        x = x.view()
+        x.flags.writeable = False
+        return x
+
+    def get_aoi_lat_lon(self, R, apply_mask=True, crop=False, copy=True):
         """
         get area of interest (AOI) given lat/lon coordinates
 
         the routine masks all area which is NOT in the given area
         coordinates of region are assumed to be in -180 < lon < 180
 
-        CAUTION: the current object will be changed
+        The bounding box and mask of the region are taken from
+        the region index cache (see get_region_index_cache()), thus
+        repeated extractions of the same region on the same grid do
+        not need to evaluate the coordinates again.
+
+        CAUTION: the current object will be changed, unless crop=True
 
         Parameters
         ----------
@@ -668,28 +1264,46 @@ class Data(GeoData):
             region object that specifies region
         apply_mask : bool
             apply former data mask (default)
-        """
-
-        LON = self.lon.copy()
-        if self._lon360:
-            tmsk = LON > 180.
-            LON[tmsk] -= 360.
-            del tmsk
-        msk_lat = (self.lat >= R.latmin) & (self.lat <= R.latmax)
-        msk_lon = (LON >= R.lonmin) & (LON <= R.lonmax)
+        crop : bool
+            return a new object which is cropped to the bounding box
+            of the region (only the region is masked). The current
+            object is not changed
+        copy : bool
+            copy the data of the cropped object. If False, the data is
+            a read-only view on the data of the current object and
+            needs to be copied before it is modified. Only used if
+            crop=True
 
-        # additional mask in Region object
-        if (R.mask is None) | (apply_mask is False):
-            msk_region = np.ones(np.shape(msk_lat)).astype('bool')
+        Returns
+        -------
+        d : Data
+            cropped object, if crop=True
+        """
+        C = get_region_index_cache()
+        if not crop:
+            msk = C.get_mask(self.lat, self.lon, R, apply_mask=apply_mask,
+                             lon360=self._lon360)
+            self._apply_mask(msk)
+            return
+
+        i1, i2, j1, j2, msk = C.get(self.lat, self.lon, R,
+                                    apply_mask=apply_mask, lon360=self._lon360)
+        if msk.size == 0:
+            raise ValueError('Region not contained in the grid: %s' % R.label)
+
+        d = self._copy_metadata(exclude=['cell_area', 'lat', 'lon', '_climatology_raw'])
+        if self.data.ndim == 3:
+            x = self.data[:, i1:i2, j1:j2]
         else:
-            if np.shape(msk_lat) != np.shape(R.mask):
-                print np.shape(msk_lat), np.shape(R.mask)
-                raise ValueError('Invalid geometries for mask')
-            else:
-                msk_region = R.mask
-        msk = msk_lat & msk_lon & msk_region  # valid area
-        self._apply_mask(msk)
-
+            x = self.data[i1:i2, j1:j2]
+        d.data = np.ma.array(self._copy_or_view(np.ma.getdata(x), copy),
+                             mask=np.ma.getmaskarray(x) | ~msk, copy=False)
+        d.cell_area = self._copy_or_view(self.cell_area[i1:i2, j1:j2], copy)
+        d.lat = self._copy_or_view(self.lat[i1:i2, j1:j2], copy)
+        d.lon = self._copy_or_view(self.lon[i1:i2, j1:j2], copy)
+        if hasattr(self, '_climatology_raw'):
+            d._climatology_raw = self._copy_or_view(self._climatology_raw[..., i1:i2, j1:j2], copy)
+        return d
 
     def shift_x(self, nx):
         """
@@ -885,11 +1499,39 @@ class Data(GeoData):
 
 
 
-    def _rasterize(self, lon, lat, radius=None, return_object=True):
+    def _lonlat2xyz(self, lon, lat):
+        """
+        convert geographical coordinates to cartesian coordinates
+        on the unit sphere
+
+        Parameters
+        ----------
+        lon : ndarray
+            longitude [deg]
+        lat : ndarray
+            latitude [deg]
+
+        Returns
+        -------
+        xyz : ndarray [n,3]
+        """
+        lon = np.deg2rad(np.asarray(lon, dtype='float').ravel())
+        lat = np.deg2rad(np.asarray(lat, dtype='float').ravel())
+        clat = np.cos(lat)
+        return np.column_stack((clat * np.cos(lon), clat * np.sin(lon), np.sin(lat)))
+
+    def _rasterize(self, lon, lat, radius=None, return_object=True, aggregation='last'):
         """
         rasterize data to a target grid specified by the input arguments
 
-        CAUTION: this is a rather slow function!s
+        Each source point is assigned to the nearest grid cell of the
+        target grid if the distance is smaller than the threshold
+        radius. The nearest neighbours are searched using a KD-tree
+        on the unit sphere, which handles the dateline and the poles
+        properly.
+
+        The data can be either a single field or a stack of fields
+        [time,...] that share the same coordinates.
 
         Parameters
         ----------
@@ -898,51 +1540,110 @@ class Data(GeoData):
         lon : ndarray
             longitude [deg]
         radius : float
-            threshold radius
+            threshold radius [deg] (great circle distance)
         return_object : bool
             return a Data object
+        aggregation : str
+            how to handle multiple source points in the same target
+            cell ['last','mean','sum','min','max','count']
+            'last' : value of the last point is used
+            'count' : number of valid points
 
         Returns
         -------
         returns data object with gridded results
         """
+        from scipy.spatial import cKDTree
 
         if lon.shape != lat.shape:
             raise ValueError('Inconsistent geometry!')
         if radius is None:
             raise ValueError('Search radius obligatory')
+        if aggregation not in ['last', 'mean', 'sum', 'min', 'max', 'count']:
+            raise ValueError('Invalid aggregation method: %s' % aggregation)
+        if not return_object:
+            raise ValueError('Not implemented yet!')
 
-        # flatten data
-        dlon = self.lon.flatten()
-        dlat = self.lat.flatten()
-        data = self.data.flatten()
-        res = np.ones_like(lon) * np.nan
-
-        for i in xrange(len(dlon)):
-            # distance
-            d = np.sqrt((lon - dlon[i]) ** 2. + (lat - dlat[i]) ** 2.)
-            #d = np.ma.array(d, mask= d <= radius)
-            dmin = d.min()
-            m = d == dmin
-            if dmin <= radius:  # threshold
-                res[m] = data[i]
+        # source data as [time,npoints]
+        npts = np.asarray(self.lon).size
+        data = np.ma.array(self.data, copy=False)
+        if data.size == npts:
+            nt = None
+            data = data.reshape((1, npts))
+        elif (data.ndim > 1) and (data.shape[0] * npts == data.size):
+            nt = data.shape[0]
+            data = data.reshape((nt, npts))
+        else:
+            raise ValueError('Data geometry inconsistent with coordinates!')
+        vals = np.asarray(data.filled(np.nan), dtype='float')
+        valid = ~np.isnan(vals)
+
+        # nearest target cell for each source point
+        tree = cKDTree(self._lonlat2xyz(lon, lat))
+        d, idx = tree.query(self._lonlat2xyz(self.lon, self.lat), k=1)
+        # chord length corresponding to the radius
+        dmax = 2. * np.sin(np.deg2rad(min(radius, 180.)) / 2.)
+        hit = d <= dmax
+        idx = idx[hit]
+        vals = vals[:, hit]
+        valid = valid[:, hit]
+
+        # reduce all hits on the flattened [time,ntarget] grid
+        n = lon.size
+        nrow = len(vals)
+        pos = (np.arange(nrow)[:, np.newaxis] * n + idx[np.newaxis, :])[valid]
+        v = vals[valid]
+        cnt = np.bincount(pos, minlength=nrow * n)
+        if aggregation == 'count':
+            res = cnt.astype('float')
+        elif aggregation in ['mean', 'sum']:
+            res = np.bincount(pos, weights=v, minlength=nrow * n)
+            if aggregation == 'mean':
+                res /= np.maximum(cnt, 1)
+        else:
+            res = np.ones(nrow * n) * np.nan
+            if aggregation == 'last':
+                res[pos] = v
+            elif aggregation == 'max':
+                res[pos] = -np.inf
+                np.maximum.at(res, pos, v)
+            else:
+                res[pos] = np.inf
+                np.minimum.at(res, pos, v)
+        if aggregation == 'count':
+            msk = np.zeros(res.shape).astype('bool')
+        else:
+            msk = cnt == 0
 
-        if return_object:
-            x = self.copy()
-            x.lon = lon * 1.
-            x.lat = lat * 1.
-            x.data = np.ma.array(res, mask=np.isnan(res))
+        if nt is None:
+            res = res.reshape(lon.shape)
+            msk = msk.reshape(lon.shape)
         else:
-            raise ValueError('Not implemented yet!')
+            res = res.reshape((nt,) + lon.shape)
+            msk = msk.reshape((nt,) + lon.shape)
 
-        return x
+        x = self.copy()
+        x.lon = lon * 1.
+        x.lat = lat * 1.
+        x.data = np.ma.array(res, mask=msk)
+        if aggregation == 'count':
+            x.unit = '-'
 
+        return x
 
-    def lomb_scargle_periodogram(self, P, return_object=True, frac=1., corr=True):
+    def lomb_scargle_periodogram(self, P, return_object=True, frac=1., corr=True,
+                                 n_jobs=1, blocksize=10000):
         """
         Calculate LOMB-SCARGLE periodogram
-        This routine provides a wrapper to the function
-        in statistic.py
+
+        For each period a cosine model A*cos(2*pi*t/P + B) is fitted
+        to the timeseries of each grid cell (see
+        geoval.statistic.lomb_scargle_periodogram). The fit is
+        calculated in closed form for all valid grid cells and all
+        periods at once. Only valid data is used for the fit.
+        The amplitude is always positive; the phase is in [-pi,pi].
+        Fits with a negative amplitude were returned before; the
+        phase of these differs by pi now.
 
         Parameters
         ----------
@@ -954,12 +1655,19 @@ class Data(GeoData):
         frac : float
             minimum fraction of valid data needed for timesteps to perform calculation
             This is done also for performance improvement!
+        corr : bool
+            calculate also correlation of model with data and
+            its p-value
+        n_jobs : int
+            number of processes; if > 1, the grid cells are split
+            into tiles which are processed in parallel
+        blocksize : int
+            number of grid cells processed at once
         """
-        from geoval.statistic import lomb_scargle_periodogram
-
         if self.ndim != 3:
             raise ValueError('Only 3D geometry supported!')
 
+        P = np.asarray(P, dtype='float')
         n = len(P)
         A = np.ones((n, self.ny, self.nx)) * np.nan
         B = np.ones((n, self.ny, self.nx)) * np.nan
@@ -967,23 +1675,48 @@ class Data(GeoData):
             R = np.ones((n, self.ny, self.nx)) * np.nan
             PV = np.ones((n, self.ny, self.nx)) * np.nan
 
-        t = self.time
+        t = np.asarray(self.time, dtype='float')
         if 'days since' not in self.time_str:
             raise ValueError('only time units in days currently supported!')
 
         # get mask where at least
         vmask = self.get_valid_mask(frac=frac)
+        idx = np.nonzero(vmask.ravel())[0]
+
+        data = np.ma.array(self.data, copy=False).reshape(len(t), -1)
+        tasks = []
+        for i1 in xrange(0, len(idx), blocksize):
+            pix = idx[i1:i1 + blocksize]
+            tasks.append((t, P, data[:, pix], corr))
+
+        if (n_jobs > 1) and (len(tasks) > 1):
+            from multiprocessing import Pool
+            pool = Pool(processes=n_jobs)
+            try:
+                results = pool.map(_lomb_scargle_block, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_lomb_scargle_block(task) for task in tasks]
 
-        for i in xrange(self.ny):
-            print i, self.ny
-            for j in xrange(self.nx):
-                if vmask[i, j]:
-                    if corr:
-                        A[:, i, j], B[:, i, j], R[:, i, j], PV[:, i, j] = lomb_scargle_periodogram(
-                            t, P, self.data[:, i, j], corr=corr)
-                    else:
-                        A[:, i, j], B[:, i, j] = lomb_scargle_periodogram(
-                            t, P, self.data[:, i, j], corr=corr)
+        A.shape = (n, -1)
+        B.shape = (n, -1)
+        if corr:
+            R.shape = (n, -1)
+            PV.shape = (n, -1)
+        for i1, res in zip(xrange(0, len(idx), blocksize), results):
+            pix = idx[i1:i1 + blocksize]
+            A[:, pix] = res[0]
+            B[:, pix] = res[1]
+            if corr:
+                R[:, pix] = res[2]
+                PV[:, pix] = res[3]
+        A.shape = (n, self.ny, self.nx)
+        B.shape = (n, self.ny, self.nx)
+        if corr:
+            R.shape = (n, self.ny, self.nx)
+            PV.shape = (n, self.ny, self.nx)
 
         if return_object:
             Aout = Data(None, None)
@@ -1019,3 +1752,101 @@ class Data(GeoData):
                 return A, B, R, PV
             else:
                 return A, B
+
+
+def _expand_filenames(filename):
+    """
+    get the list of files for a filename argument of Data
+
+    Parameters
+    ----------
+    filename : str or list
+        filename, wildcard pattern or list of filenames
+
+    Returns
+    -------
+    filenames : list
+        sorted list of files; None if no filename is given
+    """
+    if filename is None:
+        return None
+    if isinstance(filename, (list, tuple)):
+        filenames = list(filename)
+    elif any([c in filename for c in '*?[']):
+        filenames = sorted(glob.glob(filename))
+    else:
+        return [filename]
+    if len(filenames) == 0:
+        raise ValueError('No files found for %s' % filename)
+    return filenames
+
+
+def _lomb_scargle_block(args):
+    """
+    Lomb-Scargle periodogram for a block of timeseries
+
+    The cosine model A*cos(w*t + B) is equivalent to the linear model
+    a*cos(w*t) + b*sin(w*t) with a = A*cos(B) and b = -A*sin(B).
+    The coefficients are obtained from the normal equations, whose
+    sums are calculated as matrix products [npix,nt] x [nt,nperiods].
+
+    Parameters
+    ----------
+    args : tuple
+        (t, P, y, corr) with
+        t : time [nt]
+        P : periods [nperiods]
+        y : masked array [nt,npix]
+        corr : calculate correlation and p-value
+
+    Returns
+    -------
+    A, B (, R, PV) : ndarrays [nperiods,npix]
+    """
+    t, P, y, corr = args
+
+    w = (~np.ma.getmaskarray(y)).astype('float')
+    yv = np.asarray(np.ma.filled(y, 0.), dtype='float') * w
+    hlp = 2. * np.pi * t[:, np.newaxis] / P[np.newaxis, :]  # [nt,nperiods]
+    c = np.cos(hlp)
+    s = np.sin(hlp)
+    del hlp
+
+    # sums over valid timesteps [npix,nperiods]
+    scc = np.dot(w.T, c * c)
+    sss = np.dot(w.T, s * s)
+    scs = np.dot(w.T, c * s)
+    yc = np.dot(yv.T, c)
+    ys = np.dot(yv.T, s)
+
+    det = scc * sss - scs * scs
+    det[det == 0.] = np.nan
+    a = (yc * sss - ys * scs) / det
+    b = (ys * scc - yc * scs) / det
+
+    A = np.sqrt(a * a + b * b)
+    B = np.arctan2(-b, a)
+    if not corr:
+        return A.T, B.T
+
+    # pearson correlation between model and observations
+    n = w.sum(axis=0)[:, np.newaxis]
+    sy = yv.sum(axis=0)[:, np.newaxis]
+    syy = (yv * yv).sum(axis=0)[:, np.newaxis]
+    sm = a * np.dot(w.T, c) + b * np.dot(w.T, s)
+    smm = a * a * scc + 2. * a * b * scs + b * b * sss
+    smy = a * yc + b * ys
+
+    cov = n * smy - sm * sy
+    var = (n * smm - sm * sm) * (n * syy - sy * sy)
+    var[var <= 0.] = np.nan
+    R = cov / np.sqrt(var)
+    R = np.clip(R, -1., 1.)
+
+    df = n - 2.
+    df[df < 1.] = np.nan
+    TINY = 1.0e-20
+    tval = R * np.sqrt(df / ((1.0 - R + TINY) * (1.0 + R + TINY)))
+    PV = 2. * stats.t.sf(np.abs(tval), df)
+
+    return A.T, B.T, R.T, PV.T
@@ -5,6 +5,10 @@ This file is part of pyCMBS.
 For COPYING and LICENSE details, please refer to the LICENSE file
 """
 
+import numpy as np
+
+from pycmbs.anova import Anova1, Anova2
+
 
 class ANOVA(object):
     """
@@ -46,13 +50,25 @@ class ANOVA(object):
         else:
             raise ValueError('Experiment was not yet registered!')
 
-    def analysis(self, analysis_type=None):
+    def analysis(self, analysis_type=None, blocksize=10000):
         """
         perform ANOVA analysis based on the data given
+
+        The ANOVA is performed for all valid pixels at once. To limit
+        the memory consumption, the pixels are processed in tiles.
+
+        Parameters
+        ----------
+        analysis_type : str
+            ['one','two'] one-way or two-way ANOVA
+        blocksize : int
+            number of pixels processed at once
         """
 
         if analysis_type is None:
             raise ValueError('Needs to specify type of ANOVA to be performed')
+        if analysis_type not in ['one', 'two']:
+            raise ValueError('Invalid ANOVA type')
 
         #1) check if all data has the same length
         # this is not a strong prerequesite for ANOVA as such, but for
@@ -64,9 +80,9 @@ class ANOVA(object):
         #2) rearange data to work only with valid (not masked data)
         #   check also that only data which is valid in all cases is used
         #   it is realized by getting the valid indices of the data
-        idx = np.argwhere(self.mask)  # returns list of indices of valid pixels
+        idx = np.nonzero(self.mask.ravel())[0]  # indices of valid pixels
 
-        #3) perform ANOVA analysis on all pixels individually
+        #3) perform ANOVA analysis on all pixels
         resA = np.zeros(self.refshape) * np.nan
         resB = np.zeros(self.refshape) * np.nan
         resI = np.zeros(self.refshape) * np.nan
@@ -79,40 +95,34 @@ class ANOVA(object):
         resBa = np.zeros(self.refshape) * np.nan
         resIa = np.zeros(self.refshape) * np.nan
 
-        for p in idx:
+        for i1 in xrange(0, len(idx), blocksize):
+            pix = idx[i1:i1 + blocksize]
             if analysis_type == 'one':  # one way ANOVA
-                m = self._data2anova1(p)  # [nrens,ntime]
+                m = self._data2anova1(pix)  # [nrens,ntime,npix]
                 A = Anova1(m)
                 A.one_way_anova(verbose=False)
 
-                resA[p[0], p[1]] = A.get_fractional_variance_explained(adjust=False)  # ssa
-                resPA[p[0], p[1]] = A.p
-                resB[p[0], p[1]] = A.sse / A.sst  # todo: adjustment here ???
+                resA.flat[pix] = A.get_fractional_variance_explained(adjust=False)  # ssa
+                resPA.flat[pix] = A.p
+                resB.flat[pix] = A.sse / A.sst  # todo: adjustment here ???
 
             elif analysis_type == 'two':  # two way ANOVA
-                m = self._data2anova2(p)
+                m = self._data2anova2(pix)  # [nexp,ntime,nrens,npix]
                 #- perform 2-way anova
                 A = Anova2(m)
                 A.two_way_anova_with_replication()
 
-                resA[p[0], p[1]] = A.get_fractional_variance_explained('a', adjust=False)  # todo: adjust variance
-                resB[p[0], p[1]] = A.get_fractional_variance_explained('b', adjust=False)  # todo: adjust variance
-                resI[p[0], p[1]] = A.get_fractional_variance_explained('i', adjust=False)  # todo: adjust variance
-                resE[p[0], p[1]] = A.get_fractional_variance_explained('e', adjust=False)  # todo: adjust variance
-
-                resPA[p[0], p[1]] = A.p_ssa
-                resPB[p[0], p[1]] = A.p_ssb
-                resPI[p[0], p[1]] = A.p_ssi
+                resA.flat[pix] = A.get_fractional_variance_explained('a', adjust=False)  # todo: adjust variance
+                resB.flat[pix] = A.get_fractional_variance_explained('b', adjust=False)  # todo: adjust variance
+                resI.flat[pix] = A.get_fractional_variance_explained('i', adjust=False)  # todo: adjust variance
+                resE.flat[pix] = A.get_fractional_variance_explained('e', adjust=False)  # todo: adjust variance
 
-                #~ resAa[p[0],p[1]] = A.get_fractional_variance_explained('a',adjust=True) #todo: adjust variance
-                #~ resBa[p[0],p[1]] = A.get_fractional_variance_explained('b',adjust=True) #todo: adjust variance
-                #~ resIa[p[0],p[1]] = A.get_fractional_variance_explained('i',adjust=True) #todo: adjust variance
+                resPA.flat[pix] = A.p_ssa
+                resPB.flat[pix] = A.p_ssb
+                resPI.flat[pix] = A.p_ssi
 
                 #@todo significance
 
-            else:
-                raise ValueError('Invalid ANOVA type')
-
         self.resA = resA
         self.resB = resB
         self.resI = resI
@@ -126,17 +136,15 @@ class ANOVA(object):
         self.resBa = resBa
         self.resIa = resIa
 
-    def _data2anova1(self, p):
+    def _data2anova1(self, pix):
         """
         extract from the database all the data
-        relevant for a single location, given by the indices in p
+        relevant for a set of locations
 
-        p = indices
+        pix : ndarray
+            indices of the locations in the flattened field
 
-        ---> time (nt)
-        |
-        |
-        v experiment (nexp)
+        returns x [nrens,nt,npix]
         """
 
         nexp = len(self.experiments)
@@ -144,40 +152,38 @@ class ANOVA(object):
         if nexp != 1:
             raise ValueError('one-way anova only valid for signle experiments!')
 
-        x = np.zeros((self.n, self.nt)) * np.nan  # [nrens,nt]
+        x = np.zeros((self.n, self.nt, len(pix))) * np.nan  # [nrens,nt,npix]
 
         e = self.experiments[0]
         for i in range(self.n):
             d = self.data[e][i]  # data object for experiment 'e' and ensemble nr [i]
-            x[i, :] = d.data[:, p[0], p[1]]
+            x[i, :, :] = np.ma.filled(d.data.reshape(self.nt, -1)[:, pix], np.nan)
 
-        if np.any(np.isnan(x) > 0):
+        if np.any(np.isnan(x)):
             raise ValueError('Something is wrong: not all data valid!')
 
         return x
 
-    def _data2anova2(self, p):
+    def _data2anova2(self, pix):
         """
         extract from the database all the data
-        relevant for a single location, given by the indices in p
+        relevant for a set of locations
 
-        p = indices
+        pix : ndarray
+            indices of the locations in the flattened field
 
-        ---> time (nt)
-        |
-        |
-        v experiment (nexp)
+        returns x [nexp,nt,nrens,npix]
         """
         nexp = len(self.experiments)
-        x = np.zeros((nexp, self.nt, self.n)) * np.nan
+        x = np.zeros((nexp, self.nt, self.n, len(pix))) * np.nan
 
         for j in range(len(self.experiments)):
             e = self.experiments[j]
             for i in range(self.n):
                 d = self.data[e][i]  # data object for experiment 'e' and ensemble nr [i]
-                x[j, :, i] = d.data[:, p[0], p[1]]
+                x[j, :, i, :] = np.ma.filled(d.data.reshape(self.nt, -1)[:, pix], np.nan)
 
-        if np.any(np.isnan(x) > 0):
+        if np.any(np.isnan(x)):
             raise ValueError('Something is wrong: not all data valid!')
 
         return x
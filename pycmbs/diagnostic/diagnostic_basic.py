@@ -180,7 +180,7 @@ class EOF(object):
     """
 
     def __init__(self, x0, allow_gaps=False, normalize=False, cov_norm=True, anomalies=False, area_weighting=True,
-                 use_corr=False, use_svd=True):
+                 use_corr=False, use_svd=True, solver='full', nmodes=None, seed=None):
         """
         constructor for EOF analysis
 
@@ -213,6 +213,23 @@ class EOF(object):
             use SVD for decomposition; if False, then eigenvalue
             decomposition for symmetric matrices (eigh)
             is used
+        solver : str
+            ['full','truncated','randomized']
+            'full' : decomposition of the full covariance matrix
+            'truncated' : only the leading nmodes are calculated with a
+                          truncated SVD (Lanczos) of the data matrix
+            'randomized' : only the leading nmodes are calculated with
+                           a randomized SVD of the data matrix
+            The 'truncated' and 'randomized' solvers never form the
+            covariance matrix and are therefore recommended for large
+            datasets. They do not support gappy data (allow_gaps=True).
+        nmodes : int
+            number of leading modes to be calculated; required for
+            the 'truncated' and 'randomized' solvers. If given for the
+            'full' solver, the results are truncated
+        seed : int
+            seed for the random number generator of the 'randomized'
+            solver
 
         TODO how to deal with negative eigenvalues, which sometimes occur?
 
@@ -271,38 +288,50 @@ class EOF(object):
         npoints, ntime = self.x.shape
         print '   EOF analysis with %s timesteps and %s grid cells ...' % (ntime, npoints)
 
-        #/// calculate covariance matrix ///
-        if allow_gaps:
-            if use_corr:
-                self.C = np.ma.corrcoef(self.x, rowvar=0)
-            else:
-                # calculation using covariance matrix
-                if cov_norm:
-                    self.C = np.ma.cov(self.x, rowvar=0)
+        if solver not in ['full', 'truncated', 'randomized']:
+            raise ValueError('Invalid EOF solver: %s' % solver)
+
+        if solver == 'full':
+            #/// calculate covariance matrix ///
+            if allow_gaps:
+                if use_corr:
+                    self.C = np.ma.corrcoef(self.x, rowvar=0)
                 else:
-                    raise ValueError('gappy data not supported for cov_norm option')
-        else:
-            if use_corr:
-                self.C = np.corrcoef(self.x, rowvar=0)
+                    # calculation using covariance matrix
+                    if cov_norm:
+                        self.C = np.ma.cov(self.x, rowvar=0)
+                    else:
+                        raise ValueError('gappy data not supported for cov_norm option')
             else:
-                #--- covariance matrix for calculations
-                if cov_norm:
-                    self.C = np.cov(self.x, rowvar=0)
+                if use_corr:
+                    self.C = np.corrcoef(self.x, rowvar=0)
                 else:
-                    self.C = np.dot(self.x.T, self.x)
-
-        #/// solve eigenvalue problem ///
-        # The SVD implementation was validated by comparing U,l,V = svd(cov(x,rowvar=0)) against the results from
-        # eigh(cov(x,rowvar=0)). Results are similar, WHICH IS A BIT STRANGE actually as after
-        # Bjoernosson and Venegas, 1997, p. 17, the eigenvalues should correspond to the square of the singular values.
-        # in the validdation, the eigenvalues however corresponded directly to the singular values!
-        if use_svd:
-            # Since the matrix is square and symmetric, eigenval(eof)=eigenval(svd)!
-            self.eigvec, self.eigval, v = linalg.svd(self.C)
+                    #--- covariance matrix for calculations
+                    if cov_norm:
+                        self.C = np.cov(self.x, rowvar=0)
+                    else:
+                        self.C = np.dot(self.x.T, self.x)
+
+            #/// solve eigenvalue problem ///
+            # The SVD implementation was validated by comparing U,l,V = svd(cov(x,rowvar=0)) against the results from
+            # eigh(cov(x,rowvar=0)). Results are similar, WHICH IS A BIT STRANGE actually as after
+            # Bjoernosson and Venegas, 1997, p. 17, the eigenvalues should correspond to the square of the singular values.
+            # in the validdation, the eigenvalues however corresponded directly to the singular values!
+            if use_svd:
+                # Since the matrix is square and symmetric, eigenval(eof)=eigenval(svd)!
+                self.eigvec, self.eigval, v = linalg.svd(self.C)
+            else:
+                #returns the eigenvalues in ASCENDING order (or no order at all!)
+                # complex numbers in output matrices (eigenvalues not necessarily increasing!)
+                self.eigval, self.eigvec = np.linalg.eigh(self.C)
+            total = sum(self.eigval)
         else:
-            #returns the eigenvalues in ASCENDING order (or no order at all!)
-            # complex numbers in output matrices (eigenvalues not necessarily increasing!)
-            self.eigval, self.eigvec = np.linalg.eigh(self.C)
+            if allow_gaps:
+                raise ValueError('Gappy data not supported for %s EOF solver' % solver)
+            if nmodes is None:
+                raise ValueError('Number of modes needs to be specified for %s EOF solver' % solver)
+            self.eigvec, self.eigval, total = self._get_leading_modes(nmodes, solver, use_corr=use_corr,
+                                                                      cov_norm=cov_norm, seed=seed)
 
         #self.eigvec /= self._sum_weighting #normalize Eigenvector with the sum of the weights that have been applied. This gives the timeseries mean amplitude (see NCL EOF example)
         #--- check if Eigenvalues are in descending order
@@ -311,6 +340,11 @@ class EOF(object):
             raise ValueError('Eigenvalues are not in descending order. This is not supported yet so far.'
                              ' Needs ordering of results!')
 
+        if nmodes is not None:
+            self.eigval = self.eigval[0:nmodes]
+            self.eigvec = self.eigvec[:, 0:nmodes]
+        self.nmodes = len(self.eigval)  # number of modes
+
         #/// calculate EOF expansion coefficients == PC (projection of original data to new parameter space)
         if allow_gaps:
             self.EOF = np.ma.dot(self.x, self.eigvec)  # A
@@ -318,7 +352,73 @@ class EOF(object):
             self.EOF = np.dot(self.x, self.eigvec)  # A
 
         #/// explained variance
-        self._var = self.eigval / sum(self.eigval)  # explained variance
+        self._var = self.eigval / total  # explained variance
+
+    def _get_leading_modes(self, nmodes, solver, use_corr=False, cov_norm=True, seed=None):
+        """
+        calculate the leading eigenvalues and eigenvectors of the
+        covariance (or correlation) matrix [time,time] directly from
+        the SVD of the data matrix without forming the matrix. The SVD
+        is done for the data matrix or its transpose, whatever is cheaper.
+
+        Parameters
+        ----------
+        nmodes : int
+            number of modes
+        solver : str
+            'truncated' or 'randomized'
+        use_corr : bool
+            eigenvalues of correlation matrix
+        cov_norm : bool
+            eigenvalues of covariance matrix as obtained from np.cov();
+            otherwise of the matrix x.T*x
+        seed : int
+            seed for randomized SVD
+
+        Returns
+        -------
+        eigvec : ndarray
+            eigenvectors [time,nmodes]
+        eigval : ndarray
+            eigenvalues [nmodes] in descending order
+        total : float
+            sum of all eigenvalues (trace of covariance matrix)
+        """
+        A = np.asarray(self.x, dtype='float')  # [npoints,time]
+        npoints, ntime = A.shape
+        if use_corr or cov_norm:
+            A = A - A.mean(axis=0)
+            scale = 1. / (npoints - 1)
+        else:
+            scale = 1.
+        if use_corr:
+            A = A / A.std(axis=0, ddof=1)
+
+        # the right singular vectors of the data matrix are the eigenvectors
+        transpose = npoints < ntime
+        if transpose:
+            A = A.T
+        k = min(nmodes, min(A.shape))
+        if (solver == 'truncated') and (k < min(A.shape)):
+            from scipy.sparse.linalg import svds
+            U, s, Vt = svds(A, k=k)
+            o = np.argsort(s)[::-1]
+            U = U[:, o]
+            s = s[o]
+            Vt = Vt[o, :]
+        elif solver == 'randomized':
+            U, s, Vt = _randomized_svd(A, k, seed=seed)
+        else:
+            U, s, Vt = linalg.svd(A, full_matrices=False)
+            U = U[:, 0:k]
+            s = s[0:k]
+            Vt = Vt[0:k, :]
+
+        if transpose:
+            eigvec = U
+        else:
+            eigvec = Vt.T
+        return eigvec, s * s * scale, np.sum(A * A) * scale
 
     def __time_normalization(self):
         """
@@ -364,7 +464,7 @@ class EOF(object):
             normalize coefficients by stdv. to allow better plotting (default=True)
         """
         if all:
-            k = range(self.n)
+            k = range(self.nmodes)
         else:
             if np.isscalar(k):
                 k = [k]
@@ -420,7 +520,7 @@ class EOF(object):
         """
 
         if all:
-            k = range(self.n)
+            k = range(self.nmodes)
             ax = None
         else:
             if np.isscalar(k):
@@ -563,7 +663,7 @@ class EOF(object):
         if input is None:
             #use all data up to maxn
             if maxn is None:
-                maxn = self.n
+                maxn = self.nmodes
             thelist = range(maxn)
         else:
             #use user defined list
@@ -643,6 +743,188 @@ class EOF(object):
         return f
 
 
+class IncrementalEOF(EOF):
+    """
+    EOF analysis for datasets which do not fit into memory
+
+    The data is streamed in temporal chunks from the C{Data} object,
+    which can be a lazy Data object (see Data(..., lazy=True)). The
+    leading modes are obtained by an incremental SVD, which updates a
+    low rank basis of the data matrix with each chunk [1]. Neither
+    the data matrix nor the covariance matrix are kept in memory.
+
+    The data is read three times: to get the valid grid cells and the
+    temporal statistics, for the incremental SVD and for the
+    calculation of the eigenvectors (timeseries) and EOF patterns.
+    The results are stored in the same attributes as for the EOF
+    class, thus e.g. plot_EOF() or reconstruct_data() can be used.
+    Only grid cells with valid data at all timesteps are used.
+
+    REFERENCES:
+    -----------
+    [1] Ross, D.A., Lim, J., Lin, R.S., Yang, M.H., 2008. Incremental learning for robust visual tracking,
+        International Journal of Computer Vision, 77, 125-141
+    """
+
+    def __init__(self, x0, nmodes, normalize=False, cov_norm=True, anomalies=False, area_weighting=True,
+                 use_corr=False, oversampling=10):
+        """
+        constructor for incremental EOF analysis
+
+        Parameters
+        ----------
+        x0 : Data
+            C{Data} object with a 3D data. The data is assumed to have
+            structure [time,ny,nx]. The data is processed in temporal
+            chunks of size x0.chunk_size
+        nmodes : int
+            number of leading modes to be calculated
+        normalize : bool
+            normalize timeseries of data to unity
+        cov_norm : bool
+            normalize covariance by sample size (like np.cov() )
+        anomalies : bool
+            specifies if calculation should be performed based on
+            anomalies (mean removed)
+        area_weighting : bool
+            perform area weighting of data prior to analysis
+        use_corr : bool
+            use correlation matrix for EOF calculations instead of
+            covariance matrix (default = False)
+        oversampling : int
+            number of additional modes kept in the low rank basis
+            during the incremental SVD to improve the accuracy of
+            the leading modes
+        """
+
+        print('*** INCREMENTAL EOF ANALYSIS ***')
+
+        if x0.data.ndim != 3:
+            raise ValueError('EOF analysis currently only supported for 3D data matrices of type [time,ny,nx]')
+        if nmodes < 1:
+            raise ValueError('Number of modes needs to be > 0')
+
+        self._x0 = x0
+        self._shape0 = x0.data.shape[1:]  # original data shape
+        n = len(x0.data)
+        self.n = n
+        self._area_weighting = area_weighting
+        if not area_weighting:
+            print '    WARNING: it is recommended to use area weighting for EOFs'
+        if not anomalies:
+            print '    WARNING: it is recommended that EOFs are calculated based on anomalies'
+
+        #/// 1) valid grid cells and temporal statistics ///
+        cnt = None
+        for i1, i2, x in x0._iter_time_chunks():
+            x = self._get_weighted_chunk(x)
+            v = ~np.ma.getmaskarray(x)
+            d = np.where(v, np.ma.getdata(x), 0.)
+            if cnt is None:
+                cnt = np.zeros(x.shape[1])
+                s = np.zeros(x.shape[1])
+                ss = np.zeros(x.shape[1])
+            cnt += v.sum(axis=0)
+            s += d.sum(axis=0)
+            ss += (d * d).sum(axis=0)
+        self._x0mask = cnt == n  # store mask applied to original data
+        npoints = self._x0mask.sum()
+        if npoints < 2:
+            raise ValueError('Not enough grid cells with valid data for EOF analysis!')
+
+        m = s[self._x0mask] / n
+        if anomalies:
+            self._offset = m
+        else:
+            self._offset = np.zeros(npoints)
+        if normalize:
+            # results in unit variance for all data points
+            self._scale = np.sqrt(np.maximum(ss[self._x0mask] / n - m * m, 0.))
+        else:
+            self._scale = np.ones(npoints)
+        print '   EOF analysis with %s timesteps and %s grid cells ...' % (n, npoints)
+
+        if use_corr or cov_norm:
+            f = 1. / (npoints - 1)
+        else:
+            f = 1.
+
+        #/// 2) incremental SVD of the data matrix [time,npoints] ///
+        r = min(nmodes + oversampling, npoints)
+        S = np.zeros(0)
+        Vt = np.zeros((0, npoints))
+        total = 0.
+        for i1, i2, x in x0._iter_time_chunks():
+            x = self._center_chunk(self._get_data_chunk(x), use_corr, cov_norm)
+            total += np.sum(x * x)
+            U, S, Vt = linalg.svd(np.vstack([S[:, np.newaxis] * Vt, x]), full_matrices=False)
+            S = S[0:r]
+            Vt = Vt[0:r, :]
+        nmodes = min(nmodes, len(S))
+        S = S[0:nmodes]
+        Vt = Vt[0:nmodes, :]
+
+        #/// 3) eigenvectors (timeseries) and EOF patterns ///
+        self.eigvec = np.zeros((n, nmodes))
+        self.EOF = np.zeros((npoints, nmodes))
+        for i1, i2, x in x0._iter_time_chunks():
+            x = self._get_data_chunk(x)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.eigvec[i1:i2, :] = np.dot(self._center_chunk(x, use_corr, cov_norm), Vt.T) / S
+            self.EOF += np.dot(x.T, self.eigvec[i1:i2, :])
+
+        self.nmodes = nmodes
+        self.eigval = S * S * f
+        self._var = self.eigval / (total * f)  # explained variance
+
+    def _get_weighted_chunk(self, x):
+        """
+        area weighting of a chunk of data like in EOF
+
+        Parameters
+        ----------
+        x : masked array [time,ny,nx]
+
+        Returns
+        -------
+        weighted data [time,ngridcells]
+        """
+        x = np.ma.array(x, dtype='float').reshape(len(x), -1)
+        x.mask = np.ma.getmaskarray(x) | np.isnan(np.ma.getdata(x))
+        if not self._area_weighting:
+            return x
+
+        ca = np.asarray(self._x0.cell_area, dtype='float').reshape(-1)
+        if self._x0.weighting_type == 'valid':
+            w = np.where(x.mask, 0., ca)
+            w /= w.sum(axis=1)[:, np.newaxis]
+        elif self._x0.weighting_type == 'all':
+            w = np.ones(x.shape) * ca / ca.sum()
+        else:
+            raise ValueError('Invalid option for normtype: %s' % self._x0.weighting_type)
+        return x * np.sqrt(w)
+
+    def _get_data_chunk(self, x):
+        """
+        data of the valid grid cells for a chunk of data [time,ngridcells]
+        after weighting, removal of the mean and normalization
+        """
+        x = self._get_weighted_chunk(x)
+        return (np.ma.getdata(x)[:, self._x0mask] - self._offset) / self._scale
+
+    def _center_chunk(self, x, use_corr, cov_norm):
+        """
+        remove the mean (and normalize by the std) over all grid cells
+        for each timestep, like it is done for the covariance
+        (correlation) matrix of the EOF class
+        """
+        if use_corr or cov_norm:
+            x = x - x.mean(axis=1)[:, np.newaxis]
+        if use_corr:
+            x = x / x.std(axis=1, ddof=1)[:, np.newaxis]
+        return x
+
+
 class SVD(object):
     """
     class to perform singular value decomposition analysis
@@ -715,18 +997,13 @@ class SVD(object):
         """
 
         nt, n = x.shape
-        mx = np.sum(~x.mask, axis=0) == nt  # get mask for valid pixels only
-        m1 = mx
+        mx = np.sum(~np.ma.getmaskarray(x), axis=0) == nt  # get mask for valid pixels only
 
-        r = np.ones((nt, sum(mx))) * np.nan
-        for i in xrange(nt):
-            tmp = x.data[i, :]
-            if np.any(np.isnan(tmp[m1])):
-                raise ValueError('Nans are not allowed here!')
-            r[i, :] = tmp[m1] * 1.
-            del tmp
+        r = np.asarray(np.ma.getdata(x)[:, mx], dtype='float')
+        if np.any(np.isnan(r)):
+            raise ValueError('Nans are not allowed here!')
 
-        return np.ma.array(r), m1
+        return np.ma.array(r), mx
 
 #-----------------------------------------------------------------------
 
@@ -748,11 +1025,11 @@ class SVD(object):
         if x.ndim != 2:
             raise ValueError('Invalid shape for detrending')
         n, m = x.shape
-        for i in xrange(m):
-            h = x[:, i].copy()
-            h = plt.detrend_linear(h)
-            x[:, i] = h.copy()
-        return x
+        # least squares fit of offset and slope for all positions at once
+        G = np.ones((n, 2))
+        G[:, 1] = np.arange(n)
+        c = np.linalg.lstsq(G, np.ma.getdata(x), rcond=-1)[0]
+        return np.ma.array(np.ma.getdata(x) - np.dot(G, c))
 
 #-----------------------------------------------------------------------
 
@@ -770,11 +1047,7 @@ class SVD(object):
         -------
         normalized timeseries numpy array
         """
-        nt, nx = np.shape(x)
-        s = x.std(axis=0)  # temporal standard deviation
-        S = np.repeat(s, nt).reshape(nx, nt).T  # generate array with all same std
-        x /= S
-        del S, s
+        x /= x.std(axis=0)  # temporal standard deviation
         return x
 
 #-----------------------------------------------------------------------
@@ -783,6 +1056,11 @@ class SVD(object):
         """
         perform SVD analysis
 
+        The fractions of explained covariance (scf) are stored for all
+        modes, while the singular vectors (U, V), the expansion
+        coefficients (A, B) and the mode correlations are only stored
+        for the leading modes with scf > scf_threshold (at least one).
+
         Parameters
         ----------
         detrend : bool
@@ -809,26 +1087,34 @@ class SVD(object):
             x = self.__time_normalization(x)
             y = self.__time_normalization(y)
 
-        #/// calculate covariance matrix
-        print 'Construct covariance matrix ...'
-        C = dot(x.T, y)  # this covariance matrix does NOT contain the variances of the individual
-        # grid points, but only the covariance terms!
-        print 'Done!'
-        self.C = C
         self.x_used = x.copy()  # store vectors like they are used for SVD calculations
         self.y_used = y.copy()
 
-        #/// singular value decomposition
-        print '   Doing singular value decomposition xxxxxx ...'
-
-        U, s, V = linalg.svd(C)
+        #/// singular value decomposition of the covariance matrix C = x.T*y
+        # The covariance matrix [nx,ny] is never formed. As its rank is at most the number of timesteps,
+        # it is decomposed using the QR decompositions x.T = Qx*Rx and y.T = Qy*Ry, which results
+        # in C = Qx*(Rx*Ry.T)*Qy.T; only the small matrix Rx*Ry.T needs to be decomposed.
+        # Note that C does NOT contain the variances of the individual grid points, but only the
+        # covariance terms!
+        print '   Doing singular value decomposition ...'
+        Qx, Rx = linalg.qr(np.ma.getdata(x).T, mode='economic')
+        Qy, Ry = linalg.qr(np.ma.getdata(y).T, mode='economic')
+        W, s, Zt = linalg.svd(dot(Rx, Ry.T), full_matrices=False)
         print 'Done!'
-        L = linalg.diagsvd(s, len(C), len(V))  # construct diagonal maxtrix such that U L V.T = C; this is
-        # somewhat python specific
+
+        # fractions of variance explained CAUTION: not properly described in manual if squared or not!
+        # the full spectrum is kept, while the singular vectors and expansion coefficients are only
+        # kept for the leading modes above the threshold
+        scf = (s * s) / sum(s * s)
+        nmodes = max(np.sum(scf > self.scf_threshold), 1)
+        U = dot(Qx, W[:, 0:nmodes])  # singular vectors [nx,nmodes]
+        V = dot(Qy, Zt[0:nmodes, :].T)  # singular vectors [ny,nmodes]
+        s = s[0:nmodes]
+        L = np.diag(s)  # diagonal matrix such that U L V.T = C
 
         #/// expansion coefficients (time series)
         A = dot(x, U)
-        B = dot(y, V.T)  # ACHTUNG!!! SCHOULD BE B = dot(y,V)
+        B = dot(y, V)
 
         #/// store results
         self.U = U
@@ -836,9 +1122,20 @@ class SVD(object):
         self.L = L
         self.A = A
         self.B = B
-        self.scf = (s * s) / sum(s * s)  # fractions of variance explained CAUTION: not properly described in manual if squared or not!
+        self.scf = scf
         self.__get_mode_correlation()  # calculate correlation between modes
 
+#-----------------------------------------------------------------------
+
+    def _get_covariance(self):
+        """
+        covariance matrix C = x.T*y [nx,ny] of the data used for the
+        SVD analysis. It is not needed for the analysis itself and is
+        therefore only calculated on request.
+        """
+        return dot(np.ma.getdata(self.x_used).T, np.ma.getdata(self.y_used))
+    C = property(_get_covariance)
+
 #-----------------------------------------------------------------------
 
     def __get_mode_correlation(self):
@@ -846,11 +1143,9 @@ class SVD(object):
         calculate correlations between expansion modes
         of the two fields
         """
-        self.mcorr = []
-        for i in range(len(self.scf)):
-            c = np.corrcoef(self.A[:, i], self.B[:, i])[0][1]
-            self.mcorr.append(c)
-        self.mcorr = np.asarray(self.mcorr)
+        a = self.A - self.A.mean(axis=0)
+        b = self.B - self.B.mean(axis=0)
+        self.mcorr = np.sum(a * b, axis=0) / np.sqrt(np.sum(a * a, axis=0) * np.sum(b * b, axis=0))
 
 #-----------------------------------------------------------------------
 
@@ -970,7 +1265,8 @@ class SVD(object):
         ax1.set_ylabel('cumulated variance [-]', color='red')
         ax1.set_ylim(0., 1.)
 
-        ax2.plot(np.arange(n), self.mcorr, color='green')
+        # mode correlations are only available for the retained modes
+        ax2.plot(np.arange(len(self.mcorr)), self.mcorr, color='green')
         ax2.set_ylabel('mode correlation [-]', color='green')
         ax2.set_ylim(-1, 1.)
         ax2.grid(color='green')
@@ -1317,7 +1613,8 @@ class Diagnostic(object):
         x,y Data objects, where data needs to have been pre-processed
         to be a single vector
 
-        lags: list of lags
+        lags: list of lags; for a positive lag, x[lag:] is correlated
+              with y[:-lag]
         """
 
         if self.x.data.shape != self.y.data.shape:
@@ -1326,46 +1623,80 @@ class Diagnostic(object):
         if not plt.isvector(self.x.data):
             raise ValueError('Routine works only with vectorized data!')
 
-        if any(lags < 0.):
-            raise ValueError('Negative lags currently not supported yet!')
-
-        CO = []
-        for lag in lags:
-            hlpx = self.x.data.copy()
-            hlpy = self.y.data.copy()
-
-            if detrend_linear:
-                hlpx = plt.detrend_linear(hlpx)
-                hlpy = plt.detrend_linear(hlpy)
-            if detrend_mean:
-                hlpx = plt.detrend_mean(hlpx)
-                hlpy = plt.detrend_mean(hlpy)
-
-            #1) temporal subsetting of data
-            if lag > 0:
-                #temporal subset data
-                hlpx = hlpx[lag:]
-                hlpy = hlpy[:-lag]
-
-            #2) calculation of lagged correlation
-            if len(hlpx) > 1:
-                slope, intercept, r_value, p_value, std_err = stats.linregress(hlpx, hlpy)
-            else:
-                r_value = np.nan
-                p_value = 2.
+        r, p = self._lagged_correlation(lags, detrend_linear=detrend_linear, detrend_mean=detrend_mean)
+        CO = np.where(p < pthres, r, np.nan)[:, 0]
 
-            if p_value < pthres:
-                CO.append(r_value)
-            else:
-                CO.append(np.nan)
+        return CO
 
-        #~ #-- find best lag
-        #~ best_lag=abs(np.asarray(CO)).argmax(axis=0).astype('float')
-        #~ print 'BEST LAG: ', best_lag
+    def lagged_correlation(self, lags, pthres=1.01, detrend_linear=False, detrend_mean=False, blocksize=5000):
+        """
+        lagged correlation between the timeseries of all grid cells of
+        the x and y Data objects. For a positive lag, x[lag:] is
+        correlated with y[:-lag]; negative lags are supported as well.
 
-        CO = np.asarray(CO)
+        Parameters
+        ----------
+        lags : list
+            list of lags [timesteps]
+        pthres : float
+            significance threshold; correlations with a p-value
+            >= pthres are masked
+        detrend_linear : bool
+            remove linear trend of each timeseries before
+        detrend_mean : bool
+            remove mean of each timeseries before
+        blocksize : int
+            number of grid cells processed at once
 
-        return CO
+        Returns
+        -------
+        R : masked array
+            correlation [nlags,ny,nx]
+        best_lag : masked array
+            lag with the maximum absolute correlation [ny,nx]
+        """
+        if self.x.data.shape != self.y.data.shape:
+            raise ValueError('Invalid geometries!')
+
+        lags = np.asarray(lags)
+        r, p = self._lagged_correlation(lags, detrend_linear=detrend_linear,
+                                        detrend_mean=detrend_mean, blocksize=blocksize)
+        sz = (len(lags),) + self.x.data.shape[1:]
+        R = np.ma.array(r, mask=~(p < pthres)).reshape(sz)
+
+        valid = ~np.all(R.mask, axis=0)
+        best_lag = np.ma.array(lags[np.argmax(np.ma.filled(np.abs(R), -1.), axis=0)],
+                               mask=~valid).astype('float')
+
+        return R, best_lag
+
+    def _lagged_correlation(self, lags, detrend_linear=False, detrend_mean=False, blocksize=5000):
+        """
+        lagged correlation for all grid cells; the timeseries are
+        detrended only once and the covariances for all lags are
+        obtained from FFT based cross-correlations
+
+        Returns
+        -------
+        r, p : ndarray
+            correlation and p-value [nlags,ngridcells]
+        """
+        lags = np.asarray(lags).astype('int')
+        x = self.x.data
+        y = self.y.data
+        n = len(x)
+        x = np.ma.array(x).reshape((n, -1))
+        y = np.ma.array(y).reshape((n, -1))
+        npix = x.shape[1]
+
+        r = np.ones((len(lags), npix)) * np.nan
+        p = np.ones((len(lags), npix)) * np.nan
+        for i1 in xrange(0, npix, blocksize):
+            i2 = min(i1 + blocksize, npix)
+            hlpx = _detrend_time(x[:, i1:i2], linear=detrend_linear, mean=detrend_mean)
+            hlpy = _detrend_time(y[:, i1:i2], linear=detrend_linear, mean=detrend_mean)
+            r[:, i1:i2], p[:, i1:i2] = _lagged_correlation_block(hlpx, hlpy, lags)
+        return r, p
 
 #-----------------------------------------------------------------------
 
@@ -1450,12 +1781,10 @@ class Diagnostic(object):
                 weights = np.ones(self.x.data.shape)
             else:
                 weights = self.x._get_weighting_matrix()
-        else:
-            weights = weights.copy()
 
-        x = self.x.data.copy()
-        y = self.y.data.copy()
-        std_x = self.x.std.copy()
+        x = self.x.data
+        y = self.y.data
+        std_x = self.x.std
 
         if np.shape(x) != np.shape(y):
             print np.shape(x), np.shape(y)
@@ -1465,25 +1794,19 @@ class Diagnostic(object):
             e2 = sum(weights * (x - y) ** 2. / std_x)
         else:
             n = len(x)
-            x.shape = (n, -1)  # [time,index]
-            y.shape = (n, -1)
-            std_x.shape = (n, -1)
-            weights.shape = (n, -1)
+            x = x.reshape(n, -1)  # [time,index]
+            y = y.reshape(n, -1)
+            std_x = std_x.reshape(n, -1)
+            weights = weights.reshape(n, -1)
             if np.shape(x) != np.shape(weights):
                 print x.shape, weights.shape
                 raise ValueError('Invalid shape for weights!')
 
             # calculate weighted average for all timesteps
-            e2 = np.ones(n) * np.nan
-            for i in xrange(n):
-                d = weights[i, :] * ((x[i, :] - y[i, :]) ** 2.) / std_x[i, :]
-                e2[i] = np.sum(d)  # sum at end to avoid nan's   #it is important to use np.sum() !!
-                # TODO apply proper temporal weighting here as well!
+            # TODO apply proper temporal weighting here as well!
+            e2 = _reichler_e2(x, y, std_x, weights)
 
         if np.any(np.isnan(e2)):
-            print 'd: ', d
-            for i in xrange(n):
-                print 'std_x', i, std_x[i, :]
             print('Reichler: e2 contains NAN, this happens most likely if STDV == 0')
             return None
         else:
@@ -1582,7 +1905,7 @@ class Diagnostic(object):
 
 #-----------------------------------------------------------------------
 
-    def slice_corr(self, timmean=True, spearman=False, partial=False, z=None):
+    def slice_corr(self, timmean=True, spearman=False, partial=False, z=None, n_jobs=1):
         """
         perform correlation analysis for
         different starting times and length
@@ -1595,6 +1918,9 @@ class Diagnostic(object):
 
         partial: do partial correlation
         z: condition in case of partial correlation
+        n_jobs: number of processes used for the calculation for
+                different starting times (only timmean=True without
+                spearman or partial correlation)
         """
 
         if partial:
@@ -1639,65 +1965,69 @@ class Diagnostic(object):
 
         # perform correlation analysis
         print('   Doing slice correlation analysis ...')
-        i1 = 0
-        while i1 < n - 1:  # loop over starting year
-            i2 = i1 + 2
-            # loop over different lengths
-            while i2 < len(x) - 1:
-                length = i2 - i1
-
-                if timmean:
-                    """ temporal mean -> all grid cells only (temporal mean) """
-                    xdata = x[i1:i2, :].mean(axis=0)
-                    ydata = y[i1:i2, :].mean(axis=0)
-
-                    xmsk = xdata.mask
-                    ymsk = ydata.mask
-                    msk = xmsk | ymsk
+        if not (spearman or partial):
+            # all windows are calculated from cumulative sums over time
+            R, P, L, S = self._slice_corr_cumsum(x, y, timmean, n_jobs=n_jobs)
+        else:
+            i1 = 0
+            while i1 < n - 1:  # loop over starting year
+                i2 = i1 + 2
+                # loop over different lengths
+                while i2 < len(x) - 1:
+                    length = i2 - i1
+
+                    if timmean:
+                        """ temporal mean -> all grid cells only (temporal mean) """
+                        xdata = x[i1:i2, :].mean(axis=0)
+                        ydata = y[i1:i2, :].mean(axis=0)
+
+                        xmsk = xdata.mask
+                        ymsk = ydata.mask
+                        msk = xmsk | ymsk
+
+                        if partial:
+                            raise ValueError('No timmean supported yet for partial correlation!')
+
+                    else:
+                        """ all grid cells at all times """
+                        xdata = x.data[i1:i2, :]
+                        ydata = y.data[i1:i2, :]
+                        xmsk = x.mask[i1:i2, :]
+                        ymsk = y.mask[i1:i2, :]
+                        msk = xmsk | ymsk
+
+                        if partial:
+                            zdata = z.data[i1:i2, :]
+                            zmsk = z.mask[i1:i2, :]
+                            msk = msk | zmsk
+                            zdata = zdata[~msk].flatten()
+
+                    xdata = xdata[~msk].flatten()
+                    ydata = ydata[~msk].flatten()
+
+                    # use spearman correlation
+                    if spearman:
+                        tmpx = xdata.argsort()
+                        tmpy = ydata.argsort()
+                        xdata = tmpx
+                        ydata = tmpy
 
                     if partial:
-                        raise ValueError('No timmean supported yet for partial correlation!')
+                        #calculate residuals for individual correlations
+                        slope, intercept, r, p, stderr = stats.linregress(zdata, xdata)
+                        xdata = (xdata - intercept) / slope
 
-                else:
-                    """ all grid cells at all times """
-                    xdata = x.data[i1:i2, :]
-                    ydata = y.data[i1:i2, :]
-                    xmsk = x.mask[i1:i2, :]
-                    ymsk = y.mask[i1:i2, :]
-                    msk = xmsk | ymsk
+                        slope, intercept, r, p, stderr = stats.linregress(zdata, ydata)
+                        ydata = (ydata - intercept) / slope
 
-                    if partial:
-                        zdata = z.data[i1:i2, :]
-                        zmsk = z.mask[i1:i2, :]
-                        msk = msk | zmsk
-                        zdata = zdata[~msk].flatten()
-
-                xdata = xdata[~msk].flatten()
-                ydata = ydata[~msk].flatten()
-
-                # use spearman correlation
-                if spearman:
-                    tmpx = xdata.argsort()
-                    tmpy = ydata.argsort()
-                    xdata = tmpx
-                    ydata = tmpy
-
-                if partial:
-                    #calculate residuals for individual correlations
-                    slope, intercept, r, p, stderr = stats.linregress(zdata, xdata)
-                    xdata = (xdata - intercept) / slope
-
-                    slope, intercept, r, p, stderr = stats.linregress(zdata, ydata)
-                    ydata = (ydata - intercept) / slope
-
-                slope, intercept, r, p, stderr = stats.linregress(xdata, ydata)
-                R[length, i1] = r
-                P[length, i1] = p
-                L[length, i1] = length
-                S[length, i1] = slope
-
-                i2 += 1
-            i1 += 1
+                    slope, intercept, r, p, stderr = stats.linregress(xdata, ydata)
+                    R[length, i1] = r
+                    P[length, i1] = p
+                    L[length, i1] = length
+                    S[length, i1] = slope
+
+                    i2 += 1
+                i1 += 1
 
         self.slice_r = R
         self.slice_p = P
@@ -1747,52 +2077,56 @@ class Diagnostic(object):
 
         #--- perform correlation analysis
         print '   Doing slice correlation analysis ...'
-        i1 = 0
-        while i1 < n - 1:  # loop over starting year
-            i2 = n  # always entire time period
-            #- loop over different lengths
-            for gap in gaps:
-
-                if gap >= i2 - i1:
-                    continue
-                if timmean:
-                    # temporal mean -> all grid cells only (temporal mean)
-                    raise ValueError('TIMMEAN not supported yet for gap analysis')
-                    xdata = x[i1:i2, :].mean(axis=0)
-                    ydata = y[i1:i2, :].mean(axis=0)
-                    xmsk = xdata.mask
-                    ymsk = ydata.mask
-                    msk = xmsk | ymsk
-                else:
-                    # all grid cells at all times
-                    xdata = x.data.copy()
-                    ydata = y.data.copy()
-                    xmsk = x.mask.copy()  # [i1:i2,:]
-                    ymsk = y.mask.copy()  # [i1:i2,:]
-
-                    # mask data which has gaps and use whole period elsewhere
-                    xmsk[i1:i1 + gap, :] = True
-                    ymsk[i1:i1 + gap, :] = True
-
-                    msk = xmsk | ymsk
-
-                xdata = xdata[~msk].flatten()
-                ydata = ydata[~msk].flatten()
-
-                #use spearman correlation
-                if spearman:
-                    tmpx = xdata.argsort()
-                    tmpy = ydata.argsort()
-                    xdata = tmpx
-                    ydata = tmpy
-
-                slope, intercept, r, p, stderr = stats.linregress(xdata, ydata)
-                R[gap, i1] = r
-                P[gap, i1] = p
-                L[gap, i1] = gap - 1
-                S[gap, i1] = slope
-
-            i1 += 1
+        if (not timmean) and (not spearman):
+            # all gaps are calculated from cumulative sums over time
+            R, P, L, S = self._slice_corr_gap_cumsum(x, y)
+        else:
+            i1 = 0
+            while i1 < n - 1:  # loop over starting year
+                i2 = n  # always entire time period
+                #- loop over different lengths
+                for gap in gaps:
+
+                    if gap >= i2 - i1:
+                        continue
+                    if timmean:
+                        # temporal mean -> all grid cells only (temporal mean)
+                        raise ValueError('TIMMEAN not supported yet for gap analysis')
+                        xdata = x[i1:i2, :].mean(axis=0)
+                        ydata = y[i1:i2, :].mean(axis=0)
+                        xmsk = xdata.mask
+                        ymsk = ydata.mask
+                        msk = xmsk | ymsk
+                    else:
+                        # all grid cells at all times
+                        xdata = x.data.copy()
+                        ydata = y.data.copy()
+                        xmsk = x.mask.copy()  # [i1:i2,:]
+                        ymsk = y.mask.copy()  # [i1:i2,:]
+
+                        # mask data which has gaps and use whole period elsewhere
+                        xmsk[i1:i1 + gap, :] = True
+                        ymsk[i1:i1 + gap, :] = True
+
+                        msk = xmsk | ymsk
+
+                    xdata = xdata[~msk].flatten()
+                    ydata = ydata[~msk].flatten()
+
+                    #use spearman correlation
+                    if spearman:
+                        tmpx = xdata.argsort()
+                        tmpy = ydata.argsort()
+                        xdata = tmpx
+                        ydata = tmpy
+
+                    slope, intercept, r, p, stderr = stats.linregress(xdata, ydata)
+                    R[gap, i1] = r
+                    P[gap, i1] = p
+                    L[gap, i1] = gap - 1
+                    S[gap, i1] = slope
+
+                i1 += 1
 
         if pthres is not None:  # mask all insignificant values
             R = np.ma.array(R, mask=P > pthres)
@@ -1803,6 +2137,157 @@ class Diagnostic(object):
         self.slice_length_gap = L
         self.slice_slope_gap = S
 
+    def _get_slice_sums(self, x, y):
+        """
+        cumulative sums over time of the number of valid data pairs,
+        sum(x), sum(y), sum(x*x), sum(y*y), sum(x*y) over all grid
+        cells. The data is centered before to improve numerical accuracy.
+
+        Parameters
+        ----------
+        x, y : masked arrays [time,ngridcells]
+
+        Returns
+        -------
+        list of cumulative sums, each of size [time+1]
+        """
+        msk = np.ma.getmaskarray(x) | np.ma.getmaskarray(y)
+        v = ~msk
+        nv = max(v.sum(), 1)
+        xd = np.where(v, np.ma.getdata(x), 0.)
+        yd = np.where(v, np.ma.getdata(y), 0.)
+        xd = np.where(v, xd - xd.sum() / nv, 0.)
+        yd = np.where(v, yd - yd.sum() / nv, 0.)
+
+        res = []
+        for d in [v, xd, yd, xd * xd, yd * yd, xd * yd]:
+            c = np.zeros(len(x) + 1)
+            c[1:] = np.cumsum(d.sum(axis=1))
+            res.append(c)
+        return res
+
+    def _slice_corr_cumsum(self, x, y, timmean, n_jobs=1):
+        """
+        slice correlation for all starting times and lengths
+        using cumulative sums over time (see slice_corr())
+
+        Parameters
+        ----------
+        x, y : masked arrays [time,ngridcells]
+        timmean : bool
+            correlate temporal mean fields
+        n_jobs : int
+            number of processes for timmean=True
+
+        Returns
+        -------
+        R, P, L, S : ndarray
+            correlation, p-value, length and slope [length,start]
+        """
+        n = len(x)
+        R = np.ones((n, n)) * np.nan
+        P = np.ones((n, n)) * np.nan
+        L = np.ones((n, n)) * np.nan
+        S = np.ones((n, n)) * np.nan
+
+        if timmean:
+            # cumulative sums for each grid cell [time+1,ngridcells]
+            res = []
+            for d in [x, y]:
+                v = ~np.ma.getmaskarray(d)
+                c = np.zeros((n + 1, d.shape[1]))
+                c[1:] = np.cumsum(v, axis=0)
+                o = np.where(v, np.ma.getdata(d), 0.).sum(axis=0) / np.maximum(c[-1], 1.)
+                sm = np.zeros((n + 1, d.shape[1]))
+                sm[1:] = np.cumsum(np.where(v, np.ma.getdata(d) - o, 0.), axis=0)
+                res += [sm, c, o]
+            starts = np.arange(n - 1)
+            if n_jobs > 1:
+                from multiprocessing import Pool
+                tasks = [tuple([starts[i::n_jobs]] + res + [n]) for i in xrange(n_jobs)]
+                pool = Pool(processes=n_jobs)
+                try:
+                    results = pool.map(_slice_corr_timmean_block, tasks)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results = [_slice_corr_timmean_block(tuple([starts] + res + [n]))]
+            for block in results:
+                for i1, lengths, slope, r, p in block:
+                    R[lengths, i1] = r
+                    P[lengths, i1] = p
+                    L[lengths, i1] = lengths
+                    S[lengths, i1] = slope
+        else:
+            cn, sx, sy, sxx, syy, sxy = self._get_slice_sums(x, y)
+
+            # all windows [i1,i2) with length >= 2 and i2 < n - 1
+            lengths, i1 = np.nonzero(np.ones((n, n)).astype('bool'))
+            i2 = i1 + lengths
+            m = (lengths >= 2) & (i1 < n - 1) & (i2 < n - 1)
+            lengths = lengths[m]
+            i1 = i1[m]
+            i2 = i2[m]
+
+            N = cn[i2] - cn[i1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                Sx = sx[i2] - sx[i1]
+                Sy = sy[i2] - sy[i1]
+                slope, r, p = _linregress_sums(N, (sxx[i2] - sxx[i1]) - Sx * Sx / N,
+                                               (syy[i2] - syy[i1]) - Sy * Sy / N,
+                                               (sxy[i2] - sxy[i1]) - Sx * Sy / N)
+            R[lengths, i1] = r
+            P[lengths, i1] = p
+            L[lengths, i1] = lengths
+            S[lengths, i1] = slope
+
+        return R, P, L, S
+
+    def _slice_corr_gap_cumsum(self, x, y):
+        """
+        slice correlation for all starting times and gap sizes
+        using cumulative sums over time (see slice_corr_gap())
+
+        Parameters
+        ----------
+        x, y : masked arrays [time,ngridcells]
+
+        Returns
+        -------
+        R, P, L, S : ndarray
+            correlation, p-value, length and slope [gap,start]
+        """
+        n = len(x)
+        R = np.ones((n, n)) * np.nan
+        P = np.ones((n, n)) * np.nan
+        L = np.ones((n, n)) * np.nan
+        S = np.ones((n, n)) * np.nan
+
+        cn, sx, sy, sxx, syy, sxy = self._get_slice_sums(x, y)
+
+        # all gaps [i1,i1+gap) with i1 < n - 1 and gap < n - i1
+        gaps, i1 = np.nonzero(np.ones((n, n)).astype('bool'))
+        m = (i1 < n - 1) & (gaps < n - i1)
+        gaps = gaps[m]
+        i1 = i1[m]
+        i2 = i1 + gaps
+
+        # sums over the entire period without the gap
+        N = cn[-1] - (cn[i2] - cn[i1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Sx = sx[-1] - (sx[i2] - sx[i1])
+            Sy = sy[-1] - (sy[i2] - sy[i1])
+            slope, r, p = _linregress_sums(N, sxx[-1] - (sxx[i2] - sxx[i1]) - Sx * Sx / N,
+                                           syy[-1] - (syy[i2] - syy[i1]) - Sy * Sy / N,
+                                           sxy[-1] - (sxy[i2] - sxy[i1]) - Sx * Sy / N)
+        R[gaps, i1] = r
+        P[gaps, i1] = p
+        L[gaps, i1] = gaps - 1
+        S[gaps, i1] = slope
+
+        return R, P, L, S
+
 #-----------------------------------------------------------------------
     def _set_year_ticks(self, years, ax, axis='x', size=10, rotation=0.):
         """
@@ -1926,3 +2411,249 @@ class Diagnostic(object):
         ax3.clabel(CP3, inline=1, fontsize=10)
         ax4.clabel(CP4, inline=1, fontsize=10)
 
+
+def _reichler_e2(x, y, std_x, weights):
+    """
+    weighted squared differences after Reichler & Kim (2008) summed
+    over all grid cells for each timestep
+
+    Parameters
+    ----------
+    x : ndarray
+        reference data [time,index]
+    y : ndarray
+        data to be benchmarked; either a single dataset [time,index]
+        or a stack of datasets [n,time,index]
+    std_x : ndarray
+        standard deviation of reference data [time,index]
+    weights : ndarray
+        spatial weights [time,index]
+
+    Returns
+    -------
+    e2 : ndarray
+        E**2 for each timestep [time] or [n,time]
+    """
+    d = np.ma.subtract(y, x)
+    d = np.ma.divide(d * d * weights, std_x)
+    # sum at end to avoid nan's; it is important to use np.sum() !!
+    # timesteps without any valid data result in NaN
+    return np.ma.filled(np.sum(d, axis=-1), np.nan)
+
+
+def _linregress_sums(n, sxx, syy, sxy):
+    """
+    linear regression statistics (as stats.linregress()) for many
+    samples at once, given the number of values and the sums of
+    (co)variances of the centered data
+
+    Parameters
+    ----------
+    n : ndarray
+        number of valid values
+    sxx : ndarray
+        sum((x-mean(x))**2)
+    syy : ndarray
+        sum((y-mean(y))**2)
+    sxy : ndarray
+        sum((x-mean(x))*(y-mean(y)))
+
+    Returns
+    -------
+    slope, r, p : ndarray
+    """
+    TINY = 1.0e-20
+    n = np.asarray(n, dtype='float')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = sxy / np.sqrt(sxx * syy)
+        r = np.where((sxx == 0.) | (syy == 0.),
+                     np.where(sxy == 0., np.nan, 0.), r)
+        r = np.clip(r, -1., 1.)
+        slope = sxy / sxx
+
+        df = n - 2.
+        t = r * np.sqrt(df / ((1. - r + TINY) * (1. + r + TINY)))
+        p = 2. * stats.t.sf(np.abs(t), np.maximum(df, 1.))
+    p = np.where(n == 2., np.where(syy == 0., 1., 0.), p)
+
+    invalid = n < 2.
+    slope = np.where(invalid, np.nan, slope)
+    r = np.where(invalid, np.nan, r)
+    p = np.where(invalid, np.nan, p)
+    return slope, r, p
+
+
+def _slice_corr_timmean_block(args):
+    """
+    slice correlation of temporal mean fields for a set of
+    starting timesteps. For each starting timestep i1, the
+    correlations for all window lengths are calculated at once.
+    The temporal means of all windows are obtained from
+    cumulative sums over time.
+
+    Parameters
+    ----------
+    args : tuple
+        (starts, sx, cx, ox, sy, cy, oy, n) with
+        starts : list of starting timesteps
+        sx, sy : cumulative sums of valid data [n+1,npix]; an offset
+                 ox, oy [npix] has been substracted from the data
+                 for numerical accuracy
+        cx, cy : cumulative number of valid data [n+1,npix]
+        n : number of timesteps
+
+    Returns
+    -------
+    list of tuples (i1, lengths, slope, r, p)
+    """
+    starts, sx, cx, ox, sy, cy, oy, n = args
+    res = []
+    for i1 in starts:
+        lengths = np.arange(2, n - 1 - i1)
+        if len(lengths) == 0:
+            continue
+        i2 = i1 + lengths
+        nx = cx[i2] - cx[i1]
+        ny = cy[i2] - cy[i1]
+        valid = (nx > 0) & (ny > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xm = np.where(valid, (sx[i2] - sx[i1]) / nx + ox, 0.)  # [length,npix]
+            ym = np.where(valid, (sy[i2] - sy[i1]) / ny + oy, 0.)
+            nv = valid.sum(axis=1).astype('float')
+            dx = np.where(valid, xm - (xm.sum(axis=1) / nv)[:, np.newaxis], 0.)
+            dy = np.where(valid, ym - (ym.sum(axis=1) / nv)[:, np.newaxis], 0.)
+        slope, r, p = _linregress_sums(nv, (dx * dx).sum(axis=1),
+                                       (dy * dy).sum(axis=1),
+                                       (dx * dy).sum(axis=1))
+        res.append((i1, lengths, slope, r, p))
+    return res
+
+
+def _detrend_time(x, linear=False, mean=False):
+    """
+    remove linear trend or mean of the timeseries of each grid cell,
+    taking into account only valid values
+
+    Parameters
+    ----------
+    x : masked array
+        data [time,ngridcells]
+    linear : bool
+        remove linear trend (assumes equidistant timesteps)
+    mean : bool
+        remove mean value
+
+    Returns
+    -------
+    masked array [time,ngridcells]
+    """
+    if not (linear or mean):
+        return x
+    v = ~np.ma.getmaskarray(x)
+    nv = np.maximum(v.sum(axis=0), 1)
+    d = np.where(v, np.ma.getdata(x), 0.)
+    d = np.where(v, d - d.sum(axis=0) / nv, 0.)
+    if linear:
+        t = np.where(v, np.arange(len(x))[:, np.newaxis], 0.)
+        t = np.where(v, t - t.sum(axis=0) / nv, 0.)
+        stt = (t * t).sum(axis=0)
+        slope = (t * d).sum(axis=0) / np.where(stt > 0., stt, 1.)
+        d = d - slope * t
+    return np.ma.array(d, mask=~v)
+
+
+def _lagged_correlation_block(x, y, lags):
+    """
+    lagged correlation of the timeseries of a set of grid cells
+    for all lags at once. The number of valid pairs and the sums
+    needed for the regression are calculated for all lags by
+    FFT based cross-correlations.
+
+    Parameters
+    ----------
+    x, y : masked arrays [time,ngridcells]
+    lags : ndarray
+        lags; for lag >= 0, x[lag:] is correlated with y[:n-lag]
+
+    Returns
+    -------
+    r, p : ndarray [nlags,ngridcells]
+    """
+    n = len(x)
+    vx = ~np.ma.getmaskarray(x)
+    vy = ~np.ma.getmaskarray(y)
+    xd = np.where(vx, np.ma.getdata(x), 0.)
+    yd = np.where(vy, np.ma.getdata(y), 0.)
+    vx &= ~np.isnan(xd)
+    vy &= ~np.isnan(yd)
+    # center data for numerical accuracy
+    xd = np.where(vx, xd - np.where(vx, xd, 0.).sum(axis=0) / np.maximum(vx.sum(axis=0), 1), 0.)
+    yd = np.where(vy, yd - np.where(vy, yd, 0.).sum(axis=0) / np.maximum(vy.sum(axis=0), 1), 0.)
+
+    # zero padding avoids circular overlap
+    nfft = 2 ** int(np.ceil(np.log2(max(2 * n - 1, 1))))
+    ok = np.abs(lags) < n
+    idx = lags[ok] % nfft
+
+    fx = [np.fft.rfft(h, nfft, axis=0) for h in [vx.astype('float'), xd, xd * xd]]
+    fy = [np.conj(np.fft.rfft(h, nfft, axis=0)) for h in [vy.astype('float'), yd, yd * yd]]
+
+    def xcorr(a, b):
+        return np.fft.irfft(a * b, nfft, axis=0)[idx]
+
+    N = np.round(xcorr(fx[0], fy[0]))
+    Sx = xcorr(fx[1], fy[0])
+    Sy = xcorr(fx[0], fy[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sxx = xcorr(fx[2], fy[0]) - Sx * Sx / N
+        syy = xcorr(fx[0], fy[2]) - Sy * Sy / N
+        sxy = xcorr(fx[1], fy[1]) - Sx * Sy / N
+    # remove roundoff errors of the FFT
+    sxx = np.where(np.abs(sxx) < 1.E-10 * np.abs(xcorr(fx[2], fy[0])), 0., sxx)
+    syy = np.where(np.abs(syy) < 1.E-10 * np.abs(xcorr(fx[0], fy[2])), 0., syy)
+    slope, rr, pp = _linregress_sums(N, sxx, syy, sxy)
+
+    r = np.ones((len(lags), x.shape[1])) * np.nan
+    p = np.ones((len(lags), x.shape[1])) * np.nan
+    r[ok] = rr
+    p[ok] = pp
+    return r, p
+
+
+def _randomized_svd(A, k, oversampling=10, n_iter=4, seed=None):
+    """
+    randomized truncated SVD of a matrix
+
+    Parameters
+    ----------
+    A : ndarray
+        matrix [m,n]
+    k : int
+        number of singular values/vectors
+    oversampling : int
+        additional number of random vectors for better accuracy
+    n_iter : int
+        number of power iterations
+    seed : int
+        seed of the random number generator
+
+    Returns
+    -------
+    U, s, Vt : ndarray
+        leading k singular vectors and values, as from svd()
+
+    References
+    ----------
+    Halko, N., Martinsson, P.G., Tropp, J.A. (2011): Finding structure with
+    randomness: Probabilistic algorithms for constructing approximate
+    matrix decompositions, SIAM Review, 53(2), 217-288
+    """
+    rng = np.random.RandomState(seed)
+    m, n = A.shape
+    l = min(k + oversampling, min(m, n))
+    Q, R = np.linalg.qr(np.dot(A, rng.standard_normal((n, l))))
+    for i in xrange(n_iter):
+        Q, R = np.linalg.qr(np.dot(A.T, Q))
+        Q, R = np.linalg.qr(np.dot(A, Q))
+    U, s, Vt = linalg.svd(np.dot(Q.T, A), full_matrices=False)
+    return np.dot(Q, U)[:, 0:k], s[0:k], Vt[0:k, :]
@@ -5,6 +5,14 @@ This file is part of pyCMBS.
 For COPYING and LICENSE details, please refer to the LICENSE file
 """
 
+import sys
+import numpy as np
+from matplotlib import pylab as plt
+import matplotlib.cm as cm
+import matplotlib.colors as col
+
+from pycmbs.mapping import map_plot
+
 
 class Koeppen(object):
     """
@@ -20,9 +28,13 @@ class Koeppen(object):
         Parameters
         ----------
         temp : Data
-            data objekt of temperature
+            data objekt of temperature; monthly climatology [12,ny,nx].
+            Multiple climatological windows can be classified at once
+            by providing [12*nwindows,ny,nx]
         precip : Data
-            data objekt of precipitation
+            data objekt of precipitation (same geometry as temp). The
+            latitudes are used to determine the local summer and winter
+            half year of each grid cell
         lsm : Data
             data objekt of land-sea-mask (0.0 to 1.0)
 
@@ -57,57 +69,79 @@ class Koeppen(object):
         self.precip = precip.mulc(60. * 60. * 24. * 365. / 12., copy=True)
         self.temp = temp.subc(273.15, copy=True)  # ??? Unklar warum nicht 'temp.subc(273.15)'
 
-        Psum = self.precip.timsum(return_object=True)            # Berechnet die Summe der Jahresniederschlag
-
         nt, ny, nx = self.temp.shape
-        nlat = ny
-        nlon = nx
-
-        Pmin = self.precip.data.min(axis=0)
-        Pmax = self.precip.data.max(axis=0)
-
-        precipHS = self.precip.copy()
-        precipHS.data[(0, 1, 2, 3, 4, 5), 0:(nlat / 2 - 1), :] \
-            = self.precip.data[(3, 4, 5, 6, 7, 8), 0:(nlat / 2 - 1), :]
-        precipHS.data[(6, 7, 8, 9, 10, 11), 0:(nlat / 2 - 1), :] \
-            = self.precip.data[(3, 4, 5, 6, 7, 8), 0:(nlat / 2 - 1), :]
-        precipHS.data[(0, 1, 2, 3, 4, 5), (nlat / 2):(nlat - 1), :] \
-            = self.precip.data[(0, 1, 2, 9, 10, 11), (nlat / 2):(nlat - 1), :]
-        precipHS.data[(6, 7, 8, 9, 10, 11), (nlat / 2):(nlat - 1), :] \
-            = self.precip.data[(0, 1, 2, 9, 10, 11), (nlat / 2):(nlat - 1), :]
-
-        precipHW = self.precip.copy()
-        precipHW.data[(0, 1, 2, 3, 4, 5), 0:(nlat / 2 - 1), :] = self.precip.data[(0, 1, 2, 9, 10, 11), 0:(nlat / 2 - 1), :]
-        precipHW.data[(6, 7, 8, 9, 10, 11), 0:(nlat / 2 - 1), :] = self.precip.data[(0, 1, 2, 9, 10, 11), 0:(nlat / 2 - 1), :]
-        precipHW.data[(0, 1, 2, 3, 4, 5), (nlat / 2):(nlat - 1), :] = self.precip.data[(3, 4, 5, 6, 7, 8), (nlat / 2):(nlat - 1), :]
-        precipHW.data[(6, 7, 8, 9, 10, 11), (nlat / 2):(nlat - 1), :] = self.precip.data[(3, 4, 5, 6, 7, 8), (nlat / 2):(nlat - 1), :]
-
-        PminHS = precipHS.data.min(axis=0)   # Bestimmt den minimalen Monastniederschlag aus PmaxHS
-        PmaxHS = precipHS.data.max(axis=0)   # Bestimmt den maximalen Monastniederschlag aus PmaxHS
-        PminHW = precipHW.data.min(axis=0)   # Bestimmt den minimalen Monastniederschlag aus PminHW
-        PmaxHW = precipHW.data.max(axis=0)   # Bestimmt den maximalen Monastniederschlag aus PminHW
-
-        Tavg = self.temp.data.mean(axis=0)   # Bestimmt die mittlere Jahrestemperatur
-        Tmin = self.temp.data.min(axis=0)     # Bestimmt die minimale Monatstemperatur
-        Tmax = self.temp.data.max(axis=0)     # Bestimmt die maximale Jahrestemperatur
+        if (nt % 12 != 0) or (nt == 0):
+            raise ValueError('ERROR: Monthly climatologies (12 timesteps per window) are required')
+        nw = nt // 12  # number of climatological windows
+
+        P = self.precip.data.reshape((nw, 12, ny, nx))
+        T = self.temp.data.reshape((nw, 12, ny, nx))
+
+        Psum = np.ma.getdata(P.sum(axis=1))   # Berechnet die Summe der Jahresniederschlag
+        Pmin = P.min(axis=1)
+        # precipitation extremes of the local summer (HS) and winter (HW) half year
+        HS, HW = self.precip.get_half_year_statistics(months=np.tile(np.arange(1, 13), nw), window=12)
+        PminHS = HS.hmin
+        PmaxHS = HS.hmax
+        PminHW = HW.hmin
+        PmaxHW = HW.hmax
+
+        Tavg = T.mean(axis=1)   # Bestimmt die mittlere Jahrestemperatur
+        Tmin = T.min(axis=1)     # Bestimmt die minimale Monatstemperatur
+        Tmax = T.max(axis=1)     # Bestimmt die maximale Jahrestemperatur
+
+        clim = self._classify(Psum, Pmin, PminHS, PminHW, PmaxHS, PmaxHW, Tavg, Tmin, Tmax)
 
         self.Clim = self.precip.timmean(return_object=True)
         self.Clim.units = "climate type"
+        msk = np.ma.getmaskarray(P.mean(axis=1)) | (np.ma.getdata(self.lsm.data) < 0.5)
+        if nw == 1:
+            self.Clim.data = np.ma.array(clim[0].astype('float'), mask=msk[0])
+        else:
+            self.Clim.data = np.ma.array(clim.astype('float'), mask=msk)
+            self.Clim.time = self.precip.time[::12].copy()
+
+    def _classify(self, psum, pmin, pminhs, pminhw, pmaxhs, pmaxhw, tavg, tmin, tmax):
+        """
+        classification of all grid cells at once; the decision rules
+        are the same as in set_clim(). Invalid (masked) values result
+        in the same class as in set_clim(), where comparisons with
+        masked values are False.
+
+        Parameters
+        ----------
+        arrays of the same shape with the parameters of set_clim()
+
+        Returns
+        -------
+        clim : ndarray (int) with the climate type
+        """
+        def lt(a, b):
+            return np.ma.filled(np.ma.less(a, b), False)
+
+        def gt(a, b):
+            return np.ma.filled(np.ma.greater(a, b), False)
+
+        p = psum / 10.
+
+        def arid(t):  # B
+            return np.where(lt(p, t), 6, 5)  # BW, BS
+
+        def cold(c, d):  # E or C/D
+            return np.where(lt(tmax, 10), np.where(lt(tmax, 0), 14, 13), np.where(gt(tmin, -3), c, d))
+
+        s = lt(pminhs, 40) & lt(pminhs, pmaxhw / 3)  # -s
+        w = lt(pminhw, pmaxhs / 10)  # -w
+
+        climA = np.where(gt(pmin, 60), 1,
+                np.where(gt(pmin, 0.04 * (2500 - psum)), 2,
+                np.where(s, np.where(lt(p, 2 * tavg), arid(tavg), 3),
+                         np.where(lt(p, 2 * (tavg + 14)), arid(tavg + 14), 4))))
+        climCDE = np.where(s, np.where(lt(p, 2 * tavg), arid(tavg), cold(8, 11)),
+                  np.where(w, np.where(lt(p, 2 * (tavg + 14)), arid(tavg + 14), cold(9, 12)),
+                           np.where(lt(p, 2 * (tavg + 7)), arid(tavg + 7), cold(7, 10))))
 
-        for lat in range(0, nlat):
-            for lon in range(0, nlon):
-                psum = Psum.data.data[lat][lon]
-                pmin = Pmin[lat][lon]
-                pminhs = PminHS[lat][lon]
-                pminhw = PminHW[lat][lon]
-                pmaxhs = PmaxHS[lat][lon]
-                pmaxhw = PmaxHW[lat][lon]
-                tavg = Tavg[lat][lon]
-                tmin = Tmin[lat][lon]
-                tmax = Tmax[lat][lon]
-                self.Clim.data.data[lat][lon] = self.set_clim(psum, pmin, pminhs, pminhw, pmaxhs, pmaxhw, tavg, tmin, tmax)
-
-        self.Clim.data.mask[less(self.lsm.data, 0.5)] = True
+        return np.where(gt(tmin, 18), climA, climCDE).astype('int')
 
     def koeppen_cmap(self):
         """
@@ -257,7 +291,7 @@ class Koeppen(object):
 
         ny, nx = self.Clim.data.data.shape
         for ny in range(0, ny - 1):
-            Aweight = cos(self.Clim.lat[ny][0] / 180 * 3.14159265359)
+            Aweight = np.cos(self.Clim.lat[ny][0] / 180 * 3.14159265359)
             for nx in range(0, nx - 1):
                 clim = int(self.Clim.data.data[ny][nx])
                 climfrac[clim - 1] = climfrac[clim - 1] + Aweight
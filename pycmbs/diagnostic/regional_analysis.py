@@ -23,11 +23,46 @@ import pickle
 from pycmbs.plots import pm_bar, add_nice_legend
 from pycmbs.mapping import map_plot
 from pycmbs.data import Data
+from pycmbs.aggregation import RegionAggregator
 from pycmbs.anova import *
 from pycmbs.taylor import Taylor
 from pycmbs.benchmarking.report import Report
 
 from pycmbs.plots.violin import ViolinPlot
+from pycmbs.diagnostic.diagnostic_basic import _linregress_sums
+
+
+def _linregress_columns(x, y):
+    """
+    linear regression (as stats.mstats.linregress()) between the
+    columns of x and y; only pairs which are valid in both x and y
+    are taken into account
+
+    Parameters
+    ----------
+    x : masked array
+        data [nsamples,ncolumns]
+    y : masked array
+        data [nsamples,ncolumns]
+
+    Returns
+    -------
+    slope, intercept, r, p : ndarray
+        statistics for each column [ncolumns]
+    """
+    valid = ~(np.ma.getmaskarray(x) | np.ma.getmaskarray(y))
+    xv = np.where(valid, np.ma.getdata(x), 0.)
+    yv = np.where(valid, np.ma.getdata(y), 0.)
+    n = valid.sum(axis=0)
+    c = np.maximum(n, 1)
+    xm = xv.sum(axis=0) / c
+    ym = yv.sum(axis=0) / c
+    dx = np.where(valid, xv - xm, 0.)
+    dy = np.where(valid, yv - ym, 0.)
+    slope, r, p = _linregress_sums(n, (dx * dx).sum(axis=0),
+                                   (dy * dy).sum(axis=0), (dx * dy).sum(axis=0))
+    intercept = ym - slope * xm
+    return slope, intercept, r, p
 
 
 class RegionalAnalysis(object):
@@ -157,85 +192,41 @@ class RegionalAnalysis(object):
         if (self.x is None) or (self.y is None):
             return {'analysis_A': None, 'analysis_B': None, 'analysis_C': None}
 
+        if self.x.ndim != 3:
+            raise ValueError('Correlation analysis requires data of dimension [nt,ny,nx]')
+
         #======================================================================
         # A) calculate once correlation and then calculate regional statistics
         RO, PO = self.x.correlate(self.y, pthres=pthres,
                                   spearman=False, detrend=False)
-        corrstat1 = RO.condstat(self.region)  # gives a dictionary already
-
-        correlations = []
-        correlations1 = []
-        slopes = []
-        slopes1 = []
-        pvalues = []
-        pvalues1 = []
-        intercepts = []
-        intercepts1 = []
-        ids = []
-        stdx = []
-        stdy = []
-        vals = self._get_unique_region_ids()
-        for v in vals:
-            x = self._get_masked_data(self.x, v)
-            y = self._get_masked_data(self.y, v)
-
-            #==================================================================
-            # B) calculate regional statistics based on entire dataset for a
-            # region
-            xvec = x.data.flatten()
-            yvec = y.data.flatten()
-            slope, intercept, r_value, p_value, std_err = stats.mstats.linregress(
-                xvec, yvec)
-            ids.append(v)
-            slopes.append(slope)
-            correlations.append(r_value)
-            pvalues.append(p_value)
-            intercepts.append(intercept)
-            stdx.append(xvec.std())
-            stdy.append(yvec.std())
-            del xvec, yvec, slope, intercept, r_value, p_value, std_err
-
-            #==================================================================
-            # C) fldmean() for each region and then correlate
-            xm = x.fldmean(return_data=True)
-            ym = y.fldmean(return_data=True)
-            sh = xm.shape
-            if xm.ndim != 3:
-                raise ValueError('Invalid shape: %s' % sh)
-            if sh[0] != xm.nt:
-                raise ValueError(
-                    'Timeseries should be of dimension [nt,1,1], %s' % str(sh))
-            if sh[1] != 1:
-                raise ValueError(
-                    'Timeseries should be of dimension [nt,1,1], %s' % str(sh))
-            if sh[2] != 1:
-                raise ValueError(
-                    'Timeseries should be of dimension [nt,1,1], %s' % str(sh))
-            slope1, intercept1, r_value1, p_value1, std_err1 = stats.mstats.linregress(
-                xm.data[:, 0, 0],
-                ym.data[:, 0, 0])
-
-            slopes1.append(slope1)
-            correlations1.append(r_value1)
-            pvalues1.append(p_value1)
-            intercepts1.append(intercept1)
-
-            # TODO
-            print(
-                'TODO: how to deal with area weighting in global correlation analyis ????')
-
-            del x, y, xm, ym
-        ids = np.asarray(ids)
-        slopes = np.asarray(slopes)
-        slopes1 = np.asarray(slopes1)
-        correlations = np.asarray(correlations)
-        correlations1 = np.asarray(correlations1)
-        pvalues = np.asarray(pvalues)
-        pvalues1 = np.asarray(pvalues1)
-        intercepts = np.asarray(intercepts)
-        intercepts1 = np.asarray(intercepts1)
-        stdx = np.asarray(stdx)
-        stdy = np.asarray(stdy)
+        corrstat1 = self._condstat(RO)  # gives a dictionary already
+
+        # all regions are analyzed at once; see RegionAggregator
+        vals = np.ma.compressed(self._get_unique_region_ids())
+        A = RegionAggregator(self.region.data, ids=vals)
+        vals = A.ids
+
+        #==================================================================
+        # B) calculate regional statistics based on entire dataset for a
+        # region
+        mom = A.moments(self.x.data, self.y.data)
+        slopes, correlations, pvalues = _linregress_sums(mom['n'], mom['sxx'], mom['syy'], mom['sxy'])
+        intercepts = np.ma.filled(mom['ymean'] - slopes * mom['xmean'], np.nan)
+        hlp = A.moments(self.x.data, self.x.data)
+        stdx = np.sqrt(hlp['sxx'] / np.maximum(hlp['n'], 1))
+        stdx[hlp['n'] == 0] = np.nan
+        hlp = A.moments(self.y.data, self.y.data)
+        stdy = np.sqrt(hlp['sxx'] / np.maximum(hlp['n'], 1))
+        stdy[hlp['n'] == 0] = np.nan
+        del mom, hlp
+
+        #==================================================================
+        # C) fldmean() for each region and then correlate
+        # TODO: how to deal with area weighting in global correlation analyis
+        xm = self._region_fldmean(A, self.x)
+        ym = self._region_fldmean(A, self.y)
+        slopes1, intercepts1, correlations1, pvalues1 = _linregress_columns(xm, ym)
+        del xm, ym
 
         def _reshuffle(d):
             """reshuffle structure of output dictionary"""
@@ -290,6 +281,75 @@ class RegionalAnalysis(object):
     def _get_unique_region_ids(self):
         return np.unique(self.region.data.flatten())
 
+    def _condstat(self, x):
+        """
+        conditional statistics of data for each region
+        (mean, std, sum, min, max for each timestep)
+
+        The results are the same as from x.condstat(self.region),
+        but all regions are processed at once.
+
+        Parameters
+        ----------
+        x : Data
+            data to be analyzed
+
+        Returns
+        -------
+        res : dict
+            dictionary with the region IDs as keys; None if no
+            region is available
+        """
+        # condstat() uses the integer values of the region IDs
+        ids = np.unique(np.ma.compressed(self.region.data)).astype(int)
+        if len(ids) == 0:
+            return None
+        A = RegionAggregator(self.region.data, ids=ids)
+        s = A.statistics(x.data)
+
+        try:
+            thedate = x.date
+        except:
+            thedate = None
+
+        # std is only calculated for regions with more than two cells
+        nostd = np.ma.getmaskarray(s['std']) | (A.ncells <= 2)
+        res = {}
+        for i in xrange(len(A.ids)):
+            hlp = {'mean': s['mean'][:, i], 'sum': s['sum'][:, i],
+                   'min': s['min'][:, i], 'max': s['max'][:, i]}
+            for k in hlp.keys():
+                hlp[k] = hlp[k].filled(np.nan)
+            hlp.update({'std': np.where(nostd[:, i], np.nan, s['std'][:, i].filled(0.)),
+                        'time': thedate})
+            res.update({A.ids[i]: hlp})
+        return res
+
+    def _region_fldmean(self, A, x):
+        """
+        spatial mean of each region, as from x.fldmean() applied
+        to the data masked for each region
+
+        Parameters
+        ----------
+        A : RegionAggregator
+            aggregator for the regions
+        x : Data
+            data [nt,ny,nx]
+
+        Returns
+        -------
+        r : masked array
+            spatial means [nt,nregions]
+        """
+        if x.weighting_type == 'valid':
+            total = None
+        elif x.weighting_type == 'all':
+            total = np.asarray(x.cell_area).sum()
+        else:
+            raise ValueError('Invalid option for normtype: %s' % x.weighting_type)
+        return A.fldmean(x.data, weights=x.cell_area, total=total)
+
     def _get_masked_data(self, x, id):
         """
         mask dataobject for a particular region
@@ -391,9 +451,9 @@ class RegionalAnalysis(object):
         xstat = None
         ystat = None
         if self.x is not None:
-            xstat = self.x.condstat(self.region)
+            xstat = self._condstat(self.x)
         if self.y is not None:
-            ystat = self.y.condstat(self.region)
+            ystat = self._condstat(self.y)
         self.statistics.update({'xstat': xstat})
         self.statistics.update({'ystat': ystat})
 
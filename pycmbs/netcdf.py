@@ -9,6 +9,7 @@ This module allows a flexible choice of the netCDF backend
 """
 
 import os
+import numpy as np
 
 valid_backends = ['netCDF4']
 
@@ -70,6 +71,7 @@ class NetCDFHandler(object):
                     file %s was not existing and could also \
                     not be generated!' % filename)
 
+        self.filename = filename
         if self.type.lower() == 'netcdf4':
             if mode == 'r':
                 self.F = self.handler.Dataset(filename, mode=mode)
@@ -143,6 +145,30 @@ class NetCDFHandler(object):
         else:
             raise ValueError('Something went wrong!')
 
+    def get_variable_proxy(self, varname, level=None):
+        """
+        Get a lazy proxy for a particular variable. In contrast to
+        get_variable() no data is read at this stage. Data is only
+        read when slices of the proxy are accessed.
+
+        Parameters
+        ----------
+        varname : str
+            variable name of the netcdf variable
+        level : int
+            level to select for 4D variables [time,level,ny,nx]
+
+        Returns
+        -------
+        proxy : NetCDFVariableProxy
+        """
+        if self.type.lower() == 'netcdf4':
+            return NetCDFVariableProxy(self.filename, varname, level=level,
+                                       netcdf_backend=self.type,
+                                       fill_value=self._get_fill_value(varname))
+        else:
+            raise ValueError('Something went wrong!')
+
     def set_attribute(self, varname, key, value):
         """
         set attributes for a field
@@ -269,3 +295,341 @@ class NetCDFHandler(object):
 
     def close(self):
         self.F.close()
+
+
+class NetCDFVariableProxy(object):
+
+    """
+    Lazy proxy for a [time,ny,nx] variable in a netCDF file
+
+    The proxy only stores the information needed to access the
+    variable on file. Data is read on demand for a range of timesteps,
+    which allows to stream through large files in temporal chunks
+    without keeping the entire data cube in memory.
+
+    All postprocessing which is done by the Data class when reading
+    data (masking of fill values, rescaling, application of an
+    external mask, flipping of latitudes) is applied to every chunk
+    that is read.
+    """
+
+    def __init__(self, filename, varname, level=None,
+                 netcdf_backend='netCDF4', fill_value=None):
+        """
+        Parameters
+        ----------
+        filename : str
+            name of netCDF file
+        varname : str
+            name of variable to read
+        level : int
+            level to select for 4D variables
+        netcdf_backend : str
+            netCDF backend to use
+        fill_value : float
+            fill value of the variable; values equal to the
+            fill_value are masked
+        """
+        self.filename = filename
+        self.varname = varname
+        self.level = level
+        self.netcdf_backend = netcdf_backend
+        self.fill_value = fill_value
+
+        # postprocessing applied to each chunk
+        self.scale_factor = 1.
+        self.valid_mask = None  # True for valid data
+        self.flipud = False
+
+        File = NetCDFHandler(netcdf_backend=self.netcdf_backend)
+        File.open_file(self.filename, 'r')
+        shape = File.get_variable_handler(self.varname).shape
+        File.close()
+
+        if len(shape) == 4:
+            if self.level is None:
+                raise ValueError('4-dimensional variables not supported yet! Either remove a dimension or specify a level!')
+            shape = (shape[0], shape[2], shape[3])
+        if len(shape) != 3:
+            raise ValueError('Lazy reading only supported for [time,ny,nx] variables!')
+        self._file_shape = shape
+
+        # temporal window [i1:i2] of file timesteps that is visible
+        self.i1 = 0
+        self.i2 = shape[0]
+
+    def _get_shape(self):
+        return (self.i2 - self.i1, self._file_shape[1], self._file_shape[2])
+    shape = property(_get_shape)
+
+    def _get_ndim(self):
+        return 3
+    ndim = property(_get_ndim)
+
+    def __len__(self):
+        return self.i2 - self.i1
+
+    def set_time_window(self, i1, i2):
+        """
+        restrict the proxy to the timesteps [i1:i2] relative to the
+        current time window
+        """
+        if i2 < i1:
+            raise ValueError('Invalid indices for time window')
+        i2 = min(i2, len(self))
+        self.i2 = self.i1 + i2
+        self.i1 = self.i1 + i1
+
+    def read(self, i1, i2):
+        """
+        read timesteps [i1:i2] (relative to the current time window)
+
+        Returns
+        -------
+        data : masked array [i2-i1,ny,nx]
+        """
+        i1 = max(i1, 0)
+        i2 = min(i2, len(self))
+        x = self._read_file(self.filename, self.i1 + i1, self.i1 + i2)
+        return self._postprocess(x)
+
+    def _read_file(self, filename, j1, j2):
+        """
+        read the timesteps [j1:j2] of the variable from a file
+        without any postprocessing
+        """
+        File = NetCDFHandler(netcdf_backend=self.netcdf_backend)
+        File.open_file(filename, 'r')
+        var = File.get_variable_handler(self.varname)
+        if self.level is None:
+            x = var[j1:j2, :, :]
+        else:
+            x = var[j1:j2, self.level, :, :]
+        File.close()
+        return x
+
+    def _postprocess(self, x):
+        """
+        postprocessing of data read from file (masking of fill
+        values, rescaling, external mask, flipping of latitudes)
+        """
+        x = np.ma.array(x, dtype='float', copy=False)
+        msk = np.ma.getmaskarray(x) | np.isnan(x.data)
+        if self.fill_value is not None:
+            msk |= x.data == self.fill_value
+        x = np.ma.array(x.data, mask=msk)
+
+        x *= self.scale_factor
+        if self.valid_mask is not None:
+            x.mask |= ~self.valid_mask
+        if self.flipud:
+            x = x[:, ::-1, :]
+        return x
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        tkey = key[0]
+        skey = (slice(None),) + key[1:]
+        if isinstance(tkey, slice):
+            i1, i2, step = tkey.indices(len(self))
+            if step < 0:
+                return self.read(0, len(self))[tkey][skey]
+            return self.read(i1, i2)[::step][skey]
+        elif np.isscalar(tkey):
+            i = int(tkey)
+            if i < 0:
+                i += len(self)
+            if (i < 0) or (i >= len(self)):
+                raise IndexError('Time index out of range!')
+            return self.read(i, i + 1)[skey][0]
+        else:
+            idx = np.arange(len(self))[tkey]
+            if len(idx) == 0:
+                return self.read(0, 0)[skey]
+            i1 = idx.min()
+            return self.read(i1, idx.max() + 1)[idx - i1][skey]
+
+    def iter_chunks(self, chunk_size):
+        """
+        iterate over the data in temporal chunks
+
+        Parameters
+        ----------
+        chunk_size : int
+            number of timesteps per chunk
+
+        Returns
+        -------
+        generator of (i1, i2, data) with data being the masked array
+        for the timesteps [i1:i2]
+        """
+        if chunk_size < 1:
+            raise ValueError('Invalid chunk size!')
+        n = len(self)
+        for i1 in xrange(0, n, chunk_size):
+            i2 = min(i1 + chunk_size, n)
+            yield i1, i2, self.read(i1, i2)
+
+    def copy(self):
+        """
+        copy the proxy (the data on file is not copied)
+        """
+        r = self.__class__.__new__(self.__class__)
+        r.__dict__.update(self.__dict__)
+        if self.valid_mask is not None:
+            r.valid_mask = self.valid_mask.copy()
+        return r
+
+
+class NetCDFMultiFileProxy(NetCDFVariableProxy):
+
+    """
+    Lazy proxy for a [time,ny,nx] variable which is split into
+    several netCDF files (e.g. yearly or decadal files)
+
+    The files are presented as a single, time sorted variable
+    (a virtual 'cdo mergetime'), without writing a merged file.
+    Only the time axes of the files are read when the proxy is
+    created. When data is read, only the files (and records)
+    which contain the requested timesteps are accessed. Thus a
+    temporal subset of a long record only reads the files
+    which are needed.
+
+    The time of all files is given in the units of the first file.
+    """
+
+    def __init__(self, filenames, varname, time_var='time', level=None,
+                 netcdf_backend='netCDF4', fill_value=None):
+        """
+        Parameters
+        ----------
+        filenames : list
+            names of netCDF files
+        varname : str
+            name of variable to read
+        time_var : str
+            name of the time variable
+        level : int
+            level to select for 4D variables
+        netcdf_backend : str
+            netCDF backend to use
+        fill_value : float
+            fill value of the variable; values equal to the
+            fill_value are masked
+        """
+        if len(filenames) == 0:
+            raise ValueError('No files provided!')
+        self.filenames = list(filenames)
+        self.filename = self.filenames[0]
+        self.varname = varname
+        self.time_var = time_var
+        self.level = level
+        self.netcdf_backend = netcdf_backend
+        self.fill_value = fill_value
+
+        # postprocessing applied to each chunk
+        self.scale_factor = 1.
+        self.valid_mask = None  # True for valid data
+        self.flipud = False
+
+        times = []
+        shape = None
+        for filename in self.filenames:
+            t, s = self._read_file_info(filename)
+            if shape is None:
+                shape = s
+            elif s[1:] != shape[1:]:
+                raise ValueError('Inconsistent geometry of files: %s' % filename)
+            times.append(t)
+
+        # sort all timesteps by time; the sort is stable, thus the
+        # file order is kept for identical times
+        nt = [len(t) for t in times]
+        t = np.concatenate(times)
+        order = np.argsort(t, kind='mergesort')
+        self.time = t[order]
+        self._file = np.repeat(np.arange(len(nt)), nt)[order]
+        self._index = np.concatenate([np.arange(n) for n in nt])[order]
+        self._file_shape = (len(self.time),) + shape[1:]
+
+        # temporal window [i1:i2] of timesteps that is visible
+        self.i1 = 0
+        self.i2 = len(self.time)
+
+    def _read_file_info(self, filename):
+        """
+        read time (in units of the first file) and shape of the
+        variable of a file
+        """
+        File = NetCDFHandler(netcdf_backend=self.netcdf_backend)
+        File.open_file(filename, 'r')
+        if self.varname not in File.get_variable_keys():
+            File.close()
+            raise ValueError('The variable %s is not existing in file %s' % (self.varname, filename))
+        if self.time_var not in File.get_variable_keys():
+            File.close()
+            raise ValueError('The time variable %s is not existing in file %s' % (self.time_var, filename))
+        shape = File.get_variable_handler(self.varname).shape
+        tvar = File.get_variable_handler(self.time_var)
+        t = np.asarray(tvar[:], dtype='float').flatten()
+        units = getattr(tvar, 'units', None)
+        calendar = getattr(tvar, 'calendar', 'standard')
+        File.close()
+
+        if len(shape) == 4:
+            if self.level is None:
+                raise ValueError('4-dimensional variables not supported yet! Either remove a dimension or specify a level!')
+            shape = (shape[0], shape[2], shape[3])
+        if len(shape) != 3:
+            raise ValueError('Multi-file reading only supported for [time,ny,nx] variables!')
+
+        if filename == self.filenames[0]:
+            self.time_units = units
+            self.calendar = calendar
+        elif units != self.time_units:
+            # convert time to the units of the first file
+            try:
+                d = File.handler.num2date(t, units, calendar=calendar)
+                t = np.asarray(File.handler.date2num(d, self.time_units, calendar=self.calendar), dtype='float')
+            except:
+                raise ValueError('Time of file %s can not be converted to %s' % (filename, self.time_units))
+        return t, shape
+
+    def get_files(self):
+        """
+        get the files which contain timesteps of the current
+        time window
+
+        Returns
+        -------
+        files : list
+        """
+        return [self.filenames[i] for i in np.unique(self._file[self.i1:self.i2])]
+
+    def read(self, i1, i2):
+        """
+        read timesteps [i1:i2] (relative to the current time window)
+
+        Returns
+        -------
+        data : masked array [i2-i1,ny,nx]
+        """
+        i1 = max(i1, 0)
+        i2 = min(i2, len(self))
+        f = self._file[self.i1 + i1:self.i1 + i2]
+        j = self._index[self.i1 + i1:self.i1 + i2]
+        if len(f) == 0:
+            return self._postprocess(np.zeros((0,) + self._file_shape[1:]))
+
+        # read consecutive records of the same file at once
+        brk = np.nonzero((np.diff(f) != 0) | (np.diff(j) != 1))[0] + 1
+        starts = np.concatenate(([0], brk))
+        stops = np.concatenate((brk, [len(f)]))
+        x = [self._read_file(self.filenames[f[a]], j[a], j[b - 1] + 1)
+             for a, b in zip(starts, stops)]
+        if len(x) == 1:
+            x = x[0]
+        else:
+            x = np.ma.concatenate([np.ma.array(e, copy=False) for e in x], axis=0)
+        return self._postprocess(x)
@@ -2248,7 +2248,8 @@ class GlecklerPlot(object):
         """
         if x is not None:
             if v in self.variables:
-                if m in self.models:
+                # model names are registered without blanks (add_model)
+                if m.replace(' ', '_') in self.models:
                     self.data.update({self.__gen_key(m, v, pos): x})
                     self.pos.update({self.__gen_key(m, v, pos): pos})
                 else:
@@ -2258,6 +2259,35 @@ class GlecklerPlot(object):
         else:
             pass
 
+#-----------------------------------------------------------------------
+
+    def get_results(self):
+        """
+        return the registered models and results as a dictionary
+        which can be pickled (e.g. to transfer it between processes)
+        """
+        return {'models': list(self.models), 'variables': list(self.variables),
+                'data': dict(self.data), 'pos': dict(self.pos)}
+
+    def merge(self, results):
+        """
+        merge results of another GlecklerPlot into the current one.
+        Models are registered in the order of the results; variables
+        are registered if not yet existing
+
+        Parameters
+        ----------
+        results : dict
+            results as obtained from GlecklerPlot.get_results()
+        """
+        for m in results['models']:
+            self.add_model(m)
+        for v in results['variables']:
+            if v not in self.variables:
+                self.add_variable(v)
+        self.data.update(results['data'])
+        self.pos.update(results['pos'])
+
 #-----------------------------------------------------------------------
 
     def calc_index(self, x, y, model, variable, weights=None, time_weighting=True):
@@ -2286,6 +2316,44 @@ class GlecklerPlot(object):
         returns performance index aggregated over time
         (NOTE: this is still E**2 !!!)
         """
+        return self.calc_indices(x, [y], [model], variable, weights=weights,
+                                 time_weighting=time_weighting)[0]
+
+    def calc_indices(self, x, y, models, variable, weights=None,
+                     time_weighting=True, pos=None):
+        """
+        calculate model performance index for several models at once.
+        The index of all models is calculated with a single reduction
+        over the stack of model data.
+
+        Parameters
+        ----------
+        x : Data
+            reference data (observation)
+        y : list or ndarray
+            data to benchmark; either a list of Data objects or
+            an array with the stacked data of all models
+            [nmodel,time,ny,nx]
+        models : list
+            model names
+        variable : str
+            variable name
+        weights : ndarray
+            weights to be applied to the data before index
+            calculation; dedicated for spatial area weights
+        time_weighting : bool
+            weight timesteps by the number of days per month
+        pos : int
+            if given, the results are registered directly for
+            position pos using add_data(); the models and the variable
+            need to have been registered already
+
+        Returns
+        -------
+        list with the performance index aggregated over time
+        for each model; None if the index can not be calculated
+        """
+        from pycmbs.diagnostic.diagnostic_basic import _reichler_e2
 
         if weights is None:
             # set weights according to cell area
@@ -2298,27 +2366,52 @@ class GlecklerPlot(object):
             if x.cell_area is not None:
                 print('WARNING: cell weights are given, while cell_area available from data!!')
 
-        from pycmbs.diagnostic import Diagnostic
-        D = Diagnostic(x, y=y)
-        # reichler performance index
-        # (might return a list if multiple times analyzed)
-        e2 = D.calc_reichler_index(weights)  # returns [time, index]
-        if e2 is not None:
-            e2 = np.ma.masked_where(np.isnan(e2), e2)
-
-        # Note that the returned value is E**2 for each timestep!
+        if not hasattr(x, 'std'):
+            raise ValueError('Can not calculate Reichler & Kim index without STD information!')
+        if not x._is_monthly():
+            raise ValueError('Variable X has no monthly stepping!')
+
+        if isinstance(y, list) or isinstance(y, tuple):
+            for d in y:
+                if not d._is_monthly():
+                    raise ValueError('Variable Y has no monthly stepping!')
+            y = np.ma.concatenate([d.data[np.newaxis] for d in y], axis=0)
+        if len(y) != len(models):
+            raise ValueError('Number of models and data is inconsistent!')
+        if y.shape[1:] != x.data.shape:
+            print y.shape, x.data.shape
+            raise ValueError('Invalid shapes of arrays!')
+
+        n = len(x.data)
+        if np.shape(weights) != x.data.shape:
+            print np.shape(weights), x.data.shape
+            raise ValueError('Invalid shape for weights!')
+
+        # Reichler performance index for all models [model,time]
+        e2 = _reichler_e2(x.data.reshape(n, -1), y.reshape(len(y), n, -1),
+                          np.reshape(x.std, (n, -1)),
+                          np.ma.reshape(weights, (n, -1)))
+
+        if time_weighting:
+            days = np.asarray(x._days_per_month())  # number of days for each month
+            wt = days / float(days.sum())  # weights for time
+        else:
+            wt = np.ones(n) / float(n)
+
+        # Note that e2 is E**2 for each timestep!
         # When doing the normalization, one needs to take the sqrt(E++2)
         # to obtain the actual RMSE
-        if e2 is None:
-            return None
-        else:
-            if time_weighting:
-                days = np.asarray(x._days_per_month())  # number of days for each month
-                wt = days / float(days.sum())  # weights for time
+        res = []
+        for i in xrange(len(models)):
+            if np.any(np.isnan(e2[i])):
+                print('Reichler: e2 contains NAN, this happens most likely if STDV == 0')
+                r = None
             else:
-                wt = np.ones(len(e2)) / float(len(e2))
-
-            return np.sqrt((e2 * wt).sum())
+                r = np.sqrt((e2[i] * wt).sum())
+            if pos is not None:
+                self.add_data(variable, models[i], r, pos=pos)
+            res.append(r)
+        return res
 
 #-----------------------------------------------------------------------
 
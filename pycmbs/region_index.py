@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of pyCMBS.
+(c) 2012- Alexander Loew
+For COPYING and LICENSE details, please refer to the LICENSE file
+"""
+
+"""
+This module implements a cache for the grid indices of regions
+(area of interest) on a given grid
+"""
+
+import hashlib
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RegionIndexCache(object):
+
+    """
+    Cache for the grid cells of lat/lon regions
+
+    For each combination of grid (lat/lon coordinates) and region
+    (lat/lon boundaries and optional additional mask), the bounding
+    box of the region in the grid and the mask of the region within
+    this bounding box are stored. The mask is stored as a packed bit
+    array (np.packbits), which needs 1/8 of the memory of a boolean
+    array.
+
+    Repeated extractions of the same region from data on the same grid
+    therefore do not need to evaluate the coordinates again. The hash
+    of the coordinates (and of the mask of a region) is only calculated
+    once for each array object; thus coordinates must not be modified
+    in place after they have been used with the cache.
+    If the maximum number of entries is exceeded, the least recently
+    used entries are removed.
+
+    Example
+    -------
+    >>> C = RegionIndexCache()
+    >>> i1, i2, j1, j2, msk = C.get(D.lat, D.lon, R)
+    >>> x = D.data[:, i1:i2, j1:j2]
+    """
+
+    def __init__(self, max_entries=1000):
+        """
+        Parameters
+        ----------
+        max_entries : int
+            maximum number of regions which are kept in the cache
+        """
+        if max_entries < 1:
+            raise ValueError('Invalid number of cache entries!')
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._array_keys = {}  # id(array) -> (weakref, shape, key)
+        self.hits = 0
+        self.misses = 0
+
+    def _array_key(self, x):
+        """
+        key of an array, given by its shape and content. The key is
+        memorized for each array object, thus the content of an array
+        is only hashed the first time it is used
+        """
+        i = id(x)
+        e = self._array_keys.get(i)
+        if (e is not None) and (e[0]() is x) and (e[1] == np.shape(x)):
+            return e[2]
+
+        h = np.ascontiguousarray(x)
+        key = str(h.shape) + h.dtype.str + hashlib.sha1(h.view('uint8')).hexdigest()
+        try:
+            ref = weakref.ref(x, lambda r, i=i: self._array_keys.pop(i, None))
+        except TypeError:  # object does not support weak references
+            return key
+        self._array_keys[i] = (ref, np.shape(x), key)
+        return key
+
+    def get_key(self, lat, lon, R, apply_mask=True, lon360=False):
+        """
+        get the key of a cache entry
+
+        Parameters
+        ----------
+        lat : ndarray
+            latitudes of the grid [ny,nx]
+        lon : ndarray
+            longitudes of the grid [ny,nx]
+        R : Region
+            region with attributes latmin, latmax, lonmin, lonmax
+            and mask
+        apply_mask : bool
+            take the additional mask of the region into account
+        lon360 : bool
+            longitudes of the grid are given as 0...360
+
+        Returns
+        -------
+        key : str
+        """
+        key = [self._array_key(lat), self._array_key(lon), str(lon360),
+               repr((float(R.latmin), float(R.latmax),
+                     float(R.lonmin), float(R.lonmax)))]
+        if apply_mask and (getattr(R, 'mask', None) is not None):
+            key.append(self._array_key(R.mask))
+        return '|'.join(key)
+
+    def _get_mask(self, lat, lon, R, apply_mask=True, lon360=False):
+        """ mask of the region on the full grid """
+        LON = lon
+        if lon360:
+            LON = np.where(lon > 180., lon - 360., lon)
+        msk = (lat >= R.latmin) & (lat <= R.latmax)
+        msk &= (LON >= R.lonmin) & (LON <= R.lonmax)
+
+        # additional mask in Region object
+        if apply_mask and (getattr(R, 'mask', None) is not None):
+            if np.shape(msk) != np.shape(R.mask):
+                print np.shape(msk), np.shape(R.mask)
+                raise ValueError('Invalid geometries for mask')
+            msk &= np.asarray(R.mask).astype('bool')
+        return msk
+
+    def get(self, lat, lon, R, apply_mask=True, lon360=False):
+        """
+        get bounding box and mask of a region
+
+        Parameters
+        ----------
+        lat : ndarray
+            latitudes of the grid [ny,nx]
+        lon : ndarray
+            longitudes of the grid [ny,nx]; the coordinates of the
+            region are assumed to be in -180 < lon < 180
+        R : Region
+            region with attributes latmin, latmax, lonmin, lonmax
+            and mask
+        apply_mask : bool
+            take the additional mask of the region into account
+        lon360 : bool
+            longitudes of the grid are given as 0...360
+
+        Returns
+        -------
+        i1, i2, j1, j2 : int
+            bounding box of the region; the region is contained in
+            [i1:i2, j1:j2]. For regions without any grid cell, all
+            indices are zero
+        msk : ndarray (bool)
+            mask of the region within the bounding box
+            [i2-i1, j2-j1] (True for grid cells of the region). The
+            array is read-only
+        """
+        if (np.ndim(lat) != 2) or (np.shape(lat) != np.shape(lon)):
+            raise ValueError('Lat/lon need to be 2D arrays of same geometry!')
+
+        key = self.get_key(lat, lon, R, apply_mask=apply_mask, lon360=lon360)
+        lat = np.asarray(lat)
+        lon = np.asarray(lon)
+        if key in self._entries:
+            self.hits += 1
+            e = self._entries.pop(key)
+        else:
+            self.misses += 1
+            msk = self._get_mask(lat, lon, R, apply_mask=apply_mask, lon360=lon360)
+            rows = np.nonzero(msk.any(axis=1))[0]
+            cols = np.nonzero(msk.any(axis=0))[0]
+            if len(rows) == 0:
+                i1 = i2 = j1 = j2 = 0
+            else:
+                i1, i2 = rows[0], rows[-1] + 1
+                j1, j2 = cols[0], cols[-1] + 1
+            box = msk[i1:i2, j1:j2]
+            e = (int(i1), int(i2), int(j1), int(j2), box.shape,
+                 np.packbits(box.reshape(-1)))
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+        self._entries[key] = e  # most recently used entry is last
+
+        i1, i2, j1, j2, shape, packed = e
+        n = shape[0] * shape[1]
+        msk = np.unpackbits(packed)[:n].reshape(shape).astype('bool')
+        msk.flags.writeable = False
+        return i1, i2, j1, j2, msk
+
+    def get_mask(self, lat, lon, R, apply_mask=True, lon360=False):
+        """
+        get the mask of a region on the full grid
+
+        Parameters are the same as for get()
+
+        Returns
+        -------
+        msk : ndarray (bool)
+            mask [ny,nx] (True for grid cells of the region)
+        """
+        i1, i2, j1, j2, box = self.get(lat, lon, R, apply_mask=apply_mask, lon360=lon360)
+        msk = np.zeros(np.shape(lat)).astype('bool')
+        msk[i1:i2, j1:j2] = box
+        return msk
+
+    def clear(self):
+        """ remove all entries """
+        self._entries.clear()
+        self._array_keys.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+
+
+def get_region_index_cache():
+    """
+    get the region index cache which is shared within the process
+
+    Returns
+    -------
+    C : RegionIndexCache
+    """
+    global _cache
+    if _cache is None:
+        _cache = RegionIndexCache()
+    return _cache
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file is part of pyCMBS.
+(c) 2012- Alexander Loew
+For COPYING and LICENSE details, please refer to the LICENSE file
+"""
+
+import unittest
+
+from pycmbs.aggregation import TemporalAggregator, RegionAggregator, EnsembleAggregator, get_time_keys
+from pycmbs.data import Data
+import numpy as np
+import datetime
+
+
+class TestAggregation(unittest.TestCase):
+
+    def setUp(self):
+        x = np.random.random((60, 3, 4))
+        self.x = np.ma.array(x, mask=x > 0.8)
+        self.keys = np.repeat(np.arange(5), 12)
+
+    def test_time_keys(self):
+        dates = [datetime.datetime(2000, 1, 1), datetime.datetime(2000, 12, 1),
+                 datetime.datetime(2001, 4, 1), datetime.datetime(2001, 7, 15)]
+        self.assertEqual(list(get_time_keys(dates, by='year')), [2000, 2000, 2001, 2001])
+        self.assertEqual(list(get_time_keys(dates, by='month')), [1, 12, 4, 7])
+        self.assertEqual(list(get_time_keys(dates, by='season')), [0, 0, 1, 2])
+        self.assertEqual(list(get_time_keys(dates, by='yearmonth')), [200001, 200012, 200104, 200107])
+        with self.assertRaises(ValueError):
+            get_time_keys(dates, by='invalid')
+
+    def test_aggregator_invalid(self):
+        with self.assertRaises(ValueError):
+            TemporalAggregator(self.keys, shape=(3, 4), mask=np.ones(10).astype('bool'))
+        A = TemporalAggregator(self.keys, shape=(3, 4))
+        with self.assertRaises(ValueError):
+            A.add(self.x[:, 0:2, :])
+        with self.assertRaises(ValueError):
+            A.add(self.x, i1=10)
+        with self.assertRaises(ValueError):
+            A.std()
+
+    def test_aggregator_statistics(self):
+        # unsorted keys, temporal mask and chunked processing
+        keys = self.keys[::-1].copy()
+        mask = np.random.random(60) > 0.3
+        A = TemporalAggregator(keys, shape=(3, 4), mask=mask, sumsq=True)
+        A.add(self.x[0:17], i1=0)
+        A.add(self.x[17:], i1=17)
+        for i, k in enumerate(A.keys):
+            m = (keys == k) & mask
+            ref = self.x[m]
+            self.assertTrue(np.all(A.count()[i] == ref.count(axis=0)))
+            self.assertTrue(np.all(np.abs(A.sum()[i] - ref.sum(axis=0)) < 1.E-10))
+            self.assertTrue(np.all(np.abs(A.mean()[i] - ref.mean(axis=0)) < 1.E-10))
+            self.assertTrue(np.all(np.abs(A.std(ddof=1)[i] - ref.std(axis=0, ddof=1)) < 1.E-10))
+
+    def test_aggregator_nan(self):
+        x = np.ones((4, 2))
+        x[1, 0] = np.nan
+        A = TemporalAggregator([0, 0, 1, 1], shape=(2,))
+        A.add(x)
+        self.assertTrue(np.all(A.count() == np.asarray([[1, 2], [2, 2]])))
+        self.assertTrue(np.all(A.mean() == 1.))
+
+    def test_yearmean_yearsum(self):
+        D = Data(None, None)
+        D._init_sample_object(nt=1000, ny=5, nx=6, gaps=True)
+        D.data.mask[:, 0, 0] = True
+        ye = np.asarray(D._get_years())
+        y, m = D.get_yearmean()
+        y1, s = D.get_yearsum()
+        self.assertTrue(np.all(y == np.unique(ye)))
+        self.assertTrue(np.all(y1 == y))
+        for i in xrange(len(y)):
+            ref = D.data[ye == y[i]]
+            self.assertTrue(np.all(np.abs(m[i] - ref.mean(axis=0)) < 1.E-10))
+            self.assertTrue(np.all(np.abs(s[i] - ref.sum(axis=0)) < 1.E-10))
+        self.assertTrue(np.all(m.mask[:, 0, 0]))
+        self.assertTrue(np.all(s.mask[:, 0, 0]))
+
+    def test_climatology(self):
+        D = Data(None, None)
+        D._init_sample_object(nt=36, ny=2, nx=3)
+        D.time_cycle = 12
+        c = D.get_climatology(ensure_start_first=False)
+        self.assertEqual(c.shape, (12, 2, 3))
+        for i in xrange(12):
+            ref = D.data[i::12].mean(axis=0)
+            self.assertTrue(np.all(np.abs(c[i] - ref) < 1.E-10))
+        c = D.get_climatology(nmin=4, ensure_start_first=False)
+        self.assertTrue(np.all(c.mask))
+
+    def test_climatology_statistics(self):
+        D = Data(None, None)
+        D._init_sample_object(nt=300, ny=2, nx=3, gaps=True)
+        months = np.asarray([d.month for d in D.date])
+        seasons = get_time_keys(D.date, by='season')
+
+        r = D.get_climatology_statistics(interval='monthly')
+        self.assertEqual(r.shape, (12, 2, 3))
+        self.assertEqual(r.time_cycle, 12)
+        self.assertEqual([d.month for d in r.date], range(1, 13))
+        for i in xrange(12):
+            ref = D.data[months == i + 1]
+            if len(ref) == 0:  # no data for November/December
+                self.assertTrue(np.all(r.data.mask[i]))
+                self.assertTrue(np.all(r.n[i] == 0))
+                continue
+            self.assertTrue(np.all(r.n[i] == ref.count(axis=0)))
+            self.assertTrue(np.all(np.abs(r.data[i] - ref.mean(axis=0)) < 1.E-10))
+            self.assertTrue(np.all(np.abs(r.std[i] - ref.std(axis=0)) < 1.E-10))
+            self.assertTrue(np.all(np.abs(r.sum[i] - ref.sum(axis=0)) < 1.E-10))
+
+        r = D.get_climatology_statistics(interval='season')
+        self.assertEqual(r.shape, (4, 2, 3))
+        self.assertEqual([d.month for d in r.date], [1, 4, 7, 10])
+        for i in xrange(4):
+            ref = D.data[seasons == i]
+            self.assertTrue(np.all(r.n[i] == ref.count(axis=0)))
+            self.assertTrue(np.all(np.abs(r.data[i] - ref.mean(axis=0)) < 1.E-10))
+            self.assertTrue(np.all(np.abs(r.std[i] - ref.std(axis=0)) < 1.E-10))
+
+        with self.assertRaises(ValueError):
+            D.get_climatology_statistics(interval='yearly')
+
+    def test_half_year_statistics(self):
+        D = Data(None, None)
+        D._init_sample_object(nt=24, ny=4, nx=3, gaps=True)
+        D.data.mask[:, 0, 0] = True
+        months = np.tile(np.arange(1, 13), 2)
+        nh = (months >= 4) & (months <= 9)
+
+        s, w = D.get_half_year_statistics(months=months)
+        self.assertEqual(s.shape, (4, 3))
+        self.assertTrue(s.data.mask[0, 0])
+        self.assertEqual(s.n[0, 0], 0)
+        for j in xrange(4):
+            north = D.lat[j, 0] >= 0.
+            for r, sel in [(s, nh == north), (w, nh != north)]:
+                ref = D.data[sel, j, 1]
+                self.assertEqual(r.n[j, 1], ref.count())
+                self.assertAlmostEqual(r.hmin[j, 1], ref.min(), 10)
+                self.assertAlmostEqual(r.hmax[j, 1], ref.max(), 10)
+                self.assertAlmostEqual(r.hsum[j, 1], ref.sum(), 10)
+                self.assertAlmostEqual(r.data[j, 1], ref.mean(), 10)
+
+        # separate windows (in temporal chunks)
+        D.chunk_size = 5
+        s2, w2 = D.get_half_year_statistics(months=months, window=12)
+        self.assertEqual(s2.shape, (2, 4, 3))
+        self.assertEqual(len(s2.time), 2)
+        self.assertTrue(np.all(s2.n.sum(axis=0) == s.n))
+        j = 3
+        ref = D.data[12:][nh[12:], j, 2]
+        self.assertAlmostEqual(s2.hmax[1, j, 2], ref.max(), 10)
+        self.assertAlmostEqual(s2.hsum[1, j, 2], ref.sum(), 10)
+
+        with self.assertRaises(ValueError):
+            D.get_half_year_statistics(window=7)
+
+    def test_region_aggregator(self):
+        labels = np.ma.array(np.asarray([[1, 1, 2, 2], [3, 3, 1, 5], [2, 2, 5, 9]]))
+        labels[2, 3] = np.ma.masked
+        A = RegionAggregator(labels)
+        self.assertEqual(list(A.ids), [1, 2, 3, 5])
+        self.assertEqual(list(A.ncells), [3, 4, 2, 2])
+        w = np.random.random((3, 4)) + 0.5
+        s = A.statistics(self.x)
+        f = A.fldmean(self.x, weights=w)
+        y = np.random.random(self.x.shape)
+        mom = A.moments(self.x, y)
+        for i, v in enumerate(A.ids):
+            msk = labels.filled(-1) == v
+            ref = self.x[:, msk]
+            self.assertTrue(np.all(s['n'][:, i] == ref.count(axis=1)))
+            self.assertTrue(np.all(np.abs(s['sum'][:, i] - ref.sum(axis=1)) < 1.E-10))
+            self.assertTrue(np.all(np.abs(s['mean'][:, i] - ref.mean(axis=1)) < 1.E-10))
+            self.assertTrue(np.all(np.abs(s['std'][:, i] - ref.std(axis=1)) < 1.E-10))
+            self.assertTrue(np.all(s['min'][:, i] == ref.min(axis=1)))
+            self.assertTrue(np.all(s['max'][:, i] == ref.max(axis=1)))
+            wref = np.ma.array(w[msk] * np.ones(ref.shape), mask=ref.mask)
+            fref = (ref * wref).sum(axis=1) / wref.sum(axis=1)
+            self.assertTrue(np.all(f.mask[:, i] == fref.mask))
+            self.assertTrue(np.all(np.abs(f[:, i] - fref) < 1.E-10))
+            xv = ref.compressed()
+            yv = y[:, msk][~ref.mask]
+            self.assertEqual(mom['n'][i], len(xv))
+            self.assertAlmostEqual(mom['sxy'][i], ((xv - xv.mean()) * (yv - yv.mean())).sum(), 10)
+            self.assertAlmostEqual(mom['syy'][i], ((yv - yv.mean()) ** 2).sum(), 10)
+
+        # selected regions only
+        A = RegionAggregator(labels, ids=[9, 2, 4])
+        self.assertEqual(list(A.ncells), [4, 0, 0])
+        s = A.statistics(self.x[0])
+        self.assertEqual(s['mean'].shape, (1, 3))
+        self.assertTrue(np.all(s['mean'].mask[0, 1:]))
+        with self.assertRaises(ValueError):
+            A.statistics(self.x[:, 0:2, :])
+
+    def test_ensemble_aggregator(self):
+        members = np.ma.array(np.random.random((7, 5, 3, 4)) * 10. + 1000.)
+        members[members > 1008.] = np.ma.masked
+        members.mask[:, 0, 0, 0] = True
+        A = EnsembleAggregator((5, 3, 4))
+        for x in members:
+            A.add(x)
+        self.assertEqual(A.nmembers, 7)
+        self.assertTrue(np.all(A.count() == members.count(axis=0)))
+        ref = members.mean(axis=0)
+        self.assertTrue(np.all(A.mean().mask == ref.mask))
+        self.assertTrue(np.all(np.abs(A.mean() - ref) < 1.E-10))
+        for ddof in [0, 1]:
+            ref = members.std(axis=0, ddof=ddof)
+            self.assertTrue(np.all(np.abs(A.std(ddof=ddof) - ref) < 1.E-10))
+        self.assertTrue(np.all(A.min() == members.min(axis=0)))
+        self.assertTrue(np.all(A.max() == members.max(axis=0)))
+        self.assertTrue(A.max().mask[0, 0, 0])
+        with self.assertRaises(ValueError):
+            A.add(members[0, 0:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
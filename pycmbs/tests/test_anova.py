@@ -8,6 +8,8 @@ For COPYING and LICENSE details, please refer to the LICENSE file
 import numpy
 import unittest
 from pycmbs import anova
+from pycmbs.data import Data
+from pycmbs.diagnostic import ANOVA
 
 class TestAnova1(unittest.TestCase):
     def setUp(self):
@@ -17,6 +19,99 @@ class TestAnova1(unittest.TestCase):
     def test_AnovaImportWorks(self):
         self.assertEqual(1,1)
 
+    def test_Anova1Field(self):
+        x = numpy.random.random((5, 12, 7))
+        A = anova.Anova1(x)
+        A.one_way_anova()
+        for k in range(7):
+            B = anova.Anova1(x[:, :, k])
+            B.one_way_anova()
+            self.assertAlmostEqual(A.ssa[k], B.ssa)
+            self.assertAlmostEqual(A.sse[k], B.sse)
+            self.assertAlmostEqual(A.p[k], B.p)
+
+    def test_Anova1Invalid(self):
+        with self.assertRaises(ValueError):
+            anova.Anova1(numpy.ones(10))
+
+
+class TestAnova2(unittest.TestCase):
+
+    def test_Anova2Field(self):
+        x = numpy.random.random((3, 12, 4, 7))
+        A = anova.Anova2(x)
+        A.two_way_anova_with_replication()
+        for k in range(7):
+            B = anova.Anova2(x[:, :, :, k])
+            B.two_way_anova_with_replication()
+            self.assertAlmostEqual(A.ssa[k], B.ssa)
+            self.assertAlmostEqual(A.ssb[k], B.ssb)
+            self.assertAlmostEqual(A.ssi[k], B.ssi)
+            self.assertAlmostEqual(A.sse[k], B.sse)
+            self.assertAlmostEqual(A.sst[k], B.sst)
+            self.assertAlmostEqual(A.p_ssi[k], B.p_ssi)
+
+    def test_Anova2Reference(self):
+        # http://people.richland.edu/james/lecture/m170/ch13-2wy.html
+        groups = [[[106, 95, 94, 103, 100],
+                   [110, 98, 100, 108, 105],
+                   [94, 86, 98, 99, 94]],
+                  [[110, 100, 107, 104, 102],
+                   [112, 99, 101, 112, 107],
+                   [97, 87, 99, 101, 98]]]
+        A = anova.Anova2(numpy.asarray(groups, dtype='float'))
+        A.two_way_anova_with_replication()
+        self.assertAlmostEqual(A.ssa, 512.8666666666, 6)
+        self.assertAlmostEqual(A.ssb, 70.5333333333, 6)
+        self.assertAlmostEqual(A.ssi, 14.0666666666, 6)
+        self.assertAlmostEqual(A.sse, 644., 6)
+
+
+class TestANOVA(unittest.TestCase):
+
+    def setUp(self):
+        self.nt = 10
+        self.ny = 3
+        self.nx = 4
+
+    def _get_data(self):
+        D = Data(None, None)
+        D._init_sample_object(nt=self.nt, ny=self.ny, nx=self.nx)
+        return D
+
+    def test_ANOVA_two_way(self):
+        A = ANOVA()
+        for e in ['exp 1', 'exp2']:
+            A.add_experiment(e)
+            for i in range(3):
+                A.add_data(e, self._get_data())
+        A.data['exp2'][1].data.mask[:, 0, 0] = True
+        A.analysis(analysis_type='two', blocksize=5)
+
+        self.assertEqual(A.resA.shape, (self.ny, self.nx))
+        self.assertTrue(numpy.isnan(A.resA[0, 0]))
+        for p in [(1, 2), (2, 3)]:
+            B = anova.Anova2(A._data2anova2(numpy.asarray([p[0] * self.nx + p[1]]))[:, :, :, 0])
+            B.two_way_anova_with_replication()
+            self.assertAlmostEqual(A.resA[p], B.get_fractional_variance_explained('a', adjust=False))
+            self.assertAlmostEqual(A.resI[p], B.get_fractional_variance_explained('i', adjust=False))
+            self.assertAlmostEqual(A.resPB[p], B.p_ssb)
+
+    def test_ANOVA_one_way(self):
+        A = ANOVA()
+        A.add_experiment('exp')
+        for i in range(4):
+            A.add_data('exp', self._get_data())
+        A.analysis(analysis_type='one')
+        x = numpy.asarray([d.data[:, 1, 1] for d in A.data['exp']])
+        B = anova.Anova1(x)
+        B.one_way_anova()
+        self.assertAlmostEqual(A.resA[1, 1], B.get_fractional_variance_explained(adjust=False))
+        self.assertAlmostEqual(A.resPA[1, 1], B.p)
+
+        with self.assertRaises(ValueError):
+            A.analysis(analysis_type='three')
+
 if __name__ == "__main__":
     unittest.main()
 
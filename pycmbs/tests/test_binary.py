@@ -14,6 +14,7 @@ import os
 import numpy as np
 import tempfile
 import struct
+import gzip
 
 from nose.tools import assert_raises
 
@@ -78,6 +79,55 @@ class TestData(unittest.TestCase):
 
 
 
+    def test_read_binary_file_byteorder(self):
+        for byteorder, prefix in [('little', '<'), ('big', '>')]:
+            for dtype, npdtype in [('int8', 'i1'), ('uint16', 'u2'), ('uint32', 'u4'), ('int64', 'i8'), ('float', 'f4')]:
+                fname = tempfile.mktemp()
+                ref = self.x.astype(prefix + npdtype)
+                ref.tofile(fname)
+
+                D = Data(None, None)
+                D.filename = fname
+                ny, nx = self.x.shape
+                D._read_binary_file(ny=ny, nx=nx, nt=1, dtype=dtype, byteorder=byteorder)
+                self.assertTrue(np.all(D.data == ref))
+                os.remove(fname)
+
+    def test_read_binary_file_invalid(self):
+        D = Data(None, None)
+        D.filename = tempfile.mktemp()
+        with self.assertRaises(ValueError):
+            D._read_binary_file(ny=2, nx=2, nt=1, dtype='char')
+        with self.assertRaises(ValueError):
+            D._read_binary_file(ny=2, nx=2, nt=1, dtype='double', byteorder='middle')
+
+    def test_read_binary_file_3D_subset(self):
+        nt = 4
+        ny, nx = self.x.shape
+        ref = np.random.random((nt, ny, nx))
+        fname = tempfile.mktemp()
+        ref.tofile(fname)
+        gzname = fname + '.gz'
+        f = gzip.open(gzname, 'wb')
+        f.write(ref.tostring())
+        f.close()
+
+        latmin = self.lat[self.ymin]
+        latmax = self.lat[self.ymax]
+        lonmin = self.lon[self.xmin]
+        lonmax = self.lon[self.xmax]
+
+        for filename in [fname, gzname]:
+            D = Data(None, None)
+            D.filename = filename
+            D._read_binary_file(ny=ny, nx=nx, nt=nt, dtype='double')
+            self.assertEqual(D.data.shape, (nt, ny, nx))
+            self.assertTrue(np.all(D.data == ref))
+
+            # small blocksize to force reading in several blocks
+            D._read_binary_file(nt=nt, dtype='double', latmin=latmin, latmax=latmax, lonmin=lonmin, lonmax=lonmax, lat=self.lat, lon=self.lon, blocksize=100)
+            self.assertTrue(np.all(D.data == ref[:, self.ymin:self.ymax+1, self.xmin:self.xmax+1]))
+
     def test_read_binary_subset_double(self):
         fname = tempfile.mktemp()
         f = open(fname, 'w')
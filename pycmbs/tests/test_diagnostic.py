@@ -11,7 +11,7 @@ from unittest import TestCase
 
 
 from pycmbs.data import Data
-from pycmbs.diagnostic import PatternCorrelation, RegionalAnalysis, EOF, Koeppen
+from pycmbs.diagnostic import PatternCorrelation, RegionalAnalysis, EOF, IncrementalEOF, SVD, Koeppen, Diagnostic
 from pycmbs.plots import GlecklerPlot
 from geoval.region import RegionIndex
 import scipy as sc
@@ -203,6 +203,121 @@ class TestData(TestCase):
         t = np.abs(1. - r / ref)
         self.assertLess(t, 0.000001)  # relative error
 
+        # Case 4: several models at once
+        y1 = y.copy()
+        y1.data = y.data * 2.
+        D = GlecklerPlot()
+        D.add_model('m1')
+        D.add_model('m2')
+        D.add_variable('b')
+        r = D.calc_indices(x, [y, y1], ['m1', 'm2'], 'b', pos=1)
+        self.assertEqual(len(r), 2)
+        self.assertLess(np.abs(1. - r[0] / D.calc_index(x, y, 'm1', 'b')), 1.E-10)
+        self.assertLess(np.abs(1. - r[1] / D.calc_index(x, y1, 'm2', 'b')), 1.E-10)
+        self.assertEqual(D.get_data('b', 'm2', 1), r[1])
+
+        # stacked model data
+        r1 = D.calc_indices(x, np.ma.array([y.data, y1.data]), ['m1', 'm2'], 'b')
+        self.assertLess(np.abs(r1[0] - r[0]), 1.E-10)
+        self.assertLess(np.abs(r1[1] - r[1]), 1.E-10)
+
+        with self.assertRaises(ValueError):
+            D.calc_indices(x, [y, y1], ['m1'], 'b')
+
+    def test_gleckler_merge(self):
+        G1 = GlecklerPlot()
+        G1.add_model('echam5')
+        G1.add_variable('ta')
+        G1.add_data('ta', 'echam5', 0.5, pos=1)
+
+        G2 = GlecklerPlot()
+        G2.add_model('mpi esm')
+        G2.add_model('echam5')
+        G2.add_variable('P')
+        G2.add_data('P', 'mpi esm', -0.25, pos=2)
+
+        G1.merge(G2.get_results())
+        self.assertEqual(G1.models, ['echam5', 'mpi_esm'])
+        self.assertEqual(G1.variables, ['ta', 'P'])
+        self.assertEqual(G1.get_data('ta', 'echam5', 1), 0.5)
+        self.assertEqual(G1.get_data('P', 'mpi esm', 2), -0.25)
+        self.assertEqual(G1.get_data('P', 'echam5', 1), None)
+
+    def test_slice_corr(self):
+        x = Data(None, None)
+        x._init_sample_object(nt=20, ny=3, nx=4)
+        y = x.copy()
+        y.data = x.data * 0.5 + np.random.random(x.shape)
+        x.data.mask[2, 1, 1] = True
+        y.data.mask[:, 0, 0] = True
+        msk = x.data.mask | y.data.mask
+        xd = x.data.data
+        yd = y.data.data
+
+        D = Diagnostic(x, y=y)
+        D.slice_corr(timmean=False)
+        for i1, i2 in [(0, 2), (3, 10), (5, 18)]:
+            m = ~msk[i1:i2]
+            slope, intercept, r, p, stderr = stats.linregress(xd[i1:i2][m], yd[i1:i2][m])
+            self.assertAlmostEqual(D.slice_r[i2 - i1, i1], r, 8)
+            self.assertAlmostEqual(D.slice_p[i2 - i1, i1], p, 8)
+            self.assertAlmostEqual(D.slice_slope[i2 - i1, i1], slope, 8)
+            self.assertEqual(D.slice_length[i2 - i1, i1], i2 - i1)
+        self.assertTrue(np.isnan(D.slice_r[2, 18]))
+
+        D.slice_corr(timmean=True, n_jobs=2)
+        for i1, i2 in [(0, 2), (4, 15)]:
+            xm = x.data[i1:i2].mean(axis=0)
+            ym = y.data[i1:i2].mean(axis=0)
+            m = ~(xm.mask | ym.mask)
+            slope, intercept, r, p, stderr = stats.linregress(xm.data[m], ym.data[m])
+            self.assertAlmostEqual(D.slice_r[i2 - i1, i1], r, 8)
+            self.assertAlmostEqual(D.slice_p[i2 - i1, i1], p, 8)
+
+        D.slice_corr_gap(timmean=False)
+        for i1, gap in [(0, 0), (2, 5), (10, 9)]:
+            m = ~msk.copy()
+            m[i1:i1 + gap] = False
+            slope, intercept, r, p, stderr = stats.linregress(xd[m], yd[m])
+            self.assertAlmostEqual(D.slice_r_gap[gap, i1], r, 8)
+            self.assertAlmostEqual(D.slice_p_gap[gap, i1], p, 8)
+            self.assertEqual(D.slice_length_gap[gap, i1], gap - 1)
+
+    def test_lagged_correlation(self):
+        x = Data(None, None)
+        x._init_sample_object(nt=50, ny=3, nx=4)
+        y = x.copy()
+        y.data = np.ma.array(np.roll(x.data.data, 3, axis=0) + 0.1 * np.random.random(x.shape), mask=x.data.mask.copy())
+        y.data.mask[:, 0, 0] = True
+        lags = np.asarray([0, 1, 3, 10])
+
+        D = Diagnostic(x, y=y)
+        R, best_lag = D.lagged_correlation(lags - 3)
+        self.assertEqual(R.shape, (4, 3, 4))
+        self.assertTrue(np.all(R.mask[:, 0, 0]))
+        self.assertTrue(best_lag.mask[0, 0])
+        self.assertTrue(np.all(best_lag[0, 1:] == -3.))
+        for k, lag in enumerate(lags - 3):
+            if lag >= 0:
+                slope, intercept, r, p, stderr = stats.linregress(x.data[lag:, 1, 2], y.data[:50 - lag, 1, 2])
+            else:
+                slope, intercept, r, p, stderr = stats.linregress(x.data[:50 + lag, 1, 2], y.data[-lag:, 1, 2])
+            self.assertAlmostEqual(R[k, 1, 2], r, 8)
+
+        # vectors
+        xv = x.copy()
+        xv.data = x.data[:, 1, 2]
+        yv = y.copy()
+        yv.data = y.data[:, 1, 2]
+        D = Diagnostic(xv, y=yv)
+        r = D.lagged_correlation_vec(lags, detrend_linear=True)
+        self.assertEqual(len(r), 4)
+        xd = pl.detrend_linear(xv.data)
+        yd = pl.detrend_linear(yv.data)
+        for k, lag in enumerate(lags):
+            slope, intercept, r_value, p, stderr = stats.linregress(xd[lag:], yd[:50 - lag])
+            self.assertAlmostEqual(r[k], r_value, 8)
+
 
 
     def test_RegionalAnalysis_xNone(self):
@@ -258,6 +373,88 @@ class TestData(TestCase):
 
 
 
+    def test_EOF_truncated(self):
+        D = Data(None, None)
+        D._init_sample_object(nt=30, ny=8, nx=10)
+        # three modes and some noise
+        t = np.arange(30.)[:, np.newaxis, np.newaxis]
+        a = np.random.random((3, 8, 10))
+        x = np.sin(t) * a[0] + np.cos(0.3 * t) * a[1] * 0.5 + t / 30. * a[2] * 0.3 + 0.01 * np.random.random((30, 8, 10))
+        D.data = np.ma.array(x, mask=x != x)
+        E = EOF(D, anomalies=True)
+        for solver in ['truncated', 'randomized']:
+            E1 = EOF(D, anomalies=True, solver=solver, nmodes=3, seed=1)
+            self.assertEqual(E1.nmodes, 3)
+            self.assertEqual(E1.eigvec.shape, (30, 3))
+            self.assertEqual(E1.EOF.shape, (80, 3))
+            self.assertTrue(np.all(np.abs(E1.eigval - E.eigval[0:3]) < 1.E-6 * E.eigval[0]))
+            self.assertTrue(np.all(np.abs(E1.get_explained_variance() - E.get_explained_variance()[0:3]) < 1.E-6))
+            self.assertTrue(np.all(np.abs(np.abs(E1.eigvec[:, 0]) - np.abs(E.eigvec[:, 0])) < 1.E-4))
+
+        with self.assertRaises(ValueError):
+            EOF(D, solver='truncated')
+        with self.assertRaises(ValueError):
+            EOF(D, solver='invalid', nmodes=3)
+
+    def test_EOF_incremental(self):
+        D = Data(None, None)
+        D._init_sample_object(nt=40, ny=6, nx=7)
+        t = np.arange(40.)[:, np.newaxis, np.newaxis]
+        a = np.random.random((3, 6, 7))
+        x = np.sin(t) * a[0] + np.cos(0.3 * t) * a[1] * 0.5 + t / 40. * a[2] * 0.3 + 0.001 * np.random.random((40, 6, 7))
+        D.data = np.ma.array(x, mask=x != x)
+        D.data.mask[:, 0, 0] = True
+        D.data.mask[3, 2, 2] = True
+        D.chunk_size = 9
+
+        E = EOF(D, anomalies=True)
+        E1 = IncrementalEOF(D, 3, anomalies=True)
+        self.assertEqual(E1.nmodes, 3)
+        self.assertTrue(np.all(E1._x0mask == E._x0mask))
+        self.assertEqual(E1.EOF.shape, (40, 3))
+        for k in xrange(3):
+            s = np.sign(np.sum(E1.eigvec[:, k] * E.eigvec[:, k]))
+            self.assertTrue(np.abs(E1.eigval[k] - E.eigval[k]) < 1.E-8 * E.eigval[0])
+            self.assertTrue(np.abs(E1.get_explained_variance()[k] - E.get_explained_variance()[k]) < 1.E-8)
+            self.assertTrue(np.all(np.abs(s * E1.eigvec[:, k] - E.eigvec[:, k]) < 1.E-6))
+            self.assertTrue(np.all(np.abs(s * E1.EOF[:, k] - E.EOF[:, k]) < 1.E-6))
+
+        r = E1.reconstruct_data()
+        self.assertEqual(r.shape, D.shape)
+
+        with self.assertRaises(ValueError):
+            IncrementalEOF(D, 0)
+
+    def test_SVD(self):
+        X = Data(None, None)
+        X._init_sample_object(nt=30, ny=4, nx=5)
+        Y = Data(None, None)
+        Y._init_sample_object(nt=30, ny=3, nx=6)
+        X.data.mask[:, 0, 0] = True
+        S = SVD(X, Y, scf_threshold=0.05)
+        S.svd_analysis(detrend=True, varnorm=False)
+
+        # reference from SVD of covariance matrix
+        x = S.x_used
+        y = S.y_used
+        t = np.arange(30.)
+        ref = X.data[:, 1, 2] - np.polyval(np.polyfit(t, X.data[:, 1, 2], 1), t)
+        self.assertTrue(np.all(np.abs(x[:, 6] - ref) < 1.E-10))
+        U, s, V = np.linalg.svd(np.dot(x.T, y))
+        scf = s * s / np.sum(s * s)
+        n = np.sum(scf > 0.05)
+        self.assertEqual(len(S.scf), len(scf))
+        self.assertAlmostEqual(np.sum(S.scf), 1., 10)
+        self.assertEqual(S.U.shape, (19, n))
+        self.assertEqual(S.V.shape, (18, n))
+        self.assertEqual(len(S.mcorr), n)
+        self.assertTrue(np.all(np.abs(S.scf - scf) < 1.E-10))
+        self.assertTrue(np.all(np.abs(S.C - np.dot(x.T, y)) < 1.E-10))
+        self.assertTrue(np.all(np.abs(np.abs(S.U) - np.abs(U[:, 0:n])) < 1.E-8))
+        self.assertTrue(np.all(np.abs(np.abs(S.V) - np.abs(V[0:n, :].T)) < 1.E-8))
+        for i in xrange(n):
+            self.assertAlmostEqual(S.mcorr[i], np.corrcoef(S.A[:, i], S.B[:, i])[0][1], 10)
+
     #~ def test_koeppen(self):
         #~ T = self.D.copy()
         #~ T.data = np.random.random((10,20,30))
@@ -282,6 +479,54 @@ class TestData(TestCase):
         with self.assertRaises(ValueError):
             k = Koeppen(temp=T, precip=P, lsm=None)
 
+    def test_koeppen_classification(self):
+        T = Data(None, None)
+        T._init_sample_object(nt=24, ny=10, nx=12)
+        T.data = T.data * 60. + 240.
+        T.unit = 'K'
+        P = Data(None, None)
+        P._init_sample_object(nt=24, ny=10, nx=12)
+        P.data = P.data ** 2 * 1.E-4
+        P.unit = 'kg/m^2s'
+        lsm = Data(None, None)
+        lsm.data = np.ones((10, 12))
+        lsm.data[0, :] = 0.
+        lsm.unit = 'fractional'
+
+        # two climatological windows at once
+        k = Koeppen(temp=T, precip=P, lsm=lsm)
+        self.assertEqual(k.Clim.shape, (2, 10, 12))
+        self.assertTrue(np.all(k.Clim.data.mask[:, 0, :]))
+        self.assertFalse(np.any(k.Clim.data.mask[:, 1:, :]))
+
+        summer = [3, 4, 5, 6, 7, 8]
+        winter = [0, 1, 2, 9, 10, 11]
+        for w in xrange(2):
+            t = T.data[w * 12:(w + 1) * 12] - 273.15
+            p = P.data[w * 12:(w + 1) * 12] * 60. * 60. * 24. * 365. / 12.
+            for i in xrange(12):
+                # southern and northern hemisphere
+                for j, hs, hw in [(2, winter, summer), (7, summer, winter), (9, summer, winter)]:
+                    self.assertEqual(P.lat[j, i] >= 0., j > 4)
+                    c = k.set_clim(p[:, j, i].sum(), p[:, j, i].min(), p[hs, j, i].min(), p[hw, j, i].min(),
+                                   p[hs, j, i].max(), p[hw, j, i].max(), t[:, j, i].mean(), t[:, j, i].min(),
+                                   t[:, j, i].max())
+                    self.assertEqual(k.Clim.data.data[w, j, i], c)
+
+        # single window
+        T1 = T.copy()
+        T1.data = T.data[12:]
+        P1 = P.copy()
+        P1.data = P.data[12:]
+        k1 = Koeppen(temp=T1, precip=P1, lsm=lsm)
+        self.assertEqual(k1.Clim.shape, (10, 12))
+        self.assertTrue(np.all(k1.Clim.data.data == k.Clim.data.data[1]))
+
+        P1.data = P.data[0:10]
+        T1.data = T.data[0:10]
+        with self.assertRaises(ValueError):
+            Koeppen(temp=T1, precip=P1, lsm=lsm)
+
 
 
 
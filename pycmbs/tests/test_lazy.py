@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file is part of pyCMBS.
+(c) 2012- Alexander Loew
+For COPYING and LICENSE details, please refer to the LICENSE file
+"""
+
+import unittest
+
+from pycmbs.data import Data
+from pycmbs.netcdf import NetCDFVariableProxy, NetCDFMultiFileProxy
+import os
+import numpy as np
+import datetime
+import tempfile
+import shutil
+import glob
+
+from netCDF4 import Dataset
+
+
+class TestLazyData(unittest.TestCase):
+
+    def setUp(self):
+        # monthly data for 3 years with some gaps
+        self.nt = 36
+        self.ny = 6
+        self.nx = 8
+        self.x = np.random.random((self.nt, self.ny, self.nx))
+        self.x[5, 2, 3] = -999.
+        self.x[:, 0, 0] = -999.
+
+        self.time = np.arange(self.nt) * 30.5 + 15.
+        self.filename = tempfile.mktemp(suffix='.nc')
+        self._write_file(self.filename, self.x, self.time)
+
+    def _write_file(self, filename, x, time, units='days since 2000-01-01 00:00:00'):
+        F = Dataset(filename, 'w')
+        F.createDimension('time', None)
+        F.createDimension('lat', self.ny)
+        F.createDimension('lon', self.nx)
+        t = F.createVariable('time', 'f8', ('time',))
+        t.units = units
+        t.calendar = 'standard'
+        t[:] = time
+        lat = F.createVariable('lat', 'f8', ('lat',))
+        lat[:] = np.linspace(-50., 50., self.ny)
+        lon = F.createVariable('lon', 'f8', ('lon',))
+        lon[:] = np.linspace(0., 315., self.nx)
+        v = F.createVariable('var', 'f8', ('time', 'lat', 'lon'), fill_value=-999.)
+        v[:] = x
+        F.close()
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def _get_data(self, lazy):
+        return Data(self.filename, 'var', read=True, lazy=lazy,
+                    calc_cell_area=False, chunk_size=5)
+
+    def test_lazy_init(self):
+        D = self._get_data(True)
+        self.assertTrue(isinstance(D.data, NetCDFVariableProxy))
+        self.assertEqual(D.shape, (self.nt, self.ny, self.nx))
+        self.assertEqual(len(D.time), self.nt)
+
+    def test_lazy_load(self):
+        E = self._get_data(False)
+        D = self._get_data(True)
+        D.load()
+        self.assertFalse(isinstance(D.data, NetCDFVariableProxy))
+        self.assertTrue(np.all(D.data.mask == E.data.mask))
+        self.assertTrue(np.all(np.abs(D.data - E.data) < 1.E-10))
+        # latitudes have been flipped
+        self.assertTrue(np.all(D.lat == E.lat))
+
+    def test_lazy_timmean(self):
+        E = self._get_data(False)
+        D = self._get_data(True)
+        r = D.timmean(return_object=False)
+        ref = E.timmean(return_object=False)
+        self.assertTrue(np.all(r.mask == ref.mask))
+        self.assertTrue(np.all(np.abs(r - ref) < 1.E-10))
+
+    def test_lazy_fldmean(self):
+        E = self._get_data(False)
+        D = self._get_data(True)
+        for w in [True, False]:
+            r = D.fldmean(return_data=False, apply_weights=w)
+            ref = E.fldmean(return_data=False, apply_weights=w)
+            self.assertTrue(np.all(np.abs(r - ref) < 1.E-10))
+        r = D.fldmean(return_data=True)
+        self.assertEqual(r.shape, (self.nt, 1, 1))
+
+    def test_lazy_yearmean(self):
+        E = self._get_data(False)
+        D = self._get_data(True)
+        y, r = D.get_yearmean()
+        yref, ref = E.get_yearmean()
+        self.assertTrue(np.all(y == yref))
+        self.assertTrue(np.all(r.mask == ref.mask))
+        self.assertTrue(np.all(np.abs(r - ref) < 1.E-10))
+
+    def test_lazy_temporal_subsetting(self):
+        E = self._get_data(False)
+        D = self._get_data(True)
+        start = datetime.datetime(2001, 1, 1)
+        stop = datetime.datetime(2001, 12, 31)
+        E.apply_temporal_subsetting(start, stop)
+        D.apply_temporal_subsetting(start, stop)
+        self.assertTrue(isinstance(D.data, NetCDFVariableProxy))
+        self.assertEqual(len(D.time), len(E.time))
+        self.assertEqual(D.shape, E.shape)
+        r = D.timmean(return_object=False)
+        ref = E.timmean(return_object=False)
+        self.assertTrue(np.all(np.abs(r - ref) < 1.E-10))
+
+        # copies keep their own time window
+        C = D.copy()
+        C._temporal_subsetting(0, 2)
+        self.assertEqual(len(C.data), 3)
+        self.assertEqual(len(D.data), len(E.time))
+
+    def test_multifile(self):
+        # one file per year; the second file has different time units
+        tdir = tempfile.mkdtemp()
+        files = []
+        for i, y in enumerate([2000, 2001, 2002]):
+            f = os.path.join(tdir, 'var_%i.nc' % (2002 - y))  # names not in time order
+            t = self.time[i * 12:(i + 1) * 12]
+            units = 'days since 2000-01-01 00:00:00'
+            if y == 2001:
+                t = t - 366.
+                units = 'days since 2001-01-01 00:00:00'
+            self._write_file(f, self.x[i * 12:(i + 1) * 12], t, units=units)
+            files.append(f)
+
+        E = self._get_data(False)
+        for filename in [files[::-1], os.path.join(tdir, 'var_*.nc')]:
+            D = Data(filename, 'var', read=True, calc_cell_area=False, chunk_size=5)
+            self.assertTrue(isinstance(D.data, NetCDFMultiFileProxy))
+            self.assertEqual(D.shape, E.shape)
+            self.assertTrue(np.all(np.abs(D.time - E.time) < 1.E-6))
+            r = D.timmean(return_object=False)
+            ref = E.timmean(return_object=False)
+            self.assertTrue(np.all(r.mask == ref.mask))
+            self.assertTrue(np.all(np.abs(r - ref) < 1.E-10))
+
+        # only files within the time window are accessed
+        start = datetime.datetime(2001, 1, 1)
+        stop = datetime.datetime(2001, 12, 31)
+        D = Data(files, 'var', read=True, calc_cell_area=False,
+                 start_time=start, stop_time=stop)
+        self.assertEqual(D.data.get_files(), [files[1]])
+        E.apply_temporal_subsetting(start, stop)
+        D.load()
+        self.assertTrue(np.all(D.data.mask == E.data.mask))
+        self.assertTrue(np.all(np.abs(D.data - E.data) < 1.E-10))
+
+        with self.assertRaises(ValueError):
+            Data(os.path.join(tdir, 'nofile_*.nc'), 'var', read=True)
+        shutil.rmtree(tdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
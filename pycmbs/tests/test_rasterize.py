@@ -87,6 +87,55 @@ class TestData(unittest.TestCase):
         self.assertEqual(res.data[1,2], 0.7)
         self.assertEqual(res.ny*res.nx - res.data.mask.sum(), 4)
 
+    def test_rasterize_aggregation(self):
+        x = Data(None, None)
+        x._init_sample_object(ny=1, nx=272)
+        x.lon = np.asarray([1.4, 1.6, 3.6, 179.9, -179.9])
+        x.lat = np.asarray([10.1, 9.9, 11.3, 0., 0.])
+        x.data = np.ma.array([1., 3., 0.7, 2., 4.], mask=[False, False, True, False, False])
+
+        lon = np.asarray([-180., 1.5, 3.5])
+        lat = np.asarray([0., 10., 11.])
+        LON, LAT = np.meshgrid(lon, lat)
+
+        with self.assertRaises(ValueError):
+            x._rasterize(LON, LAT, radius=0.5, aggregation='invalid')
+
+        # points across the dateline are aggregated in the same cell
+        res = x._rasterize(LON, LAT, radius=0.5, aggregation='mean')
+        self.assertAlmostEqual(res.data[0, 0], 3.)
+        self.assertAlmostEqual(res.data[1, 1], 2.)
+        # masked values are ignored
+        self.assertTrue(res.data.mask[2, 2])
+
+        res = x._rasterize(LON, LAT, radius=0.5, aggregation='max')
+        self.assertEqual(res.data[0, 0], 4.)
+        self.assertEqual(res.data[1, 1], 3.)
+        res = x._rasterize(LON, LAT, radius=0.5, aggregation='min')
+        self.assertEqual(res.data[1, 1], 1.)
+        res = x._rasterize(LON, LAT, radius=0.5, aggregation='count')
+        self.assertEqual(res.data[1, 1], 2.)
+        self.assertEqual(res.data[2, 2], 0.)
+
+    def test_rasterize_3D(self):
+        x = Data(None, None)
+        x._init_sample_object(ny=1, nx=272)
+        x.lon = np.asarray([2.25, 2.45, 1.8, 3.6])
+        x.lat = np.asarray([11.9, 10.1, 10.2, 11.3])
+        x.data = np.ma.array(np.random.random((5, 4)), mask=np.zeros((5, 4)).astype('bool'))
+        x.data.mask[2, 1] = True
+
+        lon = np.asarray([1.5, 2.5, 3.5])
+        lat = np.asarray([10., 11., 12.])
+        LON, LAT = np.meshgrid(lon, lat)
+
+        res = x._rasterize(LON, LAT, radius=0.5, return_object=True)
+        self.assertEqual(res.data.shape, (5, 3, 3))
+        self.assertTrue(np.all(res.data[:, 0, 0] == x.data[:, 2]))
+        self.assertTrue(np.all(res.data[:, 2, 1] == x.data[:, 0]))
+        self.assertTrue(res.data.mask[2, 0, 1])
+        self.assertFalse(res.data.mask[3, 0, 1])
+
 
 if __name__ == '__main__':
     unittest.main()
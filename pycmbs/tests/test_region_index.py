@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+This file is part of pyCMBS.
+(c) 2012- Alexander Loew
+For COPYING and LICENSE details, please refer to the LICENSE file
+"""
+
+import unittest
+
+from pycmbs.region_index import RegionIndexCache
+from pycmbs.data import Data
+from geoval.region import RegionBboxLatLon, RegionIndex
+import numpy as np
+
+
+class TestRegionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.D = Data(None, None)
+        self.D._init_sample_object(nt=10, ny=19, nx=37, gaps=True)
+        self.R = RegionBboxLatLon(1, -30., 45., -20., 50., label='box')
+
+    def test_cache(self):
+        C = RegionIndexCache(max_entries=2)
+        i1, i2, j1, j2, msk = C.get(self.D.lat, self.D.lon, self.R)
+        ref = (self.D.lat >= -20.) & (self.D.lat <= 50.) & (self.D.lon >= -30.) & (self.D.lon <= 45.)
+        self.assertTrue(np.all(C.get_mask(self.D.lat, self.D.lon, self.R) == ref))
+        self.assertTrue(np.all(ref[i1:i2, j1:j2] == msk))
+        self.assertEqual(ref.sum(), msk.sum())
+        self.assertEqual(C.misses, 1)
+        self.assertEqual(C.hits, 1)
+        with self.assertRaises(ValueError):
+            msk[0, 0] = False
+
+        # region mask and least recently used entries
+        self.R.mask = np.zeros(ref.shape).astype('bool')
+        self.R.mask[i1, j1] = True
+        r = C.get(self.D.lat, self.D.lon, self.R)
+        self.assertEqual(r[0:4], (i1, i1 + 1, j1, j1 + 1))
+        r = C.get(self.D.lat, self.D.lon, self.R, apply_mask=False)
+        self.assertEqual(len(C), 2)
+        self.assertEqual(C.misses, 2)
+        C.get(self.D.lat + 1., self.D.lon, self.R)
+        self.assertEqual(len(C), 2)
+        self.assertEqual(C.misses, 3)
+
+        # hash of the coordinates is calculated once per array
+        k = C.get_key(self.D.lat, self.D.lon, self.R)
+        self.assertTrue(id(self.D.lat) in C._array_keys)
+        self.assertEqual(C.get_key(self.D.lat, self.D.lon, self.R), k)
+        self.assertEqual(C.get_key(self.D.lat.copy(), self.D.lon, self.R), k)
+        self.assertNotEqual(C.get_key(self.D.lat * 2., self.D.lon, self.R), k)
+        lat = self.D.lat * 1.
+        C.get_key(lat, self.D.lon, self.R)
+        n = len(C._array_keys)
+        del lat
+        self.assertEqual(len(C._array_keys), n - 1)
+
+        # region outside of the grid
+        R = RegionBboxLatLon(2, 10., 20., 91., 95., label='outside')
+        self.assertEqual(C.get(self.D.lat, self.D.lon, R)[4].shape, (0, 0))
+
+    def test_get_aoi_lat_lon(self):
+        n = self.D.data.count()
+        d = self.D.get_aoi_lat_lon(self.R, crop=True)
+        self.assertTrue(np.all(d.lat >= -20.) & np.all(d.lat <= 50.))
+        self.assertEqual(d.data.shape[1:], d.lat.shape)
+        self.assertEqual(self.D.data.count(), n)  # original not changed
+
+        ref = self.D.copy()
+        ref.get_aoi_lat_lon(self.R)
+        self.assertEqual(d.data.count(), ref.data.count())
+        self.assertAlmostEqual(d.data.sum(), ref.data.sum(), 10)
+
+        # read-only view
+        v = self.D.get_aoi_lat_lon(self.R, crop=True, copy=False)
+        self.assertTrue(np.all(v.data == d.data))
+        with self.assertRaises(ValueError):
+            v.data[0, 0, 0] = 1.
+        d.data[0, 0, 0] = 1.
+
+        R = RegionBboxLatLon(2, 10., 20., 91., 95., label='outside')
+        with self.assertRaises(ValueError):
+            self.D.get_aoi_lat_lon(R, crop=True)
+
+    def test_get_aoi(self):
+        R = RegionIndex(3, 2, 5, 4, 10, label='idx')
+        d = self.D.get_aoi(R)
+        self.assertEqual(d.shape, (10, 6, 3))
+        self.assertTrue(np.all(d.data == self.D.data[:, 4:10, 2:5]))
+        self.assertTrue(np.all(d.lat == self.D.lat[4:10, 2:5]))
+        d.data[0, 0, 0] = -1.
+        self.assertNotEqual(self.D.data.data[0, 4, 2], -1.)
+
+        self.D.data.mask[0, 4, 2] = False
+        v = self.D.get_aoi(R, copy=False)
+        with self.assertRaises(ValueError):
+            v.data[0, 0, 0] = 1.
+        v.data.mask[0, 0, 0] = True
+        self.assertFalse(self.D.data.mask[0, 4, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
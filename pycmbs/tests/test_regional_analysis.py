@@ -11,6 +11,7 @@ import unittest
 from pycmbs.data import *
 from pycmbs.diagnostic import RegionalAnalysis
 import scipy as sc
+from scipy import stats
 import numpy as np
 
 import tempfile
@@ -281,6 +282,47 @@ class TestData(TestCase):
 
 
 
+    def test_regional_statistics(self):
+        np.random.seed(42)
+        nt, ny, nx = 40, 3, 5
+        m = np.asarray([[1, 1, 2, 2, 3], [1, 4, 2, 2, 3], [4, 4, 4, 2, 3]]).astype('float')
+        reg = Data(None, None)
+        reg.data = m
+
+        x = self.D.copy()
+        y = self.D.copy()
+        for d in [x, y]:
+            tmp = np.random.random((nt, ny, nx))
+            d.data = np.ma.array(tmp, mask=tmp > 0.9)
+            d.cell_area = np.random.random((ny, nx)) + 0.5
+            d.time = d.time[0:nt]
+        x.data.mask[:, 0, 0] = True
+
+        REGSTAT = RegionalAnalysis(x, y, reg)
+        REGSTAT.calculate()
+        xstat = x.condstat(reg)
+        res = REGSTAT.statistics['corrstat']
+        self.assertEqual(sorted(REGSTAT.statistics['xstat'].keys()), sorted(xstat.keys()))
+        for v in [1, 2, 3, 4]:
+            for k in ['mean', 'std', 'sum', 'min', 'max']:
+                # timesteps without valid data in a region are NaN
+                a = np.asarray(REGSTAT.statistics['xstat'][v][k])
+                b = np.asarray(xstat[v][k])
+                self.assertTrue(np.all(np.isnan(a) == np.isnan(b)))
+                self.assertTrue(np.all(np.abs(a - b)[~np.isnan(b)] < 1.E-10))
+
+            # reference: analysis of data masked for the region
+            xr = REGSTAT._get_masked_data(x, v)
+            yr = REGSTAT._get_masked_data(y, v)
+            slope, intercept, r, p, se = stats.mstats.linregress(xr.data.flatten(), yr.data.flatten())
+            self.assertAlmostEqual(res['analysis_B'][v]['slope'], slope, 10)
+            self.assertAlmostEqual(res['analysis_B'][v]['intercept'], intercept, 10)
+            self.assertAlmostEqual(res['analysis_B'][v]['correlation'], r, 10)
+            self.assertAlmostEqual(res['analysis_B'][v]['pvalue'], p, 10)
+            slope, intercept, r, p, se = stats.mstats.linregress(xr.fldmean(return_data=False), yr.fldmean(return_data=False))
+            self.assertAlmostEqual(res['analysis_C'][v]['slope'], slope, 10)
+            self.assertAlmostEqual(res['analysis_C'][v]['correlation'], r, 10)
+
     def test_invalid_correlation(self):
         x = Data(None, None)
         y = Data(None, None)
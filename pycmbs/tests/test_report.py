@@ -105,6 +105,27 @@ class TestData(unittest.TestCase):
     def test_input(self):
         self.R.input('testname')
 
+    def test_report_fragment(self):
+        F = Report('fragment', 'myfragment', 'Alex Loew', outdir=self._tmpdir + os.sep,
+                   fragment=True, figure_prefix='var_', autocompile=False)
+        F.section('Fragment section')
+        f = plt.figure()
+        F.figure(f, caption='My figure caption')
+        F.close()
+        self.assertTrue(os.path.exists(self._tmpdir + os.sep + 'fig_var_00001.png'))
+        s = open(F.filename).read()
+        self.assertFalse('documentclass' in s)
+        self.assertFalse('end{document}' in s)
+
+        self.R.include_fragment(F.filename)
+        self.R.file.close()
+        s = open(self.R.filename).read()
+        self.assertTrue('Fragment section' in s)
+        self.assertTrue('fig_var_00001.png' in s)
+        self.assertTrue('fig:var_1' in s)
+        with self.assertRaises(ValueError):
+            self.R.include_fragment(self._tmpdir + os.sep + 'nofile.tex')
+
 
 
 
@@ -144,6 +144,45 @@ class TestLomb(TestCase):
         #~ _test_ratio(Br[199], np.pi*0.5, thres=0.1)
 
 
+    def test_lomb_field(self):
+        # the periodogram of a field needs to be consistent with
+        # the results for single timeseries
+        D = Data(None, None)
+        D._init_sample_object(nt=len(self.t), ny=3, nx=4)
+        D.time = self.t * 1.
+        for i in xrange(3):
+            for j in xrange(4):
+                D.data[:, i, j] += (i + 1.) * np.cos(2. * np.pi * self.t / 100. + 0.2 * j)
+        D.data.mask[:, 0, 0] = True
+
+        P = np.asarray([50., 100., 150.])
+        A, B, R, PV = D.lomb_scargle_periodogram(P, return_object=False)
+        self.assertTrue(np.all(np.isnan(A[:, 0, 0])))
+        for i, j in [(0, 1), (2, 3)]:
+            Ar, Br, Rr, Pr = lomb_scargle_periodogram(self.t, P, D.data[:, i, j].data)
+            self.assertTrue(np.all(np.abs(A[:, i, j] - np.abs(Ar)) < 1.E-4))
+            # the amplitude is always positive, therefore the phase
+            # differs by pi where the reference amplitude is negative
+            d = np.mod(B[:, i, j] - Br, np.pi)
+            self.assertTrue(np.all(np.minimum(d, np.pi - d) < 1.E-4))
+            for k in xrange(len(P)):
+                w = 2. * np.pi / P[k]
+                y = A[k, i, j] * np.cos(w * self.t + B[k, i, j])
+                yr = Ar[k] * np.cos(w * self.t + Br[k])
+                self.assertTrue(np.all(np.abs(y - yr) < 1.E-4))
+            self.assertTrue(np.all(np.abs(R[:, i, j] - Rr) < 1.E-4))
+            self.assertTrue(np.all(np.abs(PV[:, i, j] - Pr) < 1.E-4))
+        self.assertAlmostEqual(A[1, 2, 3], 3., delta=0.1)
+        self.assertAlmostEqual(B[1, 2, 3], 0.6, delta=0.1)
+
+        # tiles processed in parallel give the same results (up to
+        # rounding differences of the BLAS for different block shapes)
+        A1, B1, R1, PV1 = D.lomb_scargle_periodogram(P, return_object=False, n_jobs=2, blocksize=5)
+        for x, y in [(A, A1), (B, B1), (R, R1), (PV, PV1)]:
+            m = ~np.isnan(x)
+            self.assertTrue(np.all(m == ~np.isnan(y)))
+            self.assertTrue(np.allclose(x[m], y[m], rtol=1.E-12, atol=0.))
+
     #~ def test_lomb_normalize(self):
         # LOMB only works with zero mean data !!!!
         # normalization should be therefore implemented, but
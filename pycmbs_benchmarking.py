@@ -16,6 +16,8 @@ import sys
 import os
 import pylab
 import pickle
+import traceback
+from multiprocessing import Pool
 
 from pycmbs.plots import GlecklerPlot, GlobalMeanPlot
 from pycmbs.benchmarking.report import Report
@@ -28,6 +30,8 @@ from pycmbs.benchmarking.models import JSBACH_BOT  # , JSBACH_RAW
 from pycmbs.benchmarking.models import JSBACH_RAW2, CMIP3Data, JSBACH_SPECIAL
 from pycmbs.benchmarking.models import MeanModel
 from pycmbs.benchmarking.utils import get_temporary_directory
+from pycmbs.benchmarking.cache import get_preprocessing_cache
+from pycmbs.utils import print_log, WARNING
 
 
 ########################################################################
@@ -84,18 +88,432 @@ def create_dummy_configuration():
     os.system('rm -rf ' + odir + os.sep + '.svn')
 
 
+def create_model(CF, i, varmethods, start_time, stop_time, shift_lon):
+    """
+    create the Model instance for the i-th model of the
+    configuration; no data is read yet
+
+    Parameters
+    ----------
+    CF : ConfigFile
+        configuration
+    i : int
+        index of the model in the configuration
+    """
+    # assign model information from configuration
+    data_dir = CF.dirs[i]
+    model = CF.models[i]
+    experiment = CF.experiments[i]
+    dtype = CF.dtypes[i]
+
+    if dtype.upper() == 'CMIP5':
+        themodel = CMIP5Data(data_dir, model, experiment, varmethods,
+                             intervals=CF.intervals, lat_name='lat',
+                             lon_name='lon', label=model,
+                             start_time=start_time,
+                             stop_time=stop_time,
+                             shift_lon=shift_lon)
+    elif dtype.upper() == 'CMIP5RAW':
+        themodel = CMIP5RAWData(data_dir, model, experiment, varmethods,
+                                intervals=CF.intervals, lat_name='lat',
+                                lon_name='lon', label=model,
+                                start_time=start_time,
+                                stop_time=stop_time,
+                                shift_lon=shift_lon)
+    elif 'CMIP5RAWSINGLE' in dtype.upper():
+        themodel = CMIP5RAW_SINGLE(data_dir, model, experiment, varmethods,
+                                   intervals=CF.intervals, lat_name='lat',
+                                   lon_name='lon', label=model,
+                                   start_time=start_time,
+                                   stop_time=stop_time,
+                                   shift_lon=shift_lon)
+
+    elif dtype.upper() == 'JSBACH_BOT':
+        themodel = JSBACH_BOT(data_dir, varmethods, experiment,
+                              intervals=CF.intervals,
+                              start_time=start_time,
+                              stop_time=stop_time,
+                              name=model, shift_lon=shift_lon)
+    elif dtype.upper() == 'JSBACH_RAW':
+        themodel = JSBACH_RAW(data_dir, varmethods, experiment,
+                              intervals=CF.intervals,
+                              name=model,
+                              shift_lon=shift_lon,
+                              start_time=start_time,
+                              stop_time=stop_time
+                              )
+    elif dtype.upper() == 'JSBACH_RAW2':
+        themodel = JSBACH_RAW2(data_dir, varmethods, experiment,
+                               intervals=CF.intervals,
+                               start_time=start_time,
+                               stop_time=stop_time,
+                               name=model, shift_lon=shift_lon)  # ,
+                               # model_dict=model_dict)
+    elif dtype.upper() == 'JSBACH_SPECIAL':
+        themodel = JSBACH_SPECIAL(data_dir, varmethods, experiment,
+                                  intervals=CF.intervals,
+                                  start_time=start_time,
+                                  stop_time=stop_time,
+                                  name=model, shift_lon=shift_lon)  # ,
+                               # model_dict=model_dict)
+    elif dtype.upper() == 'CMIP3':
+        themodel = CMIP3Data(data_dir, model, experiment, varmethods,
+                             intervals=CF.intervals, lat_name='lat',
+                             lon_name='lon', label=model,
+                             start_time=start_time,
+                             stop_time=stop_time,
+                             shift_lon=shift_lon)
+    else:
+        raise ValueError('Invalid model type: %s' % dtype)
+
+    return themodel
+
+
+def read_model(CF, i, plot_options, start_time, stop_time, shift_lon):
+    """
+    create the i-th model of the configuration and read its data
+
+    Returns
+    -------
+    themodel : Model
+    """
+    varmethods = CF.get_methods4variables(CF.variables)
+    themodel = create_model(CF, i, varmethods, start_time, stop_time,
+                            shift_lon)
+
+    # options that specify regrid options etc.
+    themodel._global_configuration = CF
+    themodel.plot_options = plot_options
+    themodel.get_data()
+    return themodel
+
+
+def _read_model_worker(args):
+    """
+    read the data of a single model in a worker process
+
+    The configuration is parsed again within the worker, as the
+    ConfigFile can not be pickled. All output of the worker is
+    written to a separate logfile. Errors are caught to not affect
+    the processing of the other models.
+
+    Parameters
+    ----------
+    args : tuple
+        (configuration filename, index of model, start_time,
+        stop_time, shift_lon, logfile)
+
+    Returns
+    -------
+    i : int
+        index of the model
+    themodel : Model
+        model with the data read; None in case of errors
+    err : str
+        traceback in case of errors; else None
+    cstat : tuple
+        number of hits and misses of the preprocessing cache within
+        the worker
+    """
+    cfg_file, i, start_time, stop_time, shift_lon, logfile = args
+
+    cache = get_preprocessing_cache()
+    hits, misses = cache.hits, cache.misses
+    stdout = sys.stdout
+    stderr = sys.stderr
+    log = open(logfile, 'w')
+    sys.stdout = sys.stderr = log
+    try:
+        CF = config.ConfigFile(cfg_file)
+        PCFG = config.PlotOptions()
+        PCFG.read(CF)
+        themodel = read_model(CF, i, PCFG, start_time, stop_time, shift_lon)
+        # configuration objects are not transferred back to the
+        # main process; they are set there again
+        themodel._global_configuration = None
+        themodel.plot_options = None
+        err = None
+    except:
+        themodel = None
+        err = traceback.format_exc()
+        log.write(err)
+    finally:
+        sys.stdout = stdout
+        sys.stderr = stderr
+        log.close()
+    cache = get_preprocessing_cache()
+    return i, themodel, err, (cache.hits - hits, cache.misses - misses)
+
+
+def read_models(CF, cfg_file, plot_options, start_time, stop_time,
+                shift_lon, jobs=1, logdir=None):
+    """
+    read the data for all models of the configuration
+
+    Parameters
+    ----------
+    jobs : int
+        number of processes used to read the models in parallel.
+        For jobs > 1, the output of each model is written to a
+        logfile in logdir and models which can not be read are
+        skipped with a warning
+    logdir : str
+        directory for logfiles of the individual models
+
+    Returns
+    -------
+    list of Model objects in the order of the configuration
+    """
+    nmodels = len(CF.models)
+    if (jobs <= 1) or (nmodels < 2):
+        return [read_model(CF, i, plot_options, start_time, stop_time,
+                           shift_lon) for i in range(nmodels)]
+
+    if logdir is None:
+        logdir = get_temporary_directory()
+    if logdir[-1] != os.sep:
+        logdir += os.sep
+    if not os.path.exists(logdir):
+        os.makedirs(logdir)
+
+    tasks = []
+    for i in range(nmodels):
+        logfile = logdir + 'read_model_' + str(i + 1).zfill(4) + '_' \
+            + CF.models[i].replace(os.sep, '_') + '.log'
+        tasks.append((cfg_file, i, start_time, stop_time, shift_lon,
+                      logfile))
+        print('Reading model %s (%s); logfile: %s'
+              % (CF.models[i], CF.experiments[i], logfile))
+
+    pool = Pool(processes=min(jobs, nmodels))
+    try:
+        results = pool.map(_read_model_worker, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    # results are in the order of the configuration
+    res = []
+    for i, themodel, err, cstat in results:
+        get_preprocessing_cache().add_statistics(*cstat)
+        if err is not None:
+            print_log(WARNING, 'Model %s could not be read and is skipped:\n%s'
+                      % (CF.models[i], err))
+            continue
+        themodel._global_configuration = CF
+        themodel.plot_options = plot_options
+        res.append(themodel)
+    if len(res) == 0:
+        raise ValueError('No model could be read!')
+    return res
+
+
+# models and plot options used by the analysis worker processes. They
+# are inherited by the workers when the process pool is forked and thus
+# do not need to be pickled for each task
+_analysis_state = None
+
+
+def run_analysis(script, model_list, GP, report, interval, plot_options,
+                 shift_lon, use_basemap):
+    """
+    run the analysis script for a single variable
+
+    Parameters
+    ----------
+    script : str
+        name of the analysis script (function in analysis module)
+    model_list : list
+        list of Model objects
+    GP : GlecklerPlot
+        Gleckler plot to register the results
+    report : Report
+        report to write the results to
+    """
+    getattr(analysis, script)(model_list, GP=GP, shift_lon=shift_lon,
+                              use_basemap=use_basemap, report=report,
+                              interval=interval, plot_options=plot_options)
+
+
+def _analysis_worker(args):
+    """
+    run the analysis for a single variable in a worker process
+
+    The results are written to a separate Gleckler plot and to a
+    report fragment. Figures are written with a prefix for the
+    variable to not interfere with the figures of other processes.
+
+    Parameters
+    ----------
+    args : tuple
+        (variable, script, interval, shift_lon, use_basemap,
+        outdir, format, dpi, logfile)
+
+    Returns
+    -------
+    variable : str
+        name of variable
+    results : dict
+        results of the Gleckler plot (see GlecklerPlot.get_results())
+    fragment : str
+        filename of the report fragment
+    err : str
+        traceback in case of errors; else None
+    cstat : tuple
+        number of hits and misses of the preprocessing cache within
+        the worker
+    """
+    variable, script, interval, shift_lon, use_basemap, outdir, fmt, \
+        dpi, logfile = args
+
+    cache = get_preprocessing_cache()
+    hits, misses = cache.hits, cache.misses
+    stdout = sys.stdout
+    stderr = sys.stderr
+    log = open(logfile, 'w')
+    sys.stdout = sys.stderr = log
+    results = None
+    fragment = None
+    try:
+        GP = GlecklerPlot()
+        GP.add_variable(variable)
+        rep = Report('fragment_' + variable, variable, '', format=fmt,
+                     outdir=outdir, dpi=dpi, logofile=None,
+                     autocompile=False, fragment=True,
+                     figure_prefix=variable + '_')
+        fragment = rep.filename
+        run_analysis(script, _analysis_state['models'], GP, rep, interval,
+                     _analysis_state['plot_options'], shift_lon,
+                     use_basemap)
+        rep.close()
+        results = GP.get_results()
+        plt.close('all')
+        err = None
+    except:
+        err = traceback.format_exc()
+        log.write(err)
+    finally:
+        sys.stdout = stdout
+        sys.stderr = stderr
+        log.close()
+    cache = get_preprocessing_cache()
+    return variable, results, fragment, err, (cache.hits - hits, cache.misses - misses)
+
+
+def run_analyses(tasks, model_list, GP, report, intervals, plot_options,
+                 shift_lon, use_basemap, jobs=1, logdir=None):
+    """
+    run the analysis scripts for all variables
+
+    Parameters
+    ----------
+    tasks : list
+        list of tuples (variable, script)
+    model_list : list
+        list of Model objects
+    GP : GlecklerPlot
+        Gleckler plot where all results are registered
+    report : Report
+        report where all results are written to
+    intervals : dict
+        temporal interval for each variable
+    jobs : int
+        number of processes. For jobs > 1, the variables are analyzed
+        in parallel. The results are merged into the Gleckler plot and
+        the report in the order of the tasks. The output of each
+        variable is written to a logfile in logdir
+    logdir : str
+        directory for logfiles
+    """
+    if (jobs <= 1) or (len(tasks) < 2):
+        for variable, script in tasks:
+            print 'Doing analysis for variable ... ', variable
+            print '   ... ', script
+            run_analysis(script, model_list, GP, report, intervals[variable],
+                         plot_options, shift_lon, use_basemap)
+        return
+
+    if logdir is None:
+        logdir = get_temporary_directory()
+    if logdir[-1] != os.sep:
+        logdir += os.sep
+    if not os.path.exists(logdir):
+        os.makedirs(logdir)
+
+    wtasks = []
+    for variable, script in tasks:
+        logfile = logdir + 'analysis_' + variable + '.log'
+        wtasks.append((variable, script, intervals[variable], shift_lon,
+                       use_basemap, report.outdir, report.format,
+                       report.dpi, logfile))
+        print('Doing analysis for variable %s (%s); logfile: %s'
+              % (variable, script, logfile))
+
+    global _analysis_state
+    _analysis_state = {'models': model_list, 'plot_options': plot_options}
+    pool = Pool(processes=min(jobs, len(tasks)), maxtasksperchild=1)
+    try:
+        results = pool.map(_analysis_worker, wtasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        _analysis_state = None
+
+    # merge results in the order of the tasks
+    for variable, res, fragment, err, cstat in results:
+        get_preprocessing_cache().add_statistics(*cstat)
+        if err is not None:
+            print_log(WARNING, 'Analysis for variable %s failed:\n%s'
+                      % (variable, err))
+        else:
+            GP.merge(res)
+            report.include_fragment(fragment)
+        if (fragment is not None) and os.path.exists(fragment):
+            os.remove(fragment)
+
+
+def get_jobs(args):
+    """
+    extract the option '--jobs N' (or '-j N') from the
+    command line arguments
+
+    Parameters
+    ----------
+    args : list
+        command line arguments; the option is removed from the list
+
+    Returns
+    -------
+    jobs : int
+        number of processes; default is 1
+    """
+    jobs = 1
+    for opt in ['--jobs', '-j']:
+        if opt in args:
+            i = args.index(opt)
+            if i + 1 >= len(args):
+                raise ValueError('Number of jobs needs to be specified!')
+            jobs = int(args[i + 1])
+            if jobs < 1:
+                raise ValueError('Invalid number of jobs: %i' % jobs)
+            del args[i:i + 2]
+    return jobs
+
+
 def main():
     plt.close('all')
-    if len(sys.argv) > 1:
-        if len(sys.argv) == 2:
+    args = sys.argv[1:]
+    jobs = get_jobs(args)
+    if len(args) > 0:
+        if len(args) == 1:
             # a single argument was provides as option
-            if sys.argv[1] == 'init':
+            if args[0] == 'init':
                 # copy INI files and a template configuration file
                 # to current directory
                 create_dummy_configuration()
                 sys.exit()
             else:
-                file = sys.argv[1]  # name of config file
+                file = args[0]  # name of config file
                 if not os.path.exists(file):
                     raise ValueError('Configuration file can not be \
                                       found: %s' % file)
@@ -109,6 +527,7 @@ def main():
         print('*******************************************')
         print ''
         print 'please specify a configuration filename as argument'
+        print 'usage: pycmbs_benchmarking.py [--jobs N] <configuration file>'
         sys.exit()
 
     ####################################################################
@@ -179,81 +598,9 @@ def main():
     model_cnt = 1
     proc_models = []
 
-    for i in range(len(CF.models)):
-        # assign model information from configuration
-        data_dir = CF.dirs[i]
-        model = CF.models[i]
-        experiment = CF.experiments[i]
-
-        # create model object and read data
-        # results are stored in individual variables namex modelXXXXX
-        if CF.dtypes[i].upper() == 'CMIP5':
-            themodel = CMIP5Data(data_dir, model, experiment, varmethods,
-                                 intervals=CF.intervals, lat_name='lat',
-                                 lon_name='lon', label=model,
-                                 start_time=start_time,
-                                 stop_time=stop_time,
-                                 shift_lon=shift_lon)
-        elif CF.dtypes[i].upper() == 'CMIP5RAW':
-            themodel = CMIP5RAWData(data_dir, model, experiment, varmethods,
-                                    intervals=CF.intervals, lat_name='lat',
-                                    lon_name='lon', label=model,
-                                    start_time=start_time,
-                                    stop_time=stop_time,
-                                    shift_lon=shift_lon)
-        elif 'CMIP5RAWSINGLE' in CF.dtypes[i].upper():
-            themodel = CMIP5RAW_SINGLE(data_dir, model, experiment, varmethods,
-                                       intervals=CF.intervals, lat_name='lat',
-                                       lon_name='lon', label=model,
-                                       start_time=start_time,
-                                       stop_time=stop_time,
-                                       shift_lon=shift_lon)
-
-        elif CF.dtypes[i].upper() == 'JSBACH_BOT':
-            themodel = JSBACH_BOT(data_dir, varmethods, experiment,
-                                  intervals=CF.intervals,
-                                  start_time=start_time,
-                                  stop_time=stop_time,
-                                  name=model, shift_lon=shift_lon)
-        elif CF.dtypes[i].upper() == 'JSBACH_RAW':
-            themodel = JSBACH_RAW(data_dir, varmethods, experiment,
-                                  intervals=CF.intervals,
-                                  name=model,
-                                  shift_lon=shift_lon,
-                                  start_time=start_time,
-                                  stop_time=stop_time
-                                  )
-        elif CF.dtypes[i].upper() == 'JSBACH_RAW2':
-            themodel = JSBACH_RAW2(data_dir, varmethods, experiment,
-                                   intervals=CF.intervals,
-                                   start_time=start_time,
-                                   stop_time=stop_time,
-                                   name=model, shift_lon=shift_lon)  # ,
-                                   # model_dict=model_dict)
-        elif CF.dtypes[i].upper() == 'JSBACH_SPECIAL':
-            themodel = JSBACH_SPECIAL(data_dir, varmethods, experiment,
-                                      intervals=CF.intervals,
-                                      start_time=start_time,
-                                      stop_time=stop_time,
-                                      name=model, shift_lon=shift_lon)  # ,
-                                   # model_dict=model_dict)
-        elif CF.dtypes[i].upper() == 'CMIP3':
-            themodel = CMIP3Data(data_dir, model, experiment, varmethods,
-                                 intervals=CF.intervals, lat_name='lat',
-                                 lon_name='lon', label=model,
-                                 start_time=start_time,
-                                 stop_time=stop_time,
-                                 shift_lon=shift_lon)
-        else:
-            raise ValueError('Invalid model type: %s' % CF.dtypes[i])
-
-        # read data for current model
-
-        # options that specify regrid options etc.
-        themodel._global_configuration = CF
-        themodel.plot_options = plot_options
-        themodel.get_data()
-
+    for themodel in read_models(CF, file, plot_options, start_time,
+                                stop_time, shift_lon, jobs=jobs,
+                                logdir=outdir + 'logs'):
         # copy current model to a variable named modelXXXX
         cmd = 'model' + str(model_cnt).zfill(4) + ' = ' \
             + 'themodel.copy(); del themodel'
@@ -321,6 +668,7 @@ def main():
     ########################################################################
     ########################################################################
     skeys = scripts.keys()
+    analysis_tasks = []
     for variable in variables:
 
         # register current variable in Gleckler Plot
@@ -329,17 +677,13 @@ def main():
         # call analysis scripts for each variable
         for k in range(len(skeys)):
             if variable == skeys[k]:
+                analysis_tasks.append((variable, scripts[variable]))
 
-                print 'Doing analysis for variable ... ', variable
-                print '   ... ', scripts[variable]
-                # model list is reformatted so it can be evaluated properly
-                model_list = str(proc_models).replace("'", "")
-                cmd = 'analysis.' + scripts[variable] + '(' + model_list \
-                    + ',GP=global_gleckler,shift_lon=shift_lon, \
-                        use_basemap=use_basemap,report=rep,\
-                        interval=CF.intervals[variable],\
-                        plot_options=PCFG)'
-                eval(cmd)
+    model_list = [eval(m) for m in proc_models]
+    run_analyses(analysis_tasks, model_list, global_gleckler, rep,
+                 CF.intervals, PCFG, shift_lon, use_basemap, jobs=jobs,
+                 logdir=outdir + 'logs')
+    del model_list
 
     ########################################################################
     # GLECKLER PLOT finalization ...
@@ -443,6 +787,10 @@ def main():
     plt.close('all')
     rep.close()
 
+    cstat = get_preprocessing_cache().get_statistics()
+    print('Preprocessing cache: %i hits, %i misses, %i entries (%.1f MB)'
+          % (cstat['hits'], cstat['misses'], cstat['entries'], cstat['size']))
+
     print('##########################################')
     print('# BENCHMARKING FINIHSED!                 #')
     print('##########################################')
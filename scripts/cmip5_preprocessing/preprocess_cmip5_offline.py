@@ -20,6 +20,7 @@ def main():
     from pycmbs.benchmarking import preprocessor
     import datetime as dt
     import sys
+    import multiprocessing
 
     if len(sys.argv) == 3:
         the_experiment = sys.argv[1]
@@ -40,12 +41,15 @@ def main():
     model_list = CP.get_all_models()
 
     # perform for each institute and model the calculation of ensemble means etc.
+    # the models are processed in parallel
+    preprocessors = []
     for institute in model_list.keys():
         for model in model_list[institute]:
             output_file = output_dir + the_variable + '_Amon_' + model + '_' + the_experiment + '_ensmean.nc'
             E = preprocessor.CMIP5Preprocessor(data_dir, output_file, the_variable, model, the_experiment, institute=institute)
             E.get_ensemble_files()
-            E.ensemble_mean(delete=False, start_time=dt.datetime(1979,1,1), stop_time=dt.datetime(2012,12,31))
+            preprocessors.append(E)
+    preprocessor.ensemble_statistics(preprocessors, n_jobs=multiprocessing.cpu_count(), delete=False, start_time=dt.datetime(1979,1,1), stop_time=dt.datetime(2012,12,31))
 
 if __name__ == '__main__':
     main()